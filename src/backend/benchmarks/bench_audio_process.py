@@ -0,0 +1,49 @@
+"""
+Benchmark of the batched feature engine (audio.extract_features) against the
+per-window pipeline it replaces, on long synthetic MIDI files.
+
+Run from src/:
+    python -m backend.benchmarks.bench_audio_process
+"""
+import time
+
+import numpy as np
+
+from backend.functions import audio
+from backend.benchmarks.corpus import make_midi
+
+
+def legacy_process(filtered, window_size=40, hop_size=8):
+    windows = audio.sliding_window(filtered, window_size=window_size, hop_size=hop_size)
+    normalized_windows = [audio.normalize_pitches(window) for window in windows]
+    hists = [audio.convert_window_to_histograms(window) for window in normalized_windows]
+    return [audio.shrink_histograms(hist) for hist in hists]
+
+
+def best_of(func, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    print(f"{'notes':>8} {'windows':>8} {'legacy (s)':>12} {'batched (s)':>12} {'speedup':>8}")
+    for n_notes in (1_000, 5_000, 20_000, 50_000):
+        pitch_array, _, _ = audio.midi_to_pitch_array_with_tempo(make_midi(n_notes, seed=n_notes))
+        filtered = audio.filter_pitch_array(pitch_array)
+
+        legacy_time, legacy = best_of(lambda: legacy_process(filtered), repeat=1)
+        batched_time, batched = best_of(lambda: audio.extract_features(filtered))
+
+        for key in audio.FEATURE_TYPES:
+            expected = np.array([window[key] for window in legacy], dtype=np.float64).reshape(batched[key].shape)
+            assert np.array_equal(expected, batched[key]), f"{key} mismatch for {n_notes} notes"
+
+        print(f"{n_notes:>8} {len(legacy):>8} {legacy_time:>12.4f} {batched_time:>12.4f} {legacy_time / batched_time:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
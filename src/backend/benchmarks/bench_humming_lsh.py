@@ -0,0 +1,80 @@
+"""
+Recall-vs-latency report of the LSH candidate index against exhaustive humming search.
+
+Tracks are random-walk melodies; each query is a noisy excerpt of one track. Recall is the
+share of the exhaustive top-k that the LSH-backed search also returns; top-1 is the share
+of queries whose exhaustive best track is still returned.
+
+Run from src/:
+    python -m backend.benchmarks.bench_humming_lsh
+"""
+import time
+
+import numpy as np
+
+from backend.functions import audio
+from backend.functions.humming_index import HummingIndex
+from backend.functions.lsh import WindowLSH
+
+
+def random_walk(rng, n_notes):
+    steps = rng.integers(-4, 5, n_notes)
+    return np.clip(60 + np.cumsum(steps), 21, 108)
+
+
+def noisy_excerpt(rng, melody, n_notes, noise=0.1):
+    start = int(rng.integers(0, max(1, len(melody) - n_notes)))
+    excerpt = melody[start:start + n_notes].copy()
+    flips = rng.random(len(excerpt)) < noise
+    excerpt[flips] += rng.integers(-2, 3, int(flips.sum()))
+    return excerpt
+
+
+def build_corpus(n_tracks, seed=0, track_notes=(200, 800)):
+    rng = np.random.default_rng(seed)
+    melodies = [random_walk(rng, int(rng.integers(*track_notes))) for _ in range(n_tracks)]
+    features = [audio.normalize_features(audio.extract_features(melody)) for melody in melodies]
+    return rng, melodies, features
+
+
+def make_index(features, lsh=None):
+    index = HummingIndex(lsh=lsh)
+    for position, windows in enumerate(features):
+        index.add_track({'id': position, 'name': str(position), 'image_url': '', 'music_url': '',
+                         'image_idx': position, 'playlist': {'id': 0, 'name': ''}}, windows)
+    return index
+
+
+def timed_search(index, queries, top_k):
+    results = []
+    start = time.perf_counter()
+    for query in queries:
+        results.append([item['track_idx'] for item in index.search(query, top_k)])
+    return results, (time.perf_counter() - start) / len(queries)
+
+
+def main(n_tracks=2000, n_queries=50, top_k=10):
+    rng, melodies, features = build_corpus(n_tracks)
+    queries = []
+    for _ in range(n_queries):
+        melody = melodies[int(rng.integers(0, n_tracks))]
+        queries.append(audio.normalize_features(audio.extract_features(noisy_excerpt(rng, melody, 120))))
+
+    exhaustive, exhaustive_latency = timed_search(make_index(features), queries, top_k)
+    print(f"{n_tracks} tracks, {n_queries} queries, top_k={top_k}")
+    print(f"exhaustive: {exhaustive_latency * 1000:.2f} ms/query")
+    print(f"{'tables':>6} {'bits':>5} {'max_cand':>8} {'candidates':>10} {'recall':>7} {'top-1':>6} "
+          f"{'ms/query':>9} {'speedup':>8}")
+    for n_tables, n_bits, max_candidates in [(16, 12, None), (16, 12, 1000), (32, 16, 500),
+                                             (32, 16, 200), (64, 20, 200), (64, 20, 50)]:
+        index = make_index(features, WindowLSH(n_tables, n_bits, max_candidates=max_candidates))
+        approximate, latency = timed_search(index, queries, top_k)
+        recall = np.mean([len(set(a) & set(e)) / len(e) for a, e in zip(approximate, exhaustive)])
+        top_1 = np.mean([e[0] in a for a, e in zip(approximate, exhaustive)])
+        candidates = np.mean([len(index.lsh.candidates(query)) for query in queries])
+        print(f"{n_tables:>6} {n_bits:>5} {str(max_candidates):>8} {candidates:>10.0f} {recall:>7.3f} {top_1:>6.2f} "
+              f"{latency * 1000:>9.2f} {exhaustive_latency / latency:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
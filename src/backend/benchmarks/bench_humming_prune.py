@@ -0,0 +1,59 @@
+"""
+Benchmark of exact humming search with upper-bound pruning (HummingIndex(prune=True))
+against exhaustive scoring: results must be identical, and the table shows how many
+tracks the bounds let the search skip and what the bound pass costs.
+
+Run from src/:
+    python -m backend.benchmarks.bench_humming_prune
+"""
+import time
+
+import numpy as np
+
+from backend.functions import audio
+from backend.functions.humming_index import HummingIndex, fit_bound_basis
+from backend.benchmarks.bench_humming_lsh import build_corpus, noisy_excerpt
+
+
+def make_index(features, prune, bound_rank=64):
+    index = HummingIndex(prune=prune, bound_rank=bound_rank)
+    if prune:
+        # as HummingIndex.load does, fit the bound basis on a sample of the corpus
+        index.bound_basis = fit_bound_basis(np.concatenate(features[::4]), bound_rank)
+    for position, windows in enumerate(features):
+        index.add_track({'id': position, 'name': str(position), 'image_url': '', 'music_url': '',
+                         'image_idx': position, 'playlist': {'id': 0, 'name': ''}}, windows)
+    return index
+
+
+def timed_search(index, queries, top_k):
+    results = []
+    start = time.perf_counter()
+    for query in queries:
+        results.append(index.search(query, top_k))
+    return results, (time.perf_counter() - start) / len(queries)
+
+
+def main(n_tracks=2000, n_queries=30, query_notes=(60, 120, 200)):
+    rng, melodies, features = build_corpus(n_tracks)
+    queries = []
+    for i in range(n_queries):
+        melody = melodies[int(rng.integers(0, n_tracks))]
+        queries.append(audio.normalize_features(audio.extract_features(
+            noisy_excerpt(rng, melody, query_notes[i % len(query_notes)]))))
+
+    exhaustive_index = make_index(features, prune=False)
+    print(f"{n_tracks} tracks, {n_queries} queries")
+    print(f"{'top_k':>5} {'rank':>5} {'pruned':>7} {'exhaustive ms':>14} {'pruned ms':>10} {'identical':>10}")
+    for top_k in (1, 10):
+        exhaustive, exhaustive_latency = timed_search(exhaustive_index, queries, top_k)
+        for bound_rank in (16, 32, 64):
+            index = make_index(features, prune=True, bound_rank=bound_rank)
+            pruned, latency = timed_search(index, queries, top_k)
+            fraction = index.stats['tracks_pruned'] / (index.stats['tracks_pruned'] + index.stats['tracks_scored'])
+            print(f"{top_k:>5} {bound_rank:>5} {fraction:>7.1%} {exhaustive_latency * 1000:>14.2f} "
+                  f"{latency * 1000:>10.2f} {str(pruned == exhaustive):>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""
+Benchmark of sharded humming search (HummingIndex(workers=n)) on a synthetic corpus:
+query latency at 1, 2, 4 and 8 worker threads, checked against the single-threaded results.
+
+Each shard's matrix products can also be threaded by BLAS; set OPENBLAS_NUM_THREADS=1
+(or OMP_NUM_THREADS=1) to measure the sharding alone.
+
+Run from src/:
+    python -m backend.benchmarks.bench_humming_workers
+    python -m backend.benchmarks.bench_humming_workers --tracks 20000 --workers 1 2 4 8 16
+"""
+import os
+import argparse
+
+from backend.functions import audio
+from backend.benchmarks.bench_humming_lsh import build_corpus, noisy_excerpt, make_index, timed_search
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--tracks", type=int, default=10_000)
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    rng, melodies, features = build_corpus(args.tracks)
+    queries = []
+    for _ in range(args.queries):
+        melody = melodies[int(rng.integers(0, args.tracks))]
+        queries.append(audio.normalize_features(audio.extract_features(noisy_excerpt(rng, melody, 120))))
+    index = make_index(features)
+    print(f"{args.tracks} tracks, {index.n_windows} windows, {args.queries} queries, "
+          f"top_k={args.top_k}, {os.cpu_count()} CPUs")
+
+    print(f"{'workers':>7} {'ms/query':>9} {'speedup':>8} {'identical':>10}")
+    baseline = baseline_latency = None
+    for workers in args.workers:
+        index.workers = workers
+        try:
+            timed_search(index, queries[:2], args.top_k)  # start the pool threads
+            results, latency = timed_search(index, queries, args.top_k)
+        finally:
+            index.close()
+        if baseline is None:
+            baseline, baseline_latency = results, latency
+        print(f"{workers:>7} {latency * 1000:>9.2f} {baseline_latency / latency:>7.2f}x {str(results == baseline):>10}")
+
+
+if __name__ == "__main__":
+    main()
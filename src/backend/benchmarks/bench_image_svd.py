@@ -0,0 +1,60 @@
+"""
+Benchmark of the album-cover PCA solvers (Album_Finder.singular_value_decomposition)
+across cover resolutions and catalog sizes: fit time, peak memory and how far each
+solver's singular values are from the full SVD.
+
+Run from src/:
+    python -m backend.benchmarks.bench_image_svd
+    python -m backend.benchmarks.bench_image_svd --images 1000 4000 --sizes 20 64 128
+"""
+import time
+import argparse
+import tracemalloc
+
+import numpy as np
+
+from backend.functions.Album_Finder import center_dataset, choose_svd_solver, singular_value_decomposition
+from backend.benchmarks.corpus import make_covers
+
+
+def measure(standardized, num_components, solver):
+    start = time.perf_counter()
+    _, _, S = singular_value_decomposition(standardized, num_components, solver)
+    seconds = time.perf_counter() - start
+
+    tracemalloc.start()
+    singular_value_decomposition(standardized, num_components, solver)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return seconds, peak, S
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--images", type=int, nargs="+", default=[1000, 4000])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[20, 32, 64, 128])
+    parser.add_argument("--components", type=int, default=16)
+    parser.add_argument("--max-full-features", type=int, default=4096,
+                        help="skip the full SVD above this many pixels per image")
+    args = parser.parse_args()
+
+    print(f"{'images':>7} {'size':>9} {'solver':>11} {'fit (s)':>9} {'peak MiB':>9} {'S error':>9}")
+    for n_images in args.images:
+        for size in args.sizes:
+            _, standardized = center_dataset(make_covers(n_images, size, seed=n_images + size))
+            standardized = standardized.astype(np.float64)
+            solvers = ["gram", "randomized"]
+            if size * size <= args.max_full_features:
+                solvers.insert(0, "full")
+            reference = None
+            for solver in solvers:
+                seconds, peak, S = measure(standardized, args.components, solver)
+                if reference is None:
+                    reference = S
+                error = np.abs(S - reference).max() / reference[0]
+                print(f"{n_images:>7} {f'{size}x{size}':>9} {solver:>11} {seconds:>9.3f} {peak / 2**20:>9.1f} {error:>9.1e}")
+            print(f"{'':>7} {'':>9} {'auto':>11} -> {choose_svd_solver(n_images, size * size, args.components)}")
+
+
+if __name__ == "__main__":
+    main()
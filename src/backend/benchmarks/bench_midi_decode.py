@@ -0,0 +1,74 @@
+"""
+Benchmark of the single-pass MIDI decoder (audio.midi_to_pitch_array_with_tempo) against
+the mido-based decoding it replaces, on large multi-track synthetic MIDI files.
+
+Run from src/:
+    python -m backend.benchmarks.bench_midi_decode
+"""
+import io
+import time
+import tracemalloc
+from collections import defaultdict
+
+import mido
+
+from backend.functions import audio
+from backend.benchmarks.corpus import make_midi
+
+
+def mido_pitch_array_with_tempo(midi_blob):
+    """The previous implementation: two full mido parses and per-message tick2second."""
+    midi = mido.MidiFile(file=io.BytesIO(midi_blob))
+    channel_note_count = defaultdict(int)
+    for track in mido.MidiFile(file=io.BytesIO(midi_blob)).tracks:
+        for msg in track:
+            if not msg.is_meta and msg.type == 'note_on' and msg.velocity > 0:
+                channel_note_count[msg.channel] += 1
+    melody_channel = max(channel_note_count, key=channel_note_count.get, default=0)
+
+    tempo = 500000
+    current_beat = 0
+    quarter_pitches = []
+    for track in midi.tracks:
+        for msg in track:
+            if msg.is_meta and msg.type == 'set_tempo':
+                tempo = msg.tempo
+            if not msg.is_meta and hasattr(msg, 'time'):
+                delta_seconds = mido.tick2second(msg.time, midi.ticks_per_beat, tempo)
+                current_beat += delta_seconds * (8 / (60 / (60 * 1_000_000 / tempo)))
+                if msg.type == 'note_on' and msg.velocity > 0 and msg.channel == melody_channel:
+                    quarter_pitches.append((current_beat, msg.note))
+    if not quarter_pitches:
+        return [], 60 * 1_000_000 / tempo, midi.ticks_per_beat
+
+    pitch_array = [-1] * (int(round(max(quarter for quarter, _ in quarter_pitches))) + 1)
+    for quarter, pitch in quarter_pitches:
+        pitch_array[int(round(quarter))] = pitch
+    return pitch_array, 60 * 1_000_000 / tempo, midi.ticks_per_beat
+
+
+def measure(func, blob):
+    start = time.perf_counter()
+    result = func(blob)
+    elapsed = time.perf_counter() - start
+    # separate run for memory, tracemalloc slows the timed one down
+    tracemalloc.start()
+    func(blob)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main():
+    print(f"{'notes':>8} {'KiB':>7} {'mido (s)':>9} {'single-pass (s)':>16} {'speedup':>8} {'mido peak MiB':>14} {'peak MiB':>9}")
+    for n_notes in (2_000, 20_000, 100_000):
+        blob = make_midi(n_notes, n_channels=4, seed=n_notes)
+        expected, mido_time, mido_peak = measure(mido_pitch_array_with_tempo, blob)
+        result, fast_time, fast_peak = measure(audio.midi_to_pitch_array_with_tempo, blob)
+        assert result == expected, f"decoder mismatch for {n_notes} notes"
+        print(f"{n_notes:>8} {len(blob) / 1024:>7.0f} {mido_time:>9.3f} {fast_time:>16.3f} "
+              f"{mido_time / fast_time:>7.1f}x {mido_peak / 2**20:>14.1f} {fast_peak / 2**20:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
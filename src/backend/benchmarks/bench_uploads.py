@@ -0,0 +1,54 @@
+"""
+Benchmark of BucketUploader against an in-memory bucket with simulated round-trip latency
+and transient failures, at increasing concurrency limits.
+
+Run from src/:
+    python -m backend.benchmarks.bench_uploads
+"""
+import time
+import random
+import asyncio
+import logging
+
+from backend.services.storage import BucketUploader, LocalBucket, summarize_uploads
+
+
+class LatencyBucket(LocalBucket):
+    """In-memory bucket where every write takes `latency` seconds and fails with `failure_rate`."""
+
+    def __init__(self, latency=0.05, failure_rate=0.05, seed=0):
+        super().__init__()
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.rng = random.Random(seed)
+
+    def _write(self, path, data):
+        time.sleep(self.latency)
+        if self.rng.random() < self.failure_rate:
+            raise ConnectionError("simulated transient failure")
+        super()._write(path, data)
+
+
+def main(n_tracks=100):
+    logging.disable(logging.WARNING)
+    items = []
+    for idx in range(n_tracks):
+        items.append((f"playlist/images/{idx}.png", b"\x89PNG" + bytes(20_000), "image/png"))
+        items.append((f"playlist/audios/{idx}.mid", b"MThd" + bytes(5_000), "audio/midi"))
+
+    print(f"{len(items)} objects, 50 ms per round trip, 5% transient failures")
+    print(f"{'concurrency':>11} {'wall (s)':>9} {'speedup':>8} {'retries':>8} {'slowest (s)':>12}")
+    baseline = None
+    for concurrency in (1, 4, 8, 16, 32):
+        with BucketUploader(LatencyBucket(), max_concurrency=concurrency, backoff=0.01) as uploader:
+            start = time.perf_counter()
+            results = asyncio.run(uploader.upload_many(items))
+            wall = time.perf_counter() - start
+        baseline = baseline or wall
+        summary = summarize_uploads(results)
+        print(f"{concurrency:>11} {wall:>9.2f} {baseline / wall:>7.1f}x {summary['retries']:>8} "
+              f"{summary['slowest_seconds']:>12.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Deterministic synthetic corpus for the benchmarks: random-melody MIDI files and smooth
+low-rank album covers. The same arguments always give the same bytes, and nothing is
+downloaded.
+"""
+import io
+import random
+
+import mido
+import numpy as np
+from PIL import Image
+
+
+def make_midi(n_notes, n_channels=1, seed=0, ticks_per_beat=480):
+    """
+    Builds a type-1 MIDI file with one random-walk melody track per channel, a conductor
+    track with tempo changes and some controller/meta noise, and returns its bytes.
+
+    Args:
+        n_notes (int): Approximate total number of notes over all channels.
+        n_channels (int): Number of melody tracks, each on its own channel.
+        seed (int): Seed of the generator.
+        ticks_per_beat (int): MIDI time resolution.
+
+    Returns:
+        bytes: The MIDI file.
+    """
+    rng = random.Random(seed)
+    midi = mido.MidiFile(type=1, ticks_per_beat=ticks_per_beat)
+    conductor = mido.MidiTrack()
+    midi.tracks.append(conductor)
+    for _ in range(8):
+        conductor.append(mido.MetaMessage('set_tempo', tempo=rng.randint(300_000, 900_000),
+                                          time=rng.randint(0, ticks_per_beat * 16)))
+    for channel in range(n_channels):
+        track = mido.MidiTrack()
+        midi.tracks.append(track)
+        track.append(mido.Message('program_change', channel=channel, program=rng.randint(0, 127)))
+        note = 60
+        for _ in range(n_notes // n_channels + channel * 10):
+            note = min(108, max(21, note + rng.randint(-5, 5)))
+            track.append(mido.Message('note_on', channel=channel, note=note, velocity=80,
+                                      time=rng.randint(0, ticks_per_beat)))
+            if rng.random() < 0.2:
+                track.append(mido.Message('control_change', channel=channel, control=7,
+                                          value=rng.randint(0, 127), time=rng.randint(0, 10)))
+            if rng.random() < 0.05:
+                track.append(mido.MetaMessage('text', text='x', time=rng.randint(0, 10)))
+            track.append(mido.Message('note_on', channel=channel, note=note, velocity=0,
+                                      time=rng.randint(1, ticks_per_beat)))
+    buffer = io.BytesIO()
+    midi.save(file=buffer)
+    return buffer.getvalue()
+
+
+def make_covers(n_images, size, rank=24, seed=0):
+    """Smooth low-rank synthetic covers with pixel noise, shape (n_images, size, size)."""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:1:size * 1j, 0:1:size * 1j]
+    basis = np.stack([np.cos(np.pi * (i % 5 + 1) * x + i) * np.sin(np.pi * (i // 5 + 1) * y) for i in range(rank)])
+    weights = rng.standard_normal((n_images, rank)) * np.linspace(60, 5, rank)
+    covers = 128 + np.tensordot(weights, basis, axes=1) + rng.normal(0, 8, (n_images, size, size))
+    return np.clip(covers, 0, 255).astype(np.float32)
+
+
+def cover_to_bytes(cover, image_format='PNG', mode='RGB'):
+    """Encodes one (size, size) cover as an image file, RGB by default like real uploads."""
+    image = Image.fromarray(cover.astype(np.uint8)).convert(mode)
+    buffer = io.BytesIO()
+    image.save(buffer, format=image_format)
+    return buffer.getvalue()
+
@@ -0,0 +1,296 @@
+"""
+Micro-benchmark suite of the audio and image pipelines: MIDI decoding, audio.process,
+calculate_similarity, data_centering, singular_value_decomposition and query_projection,
+over size sweeps of a deterministic synthetic corpus (backend.benchmarks.corpus).
+
+Every case records its latency percentiles, throughput and peak traced memory into a
+JSON report. compare flags the cases whose median latency or peak memory grew by more
+than a threshold against a stored baseline report, and exits with status 1 if any did.
+Nothing touches the network; cover files are written to a temporary directory.
+
+Run from src/:
+    python -m backend.benchmarks.suite run --output baseline.json
+    python -m backend.benchmarks.suite run --sweep quick --only midi_decode process --output current.json
+    python -m backend.benchmarks.suite run --output current.json --baseline baseline.json
+    python -m backend.benchmarks.suite compare baseline.json current.json --threshold 0.25
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import tracemalloc
+
+import numpy as np
+
+from backend.functions import audio
+from backend.functions.Album_Finder import (
+    IMAGE_SIZE, NUM_COMPONENTS, center_dataset, data_centering, query_projection, singular_value_decomposition
+)
+from backend.benchmarks.corpus import cover_to_bytes, make_covers, make_midi
+
+REPORT_VERSION = 1
+
+SWEEPS = {
+    'quick': {
+        'midi_notes': [2_000, 20_000],
+        'midi_channels': [1, 4],
+        'track_windows': [250, 2_500],
+        'images': [50, 200],
+        'svd_images': [200, 1_000],
+        'model_sizes': [IMAGE_SIZE[0], 64],
+        'repeat': 5,
+    },
+    'full': {
+        'midi_notes': [2_000, 20_000, 100_000],
+        'midi_channels': [1, 4],
+        'track_windows': [250, 2_500, 25_000],
+        'images': [50, 200, 1_000],
+        'svd_images': [200, 1_000, 4_000],
+        'model_sizes': [IMAGE_SIZE[0], 64, 128],
+        'repeat': 20,
+    },
+}
+
+
+def case_name(bench, params):
+    return f"{bench}[{','.join(f'{key}={value}' for key, value in params.items())}]"
+
+
+def midi_decode_cases(sweep, workdir):
+    for n_notes in sweep['midi_notes']:
+        for n_channels in sweep['midi_channels']:
+            blob = make_midi(n_notes, n_channels, seed=n_notes + n_channels)
+            yield 'midi_decode', {'notes': n_notes, 'channels': n_channels}, n_notes, 'notes', \
+                lambda blob=blob: audio.midi_to_pitch_array_with_tempo(blob)
+
+
+def process_cases(sweep, workdir):
+    for n_notes in sweep['midi_notes']:
+        blob = make_midi(n_notes, seed=n_notes)
+        yield 'process', {'notes': n_notes}, n_notes, 'notes', lambda blob=blob: audio.process(blob)
+
+
+def similarity_cases(sweep, workdir):
+    # a hummed query is a few dozen windows; tracks grow with the sweep
+    query = audio.process(make_midi(300, seed=1))
+    for n_windows in sweep['track_windows']:
+        notes = n_windows
+        track = audio.process(make_midi(notes, seed=n_windows))
+        while len(track) < n_windows:
+            notes *= 2
+            track = audio.process(make_midi(notes, seed=n_windows))
+        track = track[:n_windows]
+        yield 'calculate_similarity', {'query_windows': len(query), 'track_windows': n_windows}, n_windows, 'windows', \
+            lambda track=track: audio.calculate_similarity(query, track)
+
+
+def write_covers(workdir, n_images, size=256, image_format='PNG'):
+    paths = []
+    for idx, cover in enumerate(make_covers(n_images, size, seed=n_images)):
+        path = os.path.join(workdir, f"cover_{n_images}_{idx}.{image_format.lower()}")
+        with open(path, 'wb') as cover_file:
+            cover_file.write(cover_to_bytes(cover, image_format))
+        paths.append(path)
+    return paths
+
+
+def data_centering_cases(sweep, workdir):
+    for n_images in sweep['images']:
+        paths = write_covers(workdir, n_images)
+        yield 'data_centering', {'images': n_images}, n_images, 'images', lambda paths=paths: data_centering(paths)
+
+
+def svd_cases(sweep, workdir):
+    for n_images in sweep['svd_images']:
+        for size in sweep['model_sizes']:
+            _, standardized = center_dataset(make_covers(n_images, size, seed=n_images + size))
+            yield 'singular_value_decomposition', {'images': n_images, 'size': size, 'components': NUM_COMPONENTS}, \
+                n_images, 'images', lambda X=standardized: singular_value_decomposition(X, NUM_COMPONENTS)
+
+
+def query_projection_cases(sweep, workdir):
+    query_path = write_covers(workdir, 1)[0]
+    for size in sweep['model_sizes']:
+        myu, standardized = center_dataset(make_covers(200, size, seed=size))
+        _, Uk, _ = singular_value_decomposition(standardized, NUM_COMPONENTS)
+        yield 'query_projection', {'size': size}, 1, 'queries', \
+            lambda myu=myu, Uk=Uk: query_projection(query_path, myu, Uk)
+
+
+BENCHMARKS = {
+    'midi_decode': midi_decode_cases,
+    'process': process_cases,
+    'calculate_similarity': similarity_cases,
+    'data_centering': data_centering_cases,
+    'singular_value_decomposition': svd_cases,
+    'query_projection': query_projection_cases,
+}
+
+
+def measure(func, items, repeat):
+    """
+    Latency of repeat calls after one warm-up call, then the peak traced memory of one
+    more call (tracemalloc slows the timed ones down, so it is measured separately).
+    """
+    func()
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        latencies.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    latencies_ms = np.array(latencies) * 1000
+    p50 = float(np.percentile(latencies_ms, 50))
+    return {
+        'repeat': repeat,
+        'latency_ms': {
+            'min': float(latencies_ms.min()),
+            'mean': float(latencies_ms.mean()),
+            'p50': p50,
+            'p90': float(np.percentile(latencies_ms, 90)),
+            'p99': float(np.percentile(latencies_ms, 99)),
+            'max': float(latencies_ms.max()),
+        },
+        'throughput_per_s': items / (p50 / 1000) if p50 > 0 else None,
+        'peak_memory_mib': peak / 2**20,
+    }
+
+
+def run(sweep_name='quick', only=None, repeat=None, log=print):
+    """
+    Runs the selected benchmarks over a sweep.
+
+    Returns:
+        dict: The report, with environment metadata and one result per case.
+    """
+    sweep = SWEEPS[sweep_name]
+    repeat = repeat or sweep['repeat']
+    results = {}
+    with tempfile.TemporaryDirectory(prefix='bench-') as workdir:
+        for bench, cases in BENCHMARKS.items():
+            if only and bench not in only:
+                continue
+            for name, params, items, unit, func in cases(sweep, workdir):
+                result = {'benchmark': name, 'params': params, 'items': items, 'unit': unit,
+                          **measure(func, items, repeat)}
+                key = case_name(name, params)
+                results[key] = result
+                log(f"{key:<70} p50 {result['latency_ms']['p50']:>10.3f} ms  "
+                    f"p99 {result['latency_ms']['p99']:>10.3f} ms  "
+                    f"{result['throughput_per_s'] or 0:>12.0f} {unit}/s  {result['peak_memory_mib']:>8.1f} MiB")
+    return {
+        'version': REPORT_VERSION,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'sweep': sweep_name,
+        'environment': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+        },
+        'results': results,
+    }
+
+
+def compare(baseline, current, threshold=0.25, memory_threshold=0.10):
+    """
+    Compares two reports case by case.
+
+    A case regresses when its median latency grew by more than threshold, or its peak
+    memory by more than memory_threshold (relative to the baseline).
+
+    Returns:
+        tuple: One row per case present in both reports, and the case names present in
+            only one of them.
+    """
+    rows = []
+    for key, new in current['results'].items():
+        old = baseline['results'].get(key)
+        if old is None:
+            continue
+        latency_ratio = new['latency_ms']['p50'] / old['latency_ms']['p50'] if old['latency_ms']['p50'] else 1.0
+        memory_ratio = new['peak_memory_mib'] / old['peak_memory_mib'] if old['peak_memory_mib'] else 1.0
+        rows.append({
+            'case': key,
+            'baseline_p50_ms': old['latency_ms']['p50'],
+            'current_p50_ms': new['latency_ms']['p50'],
+            'latency_ratio': latency_ratio,
+            'baseline_peak_mib': old['peak_memory_mib'],
+            'current_peak_mib': new['peak_memory_mib'],
+            'memory_ratio': memory_ratio,
+            'regressed': latency_ratio > 1 + threshold or memory_ratio > 1 + memory_threshold,
+        })
+    unmatched = sorted(set(baseline['results']) ^ set(current['results']))
+    return rows, unmatched
+
+
+def print_comparison(rows, unmatched, out=sys.stdout):
+    print(f"{'case':<70} {'p50 base':>10} {'p50 now':>10} {'ratio':>7} {'MiB base':>9} {'MiB now':>9} {'ratio':>7}", file=out)
+    for row in rows:
+        flag = '  REGRESSION' if row['regressed'] else ''
+        print(f"{row['case']:<70} {row['baseline_p50_ms']:>10.3f} {row['current_p50_ms']:>10.3f} "
+              f"{row['latency_ratio']:>6.2f}x {row['baseline_peak_mib']:>9.1f} {row['current_peak_mib']:>9.1f} "
+              f"{row['memory_ratio']:>6.2f}x{flag}", file=out)
+    for key in unmatched:
+        print(f"{key:<70} only in one report", file=out)
+    regressions = sum(row['regressed'] for row in rows)
+    print(f"{regressions} regression(s) in {len(rows)} compared case(s)", file=out)
+    return regressions
+
+
+def load_report(path):
+    with open(path) as report_file:
+        report = json.load(report_file)
+    if report.get('version') != REPORT_VERSION:
+        raise SystemExit(f"{path}: unsupported report version {report.get('version')}")
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help="run the benchmarks and write a JSON report")
+    run_parser.add_argument('--sweep', choices=sorted(SWEEPS), default='quick')
+    run_parser.add_argument('--only', nargs='+', choices=sorted(BENCHMARKS), help="benchmarks to run (default: all)")
+    run_parser.add_argument('--repeat', type=int, help="timed calls per case (default: from the sweep)")
+    run_parser.add_argument('--output', help="path of the JSON report (default: stdout)")
+    run_parser.add_argument('--baseline', help="compare against this report once done")
+
+    compare_parser = commands.add_parser('compare', help="compare a report against a baseline")
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    for command in (run_parser, compare_parser):
+        command.add_argument('--threshold', type=float, default=0.25, help="allowed relative growth of p50 latency")
+        command.add_argument('--memory-threshold', type=float, default=0.10, help="allowed relative growth of peak memory")
+    args = parser.parse_args(argv)
+
+    if args.command == 'run':
+        report = run(args.sweep, args.only, args.repeat, log=lambda line: print(line, file=sys.stderr))
+        if args.output:
+            with open(args.output, 'w') as report_file:
+                json.dump(report, report_file, indent=2)
+        else:
+            json.dump(report, sys.stdout, indent=2)
+        if not args.baseline:
+            return 0
+        baseline, current = load_report(args.baseline), report
+    else:
+        baseline, current = load_report(args.baseline), load_report(args.current)
+
+    # keep stdout clean when the report itself was written there
+    out = sys.stderr if args.command == 'run' and not args.output else sys.stdout
+    regressions = print_comparison(*compare(baseline, current, args.threshold, args.memory_threshold), out=out)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
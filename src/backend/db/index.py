@@ -1,36 +1,182 @@
 import os
-from supabase import create_client, Client
-from firebase_admin import (
-    credentials,
-    initialize_app,
-    storage
-)
-import firebase_admin
 import json
+import logging
+import threading
 from dotenv import load_dotenv
+from backend.functions.metrics import count, span
 load_dotenv()
 
+# Backends are picked by config and created on first use, not at import:
+# DATABASE_BACKEND=supabase|local, STORAGE_BACKEND=firebase|local
+DATABASE_BACKEND = os.getenv('DATABASE_BACKEND', 'supabase')
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'firebase')
+
 # SUPABASE
 SUPABASE_URL : str = os.getenv('SUPABASE_URL')
 SUPABASE_KEY : str = os.getenv('SUPABASE_KEY')
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+# HTTP connection pool of the PostgREST client; idle connections are kept alive for reuse
+SUPABASE_MAX_CONNECTIONS = int(os.getenv('SUPABASE_MAX_CONNECTIONS', '32'))
+SUPABASE_MAX_KEEPALIVE = int(os.getenv('SUPABASE_MAX_KEEPALIVE', '16'))
+SUPABASE_KEEPALIVE_EXPIRY = float(os.getenv('SUPABASE_KEEPALIVE_EXPIRY', '60'))
+SUPABASE_TIMEOUT = float(os.getenv('SUPABASE_TIMEOUT', '120'))
+SUPABASE_HTTP2 = os.getenv('SUPABASE_HTTP2', '0') == '1'
 
 # FIREBASE
 FIREBASE_CREDENTIALS_JSON = os.getenv('FIREBASE_CREDENTIALS_JSON')
 FIREBASE_STORAGE_BUCKET = os.getenv('FIREBASE_STORAGE_BUCKET')
+# Connections kept per host by the storage client's HTTP session, at least UPLOAD_CONCURRENCY
+STORAGE_POOL_SIZE = int(os.getenv('STORAGE_POOL_SIZE', os.getenv('UPLOAD_CONCURRENCY', '8')))
+
+# LOCAL STAND-INS
+LOCAL_DATABASE_PATH = os.getenv('LOCAL_DATABASE_PATH', ':memory:')
+LOCAL_STORAGE_ROOT = os.getenv('LOCAL_STORAGE_ROOT') or None
+LOCAL_STORAGE_URL = os.getenv('LOCAL_STORAGE_URL', 'http://localhost:8000/files')
+
+
+class LazyClient:
+    """
+    Stands in for a client that is created by factory on first use and then reused by
+    every caller and thread; attribute access is forwarded to the real client.
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._client = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        client = self._client
+        if client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._factory()
+                client = self._client
+        return client
+
+    @property
+    def created(self):
+        return self._client is not None
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+
+class TimedQuery:
+    """
+    Query builder wrapper timing execute() as a "database" span and counting the round
+    trip and its rows; every other builder call is forwarded and stays wrapped.
+    """
+
+    def __init__(self, builder):
+        self._builder = builder
+
+    def execute(self):
+        with span("database"):
+            response = self._builder.execute()
+        count('database_round_trips_total')
+        if isinstance(response.data, list):
+            count('database_rows_total', len(response.data))
+        return response
+
+    def __getattr__(self, name):
+        attr = getattr(self._builder, name)
+        if not callable(attr):
+            return TimedQuery(attr) if hasattr(attr, 'execute') else attr
+
+        def chained(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            return TimedQuery(result) if hasattr(result, 'execute') else result
+        return chained
+
+
+class TimedDatabase:
+    """
+    Database client wrapper whose table() queries are TimedQuery builders.
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    def table(self, name):
+        return TimedQuery(self.client.table(name))
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+
+def _pool_postgrest(client):
+    """
+    Replaces the PostgREST session of a supabase client with one using the configured
+    connection limits and keep-alive, keeping its base URL, headers and timeout.
+    """
+    import httpx
+    from postgrest.utils import SyncClient
+
+    rest = client.postgrest
+    session = rest.session
+    rest.session = SyncClient(
+        base_url=session.base_url,
+        headers=session.headers,
+        timeout=SUPABASE_TIMEOUT,
+        follow_redirects=True,
+        http2=SUPABASE_HTTP2,
+        limits=httpx.Limits(
+            max_connections=SUPABASE_MAX_CONNECTIONS,
+            max_keepalive_connections=SUPABASE_MAX_KEEPALIVE,
+            keepalive_expiry=SUPABASE_KEEPALIVE_EXPIRY,
+        ),
+    )
+    session.close()
+
+
+def create_database():
+    if DATABASE_BACKEND == 'local':
+        from backend.db.local import LocalDatabase
+        logging.info("Using the local database at %s", LOCAL_DATABASE_PATH)
+        return TimedDatabase(LocalDatabase(LOCAL_DATABASE_PATH))
+    if DATABASE_BACKEND != 'supabase':
+        raise ValueError(f"Unknown DATABASE_BACKEND: {DATABASE_BACKEND}")
+
+    from supabase import create_client
+    if not SUPABASE_URL or not SUPABASE_KEY:
+        raise ValueError("Supabase configuration is missing")
+    client = create_client(SUPABASE_URL, SUPABASE_KEY)
+    _pool_postgrest(client)
+    return TimedDatabase(client)
+
+
+def create_bucket():
+    if STORAGE_BACKEND == 'local':
+        from backend.services.storage import LocalBucket
+        logging.info("Using the local bucket at %s", LOCAL_STORAGE_ROOT or "memory")
+        return LocalBucket(LOCAL_STORAGE_ROOT, LOCAL_STORAGE_URL)
+    if STORAGE_BACKEND != 'firebase':
+        raise ValueError(f"Unknown STORAGE_BACKEND: {STORAGE_BACKEND}")
+
+    import firebase_admin
+    from firebase_admin import credentials, initialize_app, storage
+    from requests.adapters import HTTPAdapter
+
+    if not FIREBASE_CREDENTIALS_JSON or not FIREBASE_STORAGE_BUCKET:
+        raise ValueError("Firebase configuration is missing")
+
+    try:
+        cred_dict = json.loads(FIREBASE_CREDENTIALS_JSON)
+        cred = credentials.Certificate(cred_dict)
+    except json.JSONDecodeError:
+        raise ValueError("Invalid Firebase credentials JSON")
 
-if not FIREBASE_CREDENTIALS_JSON or not FIREBASE_STORAGE_BUCKET:
-    raise ValueError("Firebase configuration is missing")
+    if not firebase_admin._apps:
+        initialize_app(cred, {
+            'storageBucket': FIREBASE_STORAGE_BUCKET
+        })
 
-try:
-    cred_dict = json.loads(FIREBASE_CREDENTIALS_JSON)
-    cred = credentials.Certificate(cred_dict)
-except json.JSONDecodeError:
-    raise ValueError("Invalid Firebase credentials JSON")
+    bucket = storage.bucket()
+    # one pooled session for every upload thread instead of requests' default of 10 connections
+    adapter = HTTPAdapter(pool_connections=STORAGE_POOL_SIZE, pool_maxsize=STORAGE_POOL_SIZE)
+    bucket.client._http.mount('https://', adapter)
+    return bucket
 
-if not firebase_admin._apps:
-    firebase_app = initialize_app(cred, {
-        'storageBucket': FIREBASE_STORAGE_BUCKET
-    })
 
-bucket = storage.bucket()
\ No newline at end of file
+supabase = LazyClient(create_database)
+bucket = LazyClient(create_bucket)
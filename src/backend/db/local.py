@@ -0,0 +1,336 @@
+import re
+import json
+import uuid
+import sqlite3
+import threading
+from datetime import datetime, timezone
+
+
+class LocalResponse:
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+
+def _parse_columns(columns):
+    """
+    Splits a select string like "id, name, track(id, name)" into (column, sub-columns)
+    pairs, sub-columns being None for plain columns.
+    """
+    parsed = []
+    for item in _split_top_level(columns):
+        match = re.fullmatch(r'\s*([\w*]+)\s*(?:\((.*)\))?\s*', item, re.S)
+        if match is None:
+            raise ValueError(f"Unsupported select column: {item!r}")
+        name, embedded = match.groups()
+        parsed.append((name, _parse_columns(embedded) if embedded is not None else None))
+    return parsed
+
+
+def _split_top_level(text):
+    """Splits text on the commas that are not inside parentheses or double quotes."""
+    parts, depth, quoted, current = [], 0, False, []
+    for char in text:
+        if char == '"':
+            quoted = not quoted
+        elif not quoted and char == '(':
+            depth += 1
+        elif not quoted and char == ')':
+            depth -= 1
+        elif not quoted and depth == 0 and char == ',':
+            parts.append(''.join(current))
+            current = []
+            continue
+        current.append(char)
+    if ''.join(current).strip():
+        parts.append(''.join(current))
+    return parts
+
+
+def _like(pattern, flags=0):
+    regex = ''.join('.*' if char == '%' else '.' if char == '_' else re.escape(char) for char in pattern)
+    return re.compile(regex, flags | re.S)
+
+
+def _coerce(value, like):
+    """Converts a filter value given as text to the type of the column value it is compared to."""
+    if isinstance(value, str) and isinstance(like, (int, float)) and not isinstance(like, bool):
+        return type(like)(value)
+    return value
+
+
+def _compare(op, column_value, value):
+    if op == 'is':
+        return column_value is None if value in (None, 'null') else column_value is (value in (True, 'true'))
+    if op == 'in':
+        return column_value in [_coerce(item, column_value) for item in value]
+    if column_value is None:
+        return False
+    if op in ('like', 'ilike'):
+        return _like(value, re.I if op == 'ilike' else 0).fullmatch(str(column_value)) is not None
+    value = _coerce(value, column_value)
+    if op == 'eq':
+        return column_value == value
+    if op == 'neq':
+        return column_value != value
+    if op == 'gt':
+        return column_value > value
+    if op == 'gte':
+        return column_value >= value
+    if op == 'lt':
+        return column_value < value
+    if op == 'lte':
+        return column_value <= value
+    raise ValueError(f"Unsupported filter operator: {op}")
+
+
+def _parse_logic(expression):
+    """
+    Parses a PostgREST logic filter (the argument of or_, e.g.
+    'created_at.gt."x",and(created_at.eq."x",id.gt."y")') into a predicate on rows.
+    """
+    conditions = []
+    for item in _split_top_level(expression):
+        item = item.strip()
+        match = re.fullmatch(r'(and|or)\((.*)\)', item, re.S)
+        if match:
+            conditions.append((match.group(1), _parse_logic(match.group(2))))
+            continue
+        column, op, value = item.split('.', 2)
+        if op == 'in':
+            value = [part.strip().strip('"') for part in _split_top_level(value.strip()[1:-1])]
+        elif len(value) >= 2 and value[0] == value[-1] == '"':
+            value = value[1:-1]
+        conditions.append((None, (column, op, value)))
+
+    def evaluate(row, combine=any):
+        results = []
+        for logic, condition in conditions:
+            if logic is None:
+                column, op, value = condition
+                results.append(_compare(op, row.get(column), value))
+            else:
+                results.append(condition(row, any if logic == 'or' else all))
+        return combine(results)
+    return evaluate
+
+
+class LocalQuery:
+    """
+    The subset of the postgrest query builder this backend uses, over a LocalDatabase table.
+    """
+
+    def __init__(self, database, table):
+        self.database = database
+        self.table = table
+        self.action = 'select'
+        self.columns = [('*', None)]
+        self.count = None
+        self.payload = None
+        self.filters = []
+        self.orders = []
+        self.offset = 0
+        self.max_rows = None
+        self._children = {}
+
+    def select(self, columns='*', count=None):
+        self.columns = _parse_columns(columns)
+        self.count = count
+        return self
+
+    def insert(self, rows):
+        self.action, self.payload = 'insert', rows
+        return self
+
+    def upsert(self, rows):
+        self.action, self.payload = 'upsert', rows
+        return self
+
+    def update(self, values):
+        self.action, self.payload = 'update', values
+        return self
+
+    def delete(self):
+        self.action = 'delete'
+        return self
+
+    def _filter(self, column, op, value):
+        self.filters.append(lambda row: _compare(op, row.get(column), value))
+        return self
+
+    def eq(self, column, value):
+        return self._filter(column, 'eq', value)
+
+    def neq(self, column, value):
+        return self._filter(column, 'neq', value)
+
+    def gt(self, column, value):
+        return self._filter(column, 'gt', value)
+
+    def gte(self, column, value):
+        return self._filter(column, 'gte', value)
+
+    def lt(self, column, value):
+        return self._filter(column, 'lt', value)
+
+    def lte(self, column, value):
+        return self._filter(column, 'lte', value)
+
+    def like(self, column, pattern):
+        return self._filter(column, 'like', pattern)
+
+    def ilike(self, column, pattern):
+        return self._filter(column, 'ilike', pattern)
+
+    def in_(self, column, values):
+        return self._filter(column, 'in', list(values))
+
+    def is_(self, column, value):
+        return self._filter(column, 'is', value)
+
+    def or_(self, filters):
+        self.filters.append(_parse_logic(filters))
+        return self
+
+    def order(self, column, desc=False):
+        self.orders.append((column, desc))
+        return self
+
+    def limit(self, size):
+        self.max_rows = size
+        return self
+
+    def range(self, start, end):
+        self.offset, self.max_rows = start, end - start + 1
+        return self
+
+    def _matches(self, row):
+        return all(predicate(row) for predicate in self.filters)
+
+    def _project(self, row, columns):
+        projected = {}
+        for name, embedded in columns:
+            if name == '*':
+                projected.update(row)
+            elif embedded is None:
+                projected[name] = row.get(name)
+            elif f"{name}_id" in row:
+                # many-to-one: this row references the embedded table
+                parent = self.database.get(name, row[f"{name}_id"])
+                projected[name] = self._project(parent, embedded) if parent is not None else None
+            else:
+                # one-to-many: rows of the embedded table reference this one
+                projected[name] = [self._project(child, embedded) for child in self._referencing(name).get(row.get('id'), ())]
+        return projected
+
+    def _referencing(self, name):
+        """Rows of table name grouped by the id of the row of this table they reference."""
+        children = self._children.get(name)
+        if children is None:
+            children = self._children[name] = {}
+            for child in self.database.rows(name):
+                children.setdefault(child.get(f"{self.table}_id"), []).append(child)
+        return children
+
+    def execute(self):
+        if self.action in ('insert', 'upsert'):
+            rows = self.payload if isinstance(self.payload, list) else [self.payload]
+            return LocalResponse(self.database.write(self.table, rows, upsert=self.action == 'upsert'))
+        if self.action == 'update':
+            return LocalResponse(self.database.update(self.table, self._matches, self.payload))
+        if self.action == 'delete':
+            return LocalResponse(self.database.delete(self.table, self._matches))
+
+        rows = [row for row in self.database.rows(self.table) if self._matches(row)]
+        for column, desc in reversed(self.orders):
+            # stable sorts, last order() first; nulls last like PostgreSQL's ascending default
+            rows.sort(key=lambda row: (row.get(column) is None, row.get(column) if row.get(column) is not None else 0),
+                      reverse=desc)
+        count = len(rows) if self.count == 'exact' else None
+        end = None if self.max_rows is None else self.offset + self.max_rows
+        return LocalResponse([self._project(row, self.columns) for row in rows[self.offset:end]], count)
+
+
+class LocalDatabase:
+    """
+    Database stand-in with the supabase client's table(...) query interface, for running the
+    backend and its benchmarks offline.
+
+    Rows are JSON documents kept in SQLite (in memory by default, or in a file to persist
+    between runs) and mirrored in memory, where filters, ordering and embedded selects like
+    "track(id, name)" are evaluated. Embedding follows the <table>_id foreign key naming of
+    this schema. Missing id and created_at values are filled in on insert.
+    """
+
+    def __init__(self, path=':memory:'):
+        self.path = path
+        self._lock = threading.RLock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._tables = {}
+
+    def table(self, name):
+        return LocalQuery(self, name)
+
+    def _load(self, name):
+        rows = self._tables.get(name)
+        if rows is None:
+            self._connection.execute(
+                f'CREATE TABLE IF NOT EXISTS "{name}" (seq INTEGER PRIMARY KEY AUTOINCREMENT, id TEXT UNIQUE NOT NULL, row TEXT NOT NULL)'
+            )
+            rows = self._tables[name] = {}
+            for (row,) in self._connection.execute(f'SELECT row FROM "{name}" ORDER BY seq'):
+                row = json.loads(row)
+                rows[row['id']] = row
+        return rows
+
+    def rows(self, name):
+        with self._lock:
+            return list(self._load(name).values())
+
+    def get(self, name, row_id):
+        with self._lock:
+            return self._load(name).get(row_id)
+
+    def write(self, name, rows, upsert=False):
+        with self._lock:
+            table = self._load(name)
+            written = []
+            for row in rows:
+                row = json.loads(json.dumps(row))
+                row.setdefault('id', str(uuid.uuid4()))
+                if row['id'] in table:
+                    if not upsert:
+                        self._connection.rollback()
+                        raise ValueError(f'duplicate key value violates unique constraint "{name}_pkey"')
+                    row = {**table[row['id']], **row}
+                else:
+                    row.setdefault('created_at', datetime.now(timezone.utc).isoformat())
+                self._connection.execute(
+                    f'INSERT INTO "{name}" (id, row) VALUES (?, ?) ON CONFLICT(id) DO UPDATE SET row = excluded.row',
+                    (str(row['id']), json.dumps(row))
+                )
+                written.append(row)
+            self._connection.commit()
+            for row in written:
+                table[row['id']] = row
+            return written
+
+    def update(self, name, matches, values):
+        with self._lock:
+            table = self._load(name)
+            updated = [{**row, **json.loads(json.dumps(values))} for row in table.values() if matches(row)]
+            for row in updated:
+                self._connection.execute(f'UPDATE "{name}" SET row = ? WHERE id = ?', (json.dumps(row), str(row['id'])))
+                table[row['id']] = row
+            self._connection.commit()
+            return updated
+
+    def delete(self, name, matches):
+        with self._lock:
+            table = self._load(name)
+            deleted = [row for row in table.values() if matches(row)]
+            for row in deleted:
+                self._connection.execute(f'DELETE FROM "{name}" WHERE id = ?', (str(row['id']),))
+                del table[row['id']]
+            self._connection.commit()
+            return deleted
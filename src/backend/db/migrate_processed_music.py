@@ -0,0 +1,57 @@
+import json
+import argparse
+import numpy as np
+from backend.db.index import supabase
+from backend.functions.audio import load_features, encode_features
+
+
+def migrate_processed_music(batch_size=500, dtype=None, dry_run=False):
+    """
+    Re-encodes every track.processed_music still stored as a JSON list of per-window dicts
+    into the packed format of audio.encode_features. Rows already packed are skipped.
+    """
+    migrated = skipped = 0
+    bytes_before = bytes_after = 0
+    start = 0
+    while True:
+        page = supabase.table("track").select("id, processed_music") \
+            .order("id") \
+            .range(start, start + batch_size - 1) \
+            .execute()
+
+        for track in page.data:
+            value = track['processed_music']
+            if not isinstance(value, list):
+                skipped += 1
+                continue
+
+            encoded = encode_features(load_features(value), dtype=dtype)
+            bytes_before += len(json.dumps(value))
+            bytes_after += len(json.dumps(encoded))
+            if not dry_run:
+                supabase.table("track").update({'processed_music': encoded}).eq('id', track['id']).execute()
+            migrated += 1
+
+        if len(page.data) < batch_size:
+            break
+        start += batch_size
+
+    print(f"Migrated {migrated} tracks, skipped {skipped} already packed")
+    if migrated:
+        print(f"processed_music payload: {bytes_before} -> {bytes_after} bytes "
+              f"({bytes_before / bytes_after:.1f}x smaller)")
+    return migrated
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-encode track.processed_music into the packed feature format")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--float32", action="store_true", help="always store float32 (default: float16 where exact)")
+    parser.add_argument("--dry-run", action="store_true", help="only report the size reduction")
+    args = parser.parse_args()
+
+    migrate_processed_music(args.batch_size, np.float32 if args.float32 else None, args.dry_run)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+import io
+import argparse
+import urllib.request
+import numpy as np
+from backend.db.index import supabase
+from backend.functions.Album_Finder import IMAGE_SIZE, images_to_dataset, center_dataset, singular_value_decomposition
+
+
+def download(url, timeout=30):
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        return response.read()
+
+
+def refit_cover_models(batch_size=50, draft=True, dry_run=False):
+    """
+    Refits every playlist's album-cover PCA model (myu, uk, projections) from its covers,
+    decoded the way decode_image does with the given draft setting. Run it with draft=True
+    before turning on IMAGE_DRAFT_DECODE, so stored models and queries decode alike; the
+    number of components and the resolution of each model are kept. A global cover model
+    (GLOBAL_IMAGE_MODEL_PATH) holds decoded covers too and has to be deleted afterwards.
+    """
+    refitted = skipped = 0
+    start = 0
+    while True:
+        page = supabase.table("playlist").select("id, name, myu, uk, track(image_url, image_idx)") \
+            .order("id") \
+            .range(start, start + batch_size - 1) \
+            .execute()
+
+        for playlist in page.data:
+            tracks = sorted(playlist['track'], key=lambda track: track['image_idx'])
+            if not tracks:
+                skipped += 1
+                continue
+            myu = np.asarray(playlist['myu'])
+            shape = myu.shape if myu.ndim == 2 else IMAGE_SIZE
+            covers = [io.BytesIO(download(track['image_url'])) for track in tracks]
+            dataset = images_to_dataset(covers, *shape, draft=draft)
+            myu, standardized = center_dataset(dataset)
+            projections, Uk, _ = singular_value_decomposition(standardized, np.asarray(playlist['uk']).shape[1])
+            if not dry_run:
+                supabase.table("playlist").update({
+                    'myu': myu.tolist(), 'uk': Uk.tolist(), 'projections': projections.tolist()
+                }).eq('id', playlist['id']).execute()
+            refitted += 1
+
+        if len(page.data) < batch_size:
+            break
+        start += batch_size
+
+    print(f"Refitted {refitted} playlist cover models, skipped {skipped} without tracks")
+    return refitted
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Refit every playlist's cover model with the current image decoder")
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--no-draft", action="store_true", help="decode without JPEG draft mode (IMAGE_DRAFT_DECODE=0)")
+    parser.add_argument("--dry-run", action="store_true", help="refit without writing the models back")
+    args = parser.parse_args()
+
+    refit_cover_models(args.batch_size, not args.no_draft, args.dry_run)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,27 @@
 from PIL import Image
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
+import contextvars
+import threading
 import io
+import os
+from backend.functions.metrics import timed
+
+# Fungsi untuk membaca ukuran gambar seperti "20" atau "64x48" menjadi (tinggi, lebar)
+def parse_image_size(value):
+    sides = [int(side) for side in value.lower().split('x')]
+    return (sides[0], sides[-1])
+
+# Ukuran gambar yang dipakai untuk PCA (tinggi, lebar)
+IMAGE_SIZE = parse_image_size(os.getenv('IMAGE_MODEL_SIZE', '20'))
+# Jumlah komponen utama per model
+NUM_COMPONENTS = int(os.getenv('IMAGE_MODEL_COMPONENTS', '2'))
+# JPEG minimal 2 x DRAFT_FACTOR x IMAGE_SIZE didekode langsung ke ukuran >= DRAFT_FACTOR x IMAGE_SIZE sebelum LANCZOS.
+# Hanya jika IMAGE_DRAFT_DECODE=1: nilai pikselnya sedikit berbeda, jadi model playlist yang
+# di-fit tanpa draft harus di-fit ulang dulu dengan db/refit_cover_models.py
+DRAFT_FACTOR = 4
+DRAFT_DECODE = os.getenv('IMAGE_DRAFT_DECODE', '0') == '1'
+DECODE_WORKERS = int(os.getenv('IMAGE_DECODE_WORKERS', str(min(8, os.cpu_count() or 1))))
 
 
 def image_to_blob(image_file):
@@ -27,9 +48,71 @@ def resize_image(image_array, output_height=20, output_width=20):
 def turn_to_1D(image_array):
     return image_array.flatten()
 
+# Fungsi untuk mendekode gambar langsung ke grayscale kecil, tanpa re-encode ke PNG.
+# Hasilnya sama dengan resize_image(turn_grayscale(image_to_blob(...))), kecuali dengan draft
+# (default DRAFT_DECODE) untuk JPEG yang minimal dua kali ukuran draft: JPEG itu didownscale dan
+# dijadikan grayscale oleh libjpeg, sehingga nilai pikselnya sedikit berbeda.
+@timed("image_decode")
+def decode_image(image_file, output_height=IMAGE_SIZE[0], output_width=IMAGE_SIZE[1], out=None, draft=None):
+    if draft is None:
+        draft = DRAFT_DECODE
+    with Image.open(image_file) as img:
+        draft_size = (output_width * DRAFT_FACTOR, output_height * DRAFT_FACTOR)
+        if draft and img.format == "JPEG" and img.width >= 2 * draft_size[0] and img.height >= 2 * draft_size[1]:
+            img.draft("L", draft_size)
+        img = img.convert("L").convert("F")  # Grayscale float32, seperti turn_grayscale
+        img_resized = img.resize((output_width, output_height), Image.Resampling.LANCZOS)
+    if out is None:
+        out = np.empty((output_height, output_width), dtype=np.float32)
+    out[...] = np.asarray(img_resized, dtype=np.float32)
+    return out
+
+# Pool thread decode, satu per jumlah worker, dibuat saat pertama dipakai lalu dipakai ulang
+_decode_pools = {}
+_decode_pools_lock = threading.Lock()
+
+def get_decode_pool(workers=DECODE_WORKERS):
+    with _decode_pools_lock:
+        if workers not in _decode_pools:
+            _decode_pools[workers] = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='image-decode')
+        return _decode_pools[workers]
+
+def shutdown_decode_pools():
+    with _decode_pools_lock:
+        pools = list(_decode_pools.values())
+        _decode_pools.clear()
+    for pool in pools:
+        pool.shutdown()
+
+# Fungsi untuk mendekode banyak gambar secara paralel ke array dataset (N, m, n) float32
+def images_to_dataset(image_files, output_height=IMAGE_SIZE[0], output_width=IMAGE_SIZE[1], out=None, workers=DECODE_WORKERS, draft=None):
+    image_files = list(image_files)
+    if out is None:
+        out = np.empty((len(image_files), output_height, output_width), dtype=np.float32)
+
+    def decode(i):
+        decode_image(image_files[i], output_height, output_width, out=out[i], draft=draft)
+
+    if workers <= 1 or len(image_files) <= 1:
+        for i in range(len(image_files)):
+            decode(i)
+    else:
+        # PIL melepas GIL saat decode dan resize, jadi thread cukup. Tiap tugas jalan di salinan
+        # context pemanggil, supaya span image_decode tetap tercatat di request-nya
+        pool = get_decode_pool(workers)
+        futures = [pool.submit(contextvars.copy_context().run, decode, i) for i in range(len(image_files))]
+        for future in futures:
+            future.result()
+    return out
+
 # Fungsi untuk menghilangkan rata-rata (data centering)
 def data_centering(image_paths):
-    dataset = np.array([resize_image(turn_grayscale(image_to_blob(image_path))) for image_path in image_paths])
+    dataset = images_to_dataset(image_paths)
+    return center_dataset(dataset)
+
+# Fungsi untuk centering dataset gambar yang sudah diresize (N, m, n)
+@timed("centering")
+def center_dataset(dataset):
     N, m, n = dataset.shape  # Dapatkan dimensi dataset
 
     myu = np.mean(dataset, axis=0)  # Hitung rata-rata gambar
@@ -37,17 +120,106 @@ def data_centering(image_paths):
     standardized = dataset - myu  # Centering data (mengurangi rata-rata)
     return myu, standardized.reshape(N, -1)  # Kembalikan dataset yang sudah distandarisasi dalam bentuk 1D
 
+# Fungsi untuk memilih solver SVD berdasarkan bentuk data (N gambar x d piksel)
+def choose_svd_solver(n_samples, n_features, num_components):
+    smaller, larger = sorted((n_samples, n_features))
+    if smaller <= 64:
+        return "full"  # Matriks kecil, SVD penuh sudah murah
+    if smaller <= 1024 and larger >= 8 * smaller:
+        return "gram"  # Matriks Gram kecil dibanding datanya
+    if num_components <= smaller // 10 and smaller > 512:
+        return "randomized"  # Hanya sedikit komponen dari matriks besar
+    return "gram"  # Eigendecomposition matriks Gram/kovarians yang lebih kecil
+
+# SVD penuh: V dan S dari np.linalg.svd
+def _svd_full(X, num_components):
+    _, S, Vt = np.linalg.svd(X, full_matrices=False)
+    return Vt[:num_components].T, S[:num_components]
+
+# SVD lewat matriks Gram (N x N) atau kovarians (d x d), mana yang lebih kecil
+def _svd_gram(X, num_components):
+    N, d = X.shape
+    gram = X @ X.T if N < d else X.T @ X
+    eigenvalues, eigenvectors = np.linalg.eigh(gram)
+    order = np.argsort(eigenvalues)[::-1][:num_components]
+    S = np.sqrt(np.clip(eigenvalues[order], 0, None))
+    if N < d:
+        # Komponen kanan dari komponen kiri: v = X^T u / s
+        nonzero = S > (S[0] * 1e-10 if len(S) else 0)
+        V = np.zeros((d, len(order)), dtype=X.dtype)
+        V[:, nonzero] = X.T @ eigenvectors[:, order[nonzero]] / S[nonzero]
+    else:
+        V = eigenvectors[:, order]
+    return V, S
+
+# Randomized truncated SVD (Halko dkk., 2011) dengan oversampling dan power iteration
+def _svd_randomized(X, num_components, oversamples=10, n_iter=4, seed=0):
+    rng = np.random.default_rng(seed)
+    sketch = min(num_components + oversamples, min(X.shape))
+    Q = X @ rng.standard_normal((X.shape[1], sketch)).astype(X.dtype)
+    for _ in range(n_iter):
+        Q, _ = np.linalg.qr(Q)
+        Q, _ = np.linalg.qr(X.T @ Q)
+        Q = X @ Q
+    Q, _ = np.linalg.qr(Q)
+    _, S, Vt = np.linalg.svd(Q.T @ X, full_matrices=False)
+    return Vt[:num_components].T, S[:num_components]
+
+SVD_SOLVERS = {"full": _svd_full, "gram": _svd_gram, "randomized": _svd_randomized}
+
 # Fungsi Singular Value Decomposition (SVD) untuk reduksi dimensi
-def singular_value_decomposition(standardized_data, num_components=5):  
-    U, S, Vt = np.linalg.svd(standardized_data, full_matrices=False)  # SVD pada data standar
-    Uk = Vt[:num_components].T  # Ambil komponen utama (PCA)
+# solver: "full", "gram", "randomized" atau "auto" (dipilih oleh choose_svd_solver)
+@timed("svd")
+def singular_value_decomposition(standardized_data, num_components=5, solver="auto"):  
+    if solver == "auto":
+        solver = choose_svd_solver(*standardized_data.shape, num_components)
+    Uk, S = SVD_SOLVERS[solver](standardized_data, num_components)  # Ambil komponen utama (PCA)
     Z = np.dot(standardized_data, Uk)  # Proyeksikan data ke dalam ruang komponen utama
-    return Z, Uk, S[:num_components]  # Kembalikan proyeksi data dan komponen utama
+    return Z, Uk, S  # Kembalikan proyeksi data dan komponen utama
+
+# PCA streaming: gambar dimasukkan per chunk, yang disimpan hanya rata-rata dan matriks
+# kovarians (d x d, float64), jadi memori tidak bergantung pada jumlah gambar.
+# Chunk digabung dengan rumus Chan dkk. supaya tidak ada cancellation seperti pada sum(x^2).
+class StreamingPCA:
+    def __init__(self, image_shape=IMAGE_SIZE):
+        self.image_shape = tuple(image_shape)
+        d = self.image_shape[0] * self.image_shape[1]
+        self.n = 0
+        self.mean = np.zeros(d)
+        self.scatter = np.zeros((d, d))  # sum (x - mean)(x - mean)^T
+
+    # Tambahkan satu chunk gambar (n, m, n') atau vektor (n, d)
+    def update(self, chunk):
+        X = np.asarray(chunk, dtype=np.float64).reshape(len(chunk), len(self.mean))
+        if len(X) == 0:
+            return self
+        chunk_mean = X.mean(axis=0)
+        centered = X - chunk_mean
+        delta = chunk_mean - self.mean
+        total = self.n + len(X)
+        self.scatter += centered.T @ centered + np.outer(delta, delta) * (self.n * len(X) / total)
+        self.mean += delta * (len(X) / total)
+        self.n = total
+        return self
+
+    # Hasilkan myu (m, n'), Uk (d, k) dan nilai singular dari statistik yang terkumpul
+    def components(self, num_components=NUM_COMPONENTS):
+        k = min(num_components, self.n, len(self.mean))
+        eigenvalues, eigenvectors = np.linalg.eigh(self.scatter)
+        order = np.argsort(eigenvalues)[::-1][:k]
+        S = np.sqrt(np.clip(eigenvalues[order], 0, None))  # Sama dengan nilai singular data yang dicentering
+        return self.mean.reshape(self.image_shape), eigenvectors[:, order], S
+
+    # Proyeksikan chunk gambar ke ruang komponen utama
+    def project(self, chunk, Uk):
+        X = np.asarray(chunk, dtype=np.float64).reshape(len(chunk), len(self.mean))
+        return (X - self.mean) @ Uk
 
 # Fungsi untuk memproyeksikan gambar query ke dalam ruang komponen utama
+@timed("projection")
 def query_projection(query_image_path, myu, Uk):
-    query_grayscale = turn_grayscale(image_to_blob(query_image_path))
-    query_resized = resize_image(query_grayscale)
+    output_height, output_width = myu.shape if myu.ndim == 2 else IMAGE_SIZE
+    query_resized = decode_image(query_image_path, output_height, output_width)
     query_flattened = turn_to_1D(query_resized)
 
     q_centered = query_flattened - myu.flatten()  # Centering gambar query dengan rata-rata dataset
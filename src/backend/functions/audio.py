@@ -1,6 +1,157 @@
-import mido
-from collections import defaultdict
 import io
+import zlib
+import base64
+import struct
+from array import array
+import numpy as np
+from backend.functions.metrics import timed, track_request
+
+FEATURE_TYPES = ('ATB', 'RTB', 'FTB')
+# Columns of each feature type for the default shrink ranges (see shrink_histograms)
+FEATURE_BINS = (25, 49, 49)
+# extract_features parameters used by process
+FEATURE_PARAMS = {
+    'window_size': 40, 'hop_size': 8, 'n_semitones': 1, 'fuzziness': 0.5,
+    'atb_left': 12, 'atb_right': 12, 'rtb_left': 24, 'rtb_right': 24,
+}
+
+# Data bytes following each non-channel status byte (meta and sysex are length-prefixed)
+_SYSTEM_DATA_LENGTH = {0xf1: 1, 0xf2: 2, 0xf3: 1, 0xf6: 0, 0xf8: 0, 0xfa: 0, 0xfb: 0, 0xfc: 0, 0xfe: 0}
+
+def _decode_midi(midi_blob):
+    """
+    Reads every track chunk of a MIDI blob once, keeping only what the pitch array needs.
+
+    Follows mido's reader: tracks are read one after another, running status applies to
+    every non-meta status byte, and only non-meta events advance the beat position.
+
+    Args:
+        midi_blob (bytes): MIDI data in a binary blob.
+
+    Returns:
+        tuple:
+            - np.ndarray: Delta ticks of every non-meta event, in file order.
+            - np.ndarray: Tempo in effect at every non-meta event.
+            - np.ndarray: Event index, channel and note of every note_on with velocity > 0, shape (3, n_notes).
+            - int: Last tempo set in the file.
+            - int: ticks_per_beat for the MIDI file.
+    """
+    data = midi_blob
+    if data[:4] != b'MThd':
+        raise OSError('MThd not found. Probably not a MIDI file')
+    header_size = struct.unpack_from('>L', data, 4)[0]
+    if header_size < 6 or len(data) < 14:
+        raise EOFError
+    _, num_tracks, ticks_per_beat = struct.unpack_from('>hhh', data, 8)
+    pos = 8 + header_size
+
+    deltas = array('q')
+    notes = array('q')
+    tempo = 500000
+    tempo_changes = [(0, tempo)]
+
+    for _ in range(num_tracks):
+        if len(data) < pos + 8:
+            raise EOFError
+        name, size = struct.unpack_from('>4sL', data, pos)
+        if name != b'MTrk':
+            raise OSError('no MTrk header at start of track')
+        pos += 8
+        end = pos + size
+        last_status = None
+
+        while pos < end:
+            delta = 0
+            while True:
+                byte = data[pos]
+                pos += 1
+                delta = (delta << 7) | (byte & 0x7f)
+                if byte < 0x80:
+                    break
+
+            status = data[pos]
+            pos += 1
+            if status < 0x80:
+                if last_status is None:
+                    raise OSError('running status without last_status')
+                status = last_status
+                # the byte was the first data byte, except for sysex where mido drops it
+                if status != 0xf0 and status != 0xf7:
+                    pos -= 1
+            elif status != 0xff:
+                last_status = status
+
+            if status == 0xff:
+                meta_type = data[pos]
+                pos += 1
+                length = 0
+                while True:
+                    byte = data[pos]
+                    pos += 1
+                    length = (length << 7) | (byte & 0x7f)
+                    if byte < 0x80:
+                        break
+                if meta_type == 0x51:
+                    tempo = (data[pos] << 16) | (data[pos + 1] << 8) | data[pos + 2]
+                    tempo_changes.append((len(deltas), tempo))
+                pos += length
+                continue
+
+            if status == 0xf0 or status == 0xf7:
+                length = 0
+                while True:
+                    byte = data[pos]
+                    pos += 1
+                    length = (length << 7) | (byte & 0x7f)
+                    if byte < 0x80:
+                        break
+                pos += length
+            elif status < 0xf0:
+                kind = status & 0xf0
+                if kind == 0xc0 or kind == 0xd0:
+                    if data[pos] > 127:
+                        raise OSError('data byte must be in range 0..127')
+                    pos += 1
+                else:
+                    note = data[pos]
+                    velocity = data[pos + 1]
+                    if note > 127 or velocity > 127:
+                        raise OSError('data byte must be in range 0..127')
+                    pos += 2
+                    if kind == 0x90 and velocity > 0:
+                        notes.extend((len(deltas), status & 0x0f, note))
+            elif status in _SYSTEM_DATA_LENGTH:
+                pos += _SYSTEM_DATA_LENGTH[status]
+            else:
+                raise OSError(f'undefined status byte 0x{status:02x}')
+            deltas.append(delta)
+
+    n_events = len(deltas)
+    change_at = np.array([index for index, _ in tempo_changes] + [n_events], dtype=np.int64)
+    change_tempo = np.array([value for _, value in tempo_changes], dtype=np.int64)
+    tempos = np.repeat(change_tempo, np.diff(change_at))
+    note_events = np.frombuffer(notes, dtype=np.int64).reshape(-1, 3).T
+    return np.frombuffer(deltas, dtype=np.int64), tempos, note_events, tempo, ticks_per_beat
+
+def _select_melody_channel(channels):
+    """
+    Most active channel; ties go to the channel whose first note comes first, default 0.
+    """
+    if len(channels) == 0:
+        return 0
+    present, first_seen, counts = np.unique(channels, return_index=True, return_counts=True)
+    busiest = np.flatnonzero(counts == counts.max())
+    return int(present[busiest[np.argmin(first_seen[busiest])]])
+
+def _as_midi_bytes(midi_blob):
+    # If midi_blob is a BytesIO object, read it into bytes
+    if isinstance(midi_blob, io.BytesIO):
+        midi_blob = midi_blob.read()
+
+    # Ensure midi_blob is a bytes-like object
+    if not isinstance(midi_blob, bytes):
+        raise TypeError("Expected a bytes-like object, got {}".format(type(midi_blob)))
+    return midi_blob
 
 def detect_melody_channel(midi_blob):
     """
@@ -12,16 +163,46 @@ def detect_melody_channel(midi_blob):
     Returns:
         int: Channel number of the main melody.
     """
-    midi = mido.MidiFile(file=io.BytesIO(midi_blob))
-    channel_note_count = defaultdict(int)
+    _, _, note_events, _, _ = _decode_midi(midi_blob)
+    return _select_melody_channel(note_events[1])
 
-    for track in midi.tracks:
-        for msg in track:
-            if not msg.is_meta and msg.type == 'note_on' and msg.velocity > 0:
-                channel_note_count[msg.channel] += 1
+@timed("midi_parse")
+def midi_to_pitch_sequence(midi_blob):
+    """
+    Array version of midi_to_pitch_array_with_tempo, decoding the MIDI blob in a single pass.
 
-    melody_channel = max(channel_note_count, key=channel_note_count.get, default=0)
-    return melody_channel
+    Beat positions come from a cumulative sum over the per-event increments
+    tick2second(delta) * (8 / (60 / bpm)), evaluated with the same floating-point operations
+    in the same order as mido-based decoding, so rounding to beat slots matches it exactly.
+
+    Args:
+        midi_blob (bytes or io.BytesIO): MIDI data in a binary blob.
+
+    Returns:
+        tuple:
+            - np.ndarray: int64 pitches where arr[i] is the pitch at quarter beat i, -1 when silent.
+            - float: Tempo in BPM.
+            - int: ticks_per_beat for the MIDI file.
+    """
+    midi_blob = _as_midi_bytes(midi_blob)
+    deltas, tempos, note_events, tempo, ticks_per_beat = _decode_midi(midi_blob)
+    bpm = 60 * 1_000_000 / tempo
+
+    melody_channel = _select_melody_channel(note_events[1])
+    melody = note_events[:, note_events[1] == melody_channel]
+    if melody.shape[1] == 0:
+        return np.zeros(0, dtype=np.int64), bpm, ticks_per_beat
+
+    # mido.tick2second(delta, ticks_per_beat, tempo), then the beats-per-second factor
+    delta_seconds = deltas * (tempos * 1e-6 / ticks_per_beat)
+    current_beat = np.cumsum(delta_seconds * (8 / (60 / (60 * 1_000_000 / tempos))))
+    slots = np.rint(current_beat[melody[0]]).astype(np.int64)
+
+    pitch_array = np.full(int(slots.max()) + 1, -1, dtype=np.int64)
+    # later notes overwrite earlier ones in the same slot
+    last_slots, last_index = np.unique(slots[::-1], return_index=True)
+    pitch_array[last_slots] = melody[2][::-1][last_index]
+    return pitch_array, bpm, ticks_per_beat
 
 def midi_to_pitch_array_with_tempo(midi_blob):
     """
@@ -37,48 +218,8 @@ def midi_to_pitch_array_with_tempo(midi_blob):
             - float: Tempo in BPM.
             - int: ticks_per_beat for the MIDI file.
     """
-    # If midi_blob is a BytesIO object, read it into bytes
-    if isinstance(midi_blob, io.BytesIO):
-        midi_blob = midi_blob.read()
-
-    # Ensure midi_blob is a bytes-like object
-    if not isinstance(midi_blob, bytes):
-        raise TypeError("Expected a bytes-like object, got {}".format(type(midi_blob)))
-
-    midi = mido.MidiFile(file=io.BytesIO(midi_blob))
-    melody_channel = detect_melody_channel(midi_blob)
-    # print(f"Detected melody channel: {melody_channel}")
-    default_tempo = 500000
-    tempo = default_tempo
-    current_beat = 0
-    quarter_pitches = []
-
-    for track in midi.tracks:
-        for msg in track:
-            if msg.is_meta and msg.type == 'set_tempo':
-                tempo = msg.tempo
-            if not msg.is_meta and hasattr(msg, 'time'):
-                delta_seconds = mido.tick2second(msg.time, midi.ticks_per_beat, tempo)
-                current_beat += delta_seconds * (8 / (60 / (60 * 1_000_000 / tempo)))
-                if msg.type == 'note_on' and msg.velocity > 0 and msg.channel == melody_channel:
-                    quarter_pitches.append((current_beat, msg.note))
-
-    if not quarter_pitches:
-        # print("No pitches detected in the MIDI data.")
-        return [], 60 * 1_000_000 / tempo, midi.ticks_per_beat
-
-    # Find the max quarter note
-    max_quarter_beat = int(round(max(quarter for quarter, _ in quarter_pitches)))
-    pitch_array = [-1] * (max_quarter_beat + 1)
-
-    # Populate pitch array for each quarter note
-    for quarter, pitch in quarter_pitches:
-        idx = int(round(quarter))
-        if idx < len(pitch_array):
-            pitch_array[idx] = pitch
-
-    bpm = 60 * 1_000_000 / tempo
-    return pitch_array, bpm, midi.ticks_per_beat
+    pitch_array, bpm, ticks_per_beat = midi_to_pitch_sequence(midi_blob)
+    return pitch_array.tolist(), bpm, ticks_per_beat
 
 def normalize_pitches(pitch_array, min_pitch=21, max_pitch=108):
     """
@@ -316,13 +457,106 @@ def cosine_similarity(vec1, vec2):
 
     return dot_product / (magnitude1 * magnitude2)
 
+def normalize_features(features, dtype=np.float32):
+    """
+    Stacks the ATB, RTB and FTB vectors of every window into one matrix and scales each
+    block to unit length, so a dot product of two rows gives the three cosine similarities.
+
+    Args:
+        features (dict, list, str or bytes): Any form accepted by load_features.
+        dtype (np.dtype): dtype of the returned matrix.
+
+    Returns:
+        np.ndarray: (n_windows, total_bins) matrix; all-zero blocks stay zero,
+            matching cosine_similarity returning 0.0 for zero vectors.
+    """
+    features = load_features(features)
+    blocks = []
+    for key in FEATURE_TYPES:
+        block = np.asarray(features[key], dtype=np.float64)
+        magnitude = np.linalg.norm(block, axis=1, keepdims=True)
+        magnitude[magnitude == 0] = 1.0
+        blocks.append(block / magnitude)
+    return np.ascontiguousarray(np.hstack(blocks), dtype=dtype)
+
+def feature_weights(atb_weight=0.6, rtb_weight=0.2, ftb_weight=0.2, bins=None):
+    """
+    Builds the per-column weight vector of a normalize_features matrix.
+
+    Args:
+        atb_weight (float): Weight for ATB similarity.
+        rtb_weight (float): Weight for RTB similarity.
+        ftb_weight (float): Weight for FTB similarity.
+        bins (tuple): Number of ATB, RTB and FTB columns, defaults to FEATURE_BINS.
+
+    Returns:
+        np.ndarray: Column weights.
+    """
+    return np.repeat([atb_weight, rtb_weight, ftb_weight], bins or FEATURE_BINS)
+
+def _as_normalized(array, dtype):
+    # 2-D arrays are taken to be normalize_features output already (e.g. a stored corpus)
+    if isinstance(array, np.ndarray):
+        return array
+    return normalize_features(array, dtype=dtype)
+
+def _feature_bins(array):
+    if isinstance(array, dict):
+        return tuple(array[key].shape[1] for key in FEATURE_TYPES)
+    if isinstance(array, list) and array:
+        return tuple(len(array[0][key]) for key in FEATURE_TYPES)
+    return None
+
+@timed("similarity")
+def alignment_scores(array1, array2, atb_weight=0.6, rtb_weight=0.2, ftb_weight=0.2):
+    """
+    Scores every alignment offset of array1 (query) against array2 (track).
+
+    All pairwise weighted ATB/RTB/FTB cosines come from one matrix product; the score of
+    offset j is the mean of the diagonal starting at column j, i.e. of query window i
+    against track window j + i while both exist. Offsets run over
+    range(int(len(array2) - len(array1) / 2)) as in calculate_similarity.
+
+    Args:
+        array1 (dict, list or np.ndarray): Query windows, as extract_features arrays, process
+            output, or a precomputed normalize_features matrix.
+        array2 (dict, list or np.ndarray): Track windows, same accepted forms.
+        atb_weight (float): Weight for ATB similarity.
+        rtb_weight (float): Weight for RTB similarity.
+        ftb_weight (float): Weight for FTB similarity.
+
+    Returns:
+        np.ndarray: Mean weighted similarity for each offset.
+    """
+    dtype = np.float32 if isinstance(array2, np.ndarray) else np.float64
+    bins = _feature_bins(array1) or _feature_bins(array2)
+    query = _as_normalized(array1, dtype)
+    track = _as_normalized(array2, dtype)
+    array1_length = len(query)
+    array2_length = len(track)
+
+    n_offsets = max(0, int(array2_length - array1_length / 2))
+    if n_offsets == 0 or array1_length == 0:
+        return np.zeros(n_offsets)
+
+    weights = feature_weights(atb_weight, rtb_weight, ftb_weight, bins).astype(query.dtype)
+    pairwise = (query * weights) @ track.T
+
+    totals = np.zeros(n_offsets)
+    for i in range(min(array1_length, array2_length)):
+        span = min(n_offsets, array2_length - i)
+        totals[:span] += pairwise[i, i:i + span]
+    counts = np.minimum(array1_length, array2_length - np.arange(n_offsets))
+    return totals / counts
+
 def calculate_similarity(array1, array2, atb_weight=0.6,rtb_weight=0.2, ftb_weight=0.2):
     """
     Calculate the similarity between two arrays of sets of 3 vectors using weighted cosine similarity.
 
     Args:
-        array1 (list): First array of sets of 3 vectors (ATB, RTB, FTB).
-        array2 (list): Second array of sets of 3 vectors (ATB, RTB, FTB).
+        array1 (list, dict or np.ndarray): First array of sets of 3 vectors (ATB, RTB, FTB).
+        array2 (list, dict or np.ndarray): Second array of sets of 3 vectors (ATB, RTB, FTB).
+            A 2-D array is used as a precomputed normalize_features matrix.
         atb_weight (float): Weight for ATB similarity.
         rtb_weight (float): Weight for RTB similarity.
         ftb_weight (float): Weight for FTB similarity.
@@ -330,49 +564,282 @@ def calculate_similarity(array1, array2, atb_weight=0.6,rtb_weight=0.2, ftb_weig
     Returns:
         float: The highest similarity score between the two arrays.
     """
-    highest_similarity = 0.0
-    j = 0
-    array1_length = len(array1)
-    array2_length = len(array2)
-    for j in range(int(array2_length - array1_length/2)):
-        i = 0
-        total_similarity = 0
-        count = 0
-        while (i != array1_length and j != array2_length):
-            count += 1
-            atb_similarity = cosine_similarity(array1[i]['ATB'], array2[j]['ATB'])
-            rtb_similarity = cosine_similarity(array1[i]['RTB'], array2[j]['RTB'])
-            ftb_similarity = cosine_similarity(array1[i]['FTB'], array2[j]['FTB'])
-            total_similarity += (
-                atb_weight * atb_similarity +
-                rtb_weight * rtb_similarity +
-                ftb_weight * ftb_similarity
-            )
-            i += 1
-            j += 1
-        if (count == 0):
-            total_similarity = 0.0
-        else :
-            total_similarity /= count
-        if total_similarity > highest_similarity:
-                highest_similarity = total_similarity
-    return highest_similarity
+    scores = alignment_scores(array1, array2, atb_weight, rtb_weight, ftb_weight)
+    return max(0.0, float(scores.max())) if scores.size else 0.0
+
+def pitch_windows(pitch_sequence, window_size=20, hop_size=4):
+    """
+    Builds the 2-D window matrix of a pitch sequence without copying it.
+
+    Args:
+        pitch_sequence (list or np.ndarray): Filtered pitch values.
+        window_size (int): Number of pitches per window.
+        hop_size (int): Step between consecutive windows.
+
+    Returns:
+        np.ndarray: Read-only (n_windows, window_size) int64 view, same windows as sliding_window.
+    """
+    pitches = np.asarray(pitch_sequence, dtype=np.int64)
+    if len(pitches) < window_size:
+        return np.empty((0, window_size), dtype=np.int64)
+    return np.lib.stride_tricks.sliding_window_view(pitches, window_size)[::hop_size]
+
+def _normalize_windows(windows, min_pitch=21, max_pitch=108):
+    """
+    Batched normalize_pitches over a window matrix.
+
+    Returns:
+        tuple:
+            - np.ndarray: Normalized pitches for every window.
+            - np.ndarray: Boolean mask of windows normalize_pitches would not empty (min != max).
+    """
+    low = windows.min(axis=1, keepdims=True)
+    span = windows.max(axis=1, keepdims=True) - low
+    valid = span[:, 0] > 0
+    span[~valid] = 1
+    normalized = np.rint(min_pitch + (windows - low) * (max_pitch - min_pitch) / span).astype(np.int64)
+    return normalized, valid
+
+def _batched_histogram(values, offset, n_bins):
+    """
+    Counts values + offset into n_bins bins per row with a single bincount, ignoring out-of-range values.
+    """
+    n_windows = values.shape[0]
+    bins = values + offset
+    in_range = (bins >= 0) & (bins < n_bins)
+    flat = np.where(in_range, bins, 0) + np.arange(n_windows)[:, None] * n_bins
+    counts = np.bincount(flat.ravel(), weights=in_range.ravel().astype(np.float64), minlength=n_windows * n_bins)
+    return counts.reshape(n_windows, n_bins).astype(np.float64)
+
+def _fuzzify(histograms, n_semitones=1, fuzziness=0.5):
+    """
+    Batched fuzzy spreading shared by window_to_atb_fuzzy, window_to_rtb_fuzzy and window_to_ftb_fuzzy:
+    every bin gives (1 - |offset| * fuzziness / n_semitones) of its count to the bin at that offset.
+    """
+    n_bins = histograms.shape[1]
+    fuzzy = np.zeros_like(histograms)
+    for offset in range(-n_semitones, n_semitones + 1):
+        if abs(offset) >= n_bins:
+            continue
+        weight = 1 - abs(offset) * fuzziness / n_semitones
+        if offset >= 0:
+            fuzzy[:, offset:] += weight * histograms[:, :n_bins - offset]
+        else:
+            fuzzy[:, :offset] += weight * histograms[:, -offset:]
+    return fuzzy
+
+def _shrink_atb_batch(histograms, left=12, right=12):
+    """
+    Batched shrink_atb_histogram: gathers the bins around each window's rounded mean note
+    and folds both tails into the edge bins.
+    """
+    n_windows, n_bins = histograms.shape
+    width = left + 1 + right
+    total_weight = histograms.sum(axis=1)
+    nonempty = total_weight > 0
+    mean_note = histograms @ np.arange(n_bins, dtype=np.float64)
+    mean_note[nonempty] /= total_weight[nonempty]
+    center = np.rint(mean_note).astype(np.int64)
+
+    source = center[:, None] - left + np.arange(width)
+    in_range = (source >= 0) & (source < n_bins)
+    rows = np.arange(n_windows)[:, None]
+    shrunk = np.where(in_range, histograms[rows, np.clip(source, 0, n_bins - 1)], 0.0)
+
+    # prefix[:, k] = sum(hist[:k]), suffix[:, k] = sum(hist[k:])
+    zeros = np.zeros((n_windows, 1))
+    prefix = np.hstack([zeros, np.cumsum(histograms, axis=1)])
+    suffix = np.hstack([np.cumsum(histograms[:, ::-1], axis=1)[:, ::-1], zeros])
+    rows = np.arange(n_windows)
+    start = np.maximum(0, center - left)
+    end = np.minimum(n_bins, center + right + 1)
+    shrunk[:, 0] += prefix[rows, start]
+    shrunk[:, -1] += suffix[rows, end]
+    shrunk[~nonempty] = 0.0
+    return shrunk
+
+def _shrink_rtb_or_ftb_batch(histograms, left=12, right=12):
+    """
+    Batched shrink_rtb_or_ftb_histogram.
+    """
+    n_bins = histograms.shape[1]
+    center = n_bins // 2
+    return histograms[:, max(0, center - left):min(n_bins, center + right + 1)]
+
+@timed("histograms")
+def extract_features(pitch_sequence, window_size=40, hop_size=8, n_semitones=1, fuzziness=0.5,
+                     atb_left=12, atb_right=12, rtb_left=24, rtb_right=24):
+    """
+    Computes the shrunk ATB, RTB and FTB fuzzy histograms of every window at once.
+
+    Gives the same numbers as running normalize_pitches, convert_window_to_histograms and
+    shrink_histograms window by window, but with array operations over the whole window matrix.
+
+    Args:
+        pitch_sequence (list or np.ndarray): Filtered pitch values (no -1 entries).
+        window_size (int): Number of pitches per window.
+        hop_size (int): Step between consecutive windows.
+        n_semitones (int): Number of semitones for fuzziness.
+        fuzziness (float): Fraction of contribution to adjacent bins.
+        atb_left (int): Left range for ATB histogram.
+        atb_right (int): Right range for ATB histogram.
+        rtb_left (int): Left range for RTB and FTB histograms.
+        rtb_right (int): Right range for RTB and FTB histograms.
+
+    Returns:
+        dict: 'ATB', 'RTB' and 'FTB' float32 arrays of shape (n_windows, bins).
+    """
+    windows, valid = _normalize_windows(pitch_windows(pitch_sequence, window_size, hop_size))
+
+    atb = _batched_histogram(windows, 0, 128)
+    rtb = _batched_histogram(np.diff(windows, axis=1), 127, 255)
+    ftb = _batched_histogram(windows - windows[:, :1], 127, 255)
+    # normalize_pitches returns an empty window when all pitches are equal
+    for histograms in (atb, rtb, ftb):
+        histograms[~valid] = 0.0
+
+    features = {
+        'ATB': _shrink_atb_batch(_fuzzify(atb, n_semitones, fuzziness), atb_left, atb_right),
+        'RTB': _shrink_rtb_or_ftb_batch(_fuzzify(rtb, n_semitones, fuzziness), rtb_left, rtb_right),
+        'FTB': _shrink_rtb_or_ftb_batch(_fuzzify(ftb, n_semitones, fuzziness), rtb_left, rtb_right),
+    }
+    return {key: np.ascontiguousarray(value, dtype=np.float32) for key, value in features.items()}
+
+def features_to_windows(features):
+    """
+    Converts the array features of extract_features to the list of per-window dicts
+    used by calculate_similarity and stored in track.processed_music.
+
+    Args:
+        features (dict): 'ATB', 'RTB' and 'FTB' arrays of shape (n_windows, bins).
+
+    Returns:
+        list: One {'ATB': [...], 'RTB': [...], 'FTB': [...]} dict per window.
+    """
+    columns = [features[key].tolist() for key in FEATURE_TYPES]
+    return [dict(zip(FEATURE_TYPES, window)) for window in zip(*columns)]
+
+# Packed processed_music layout: header, then the ATB, RTB and FTB matrices in that order,
+# little-endian and row-major, zlib-compressed when FEATURES_FLAG_ZLIB is set.
+# Header: magic, version, dtype code, flags, window count, ATB/RTB/FTB bin counts.
+FEATURES_MAGIC = b'HF'
+FEATURES_VERSION = 1
+FEATURES_FLAG_ZLIB = 1
+_FEATURES_HEADER = struct.Struct('<2sBBBIHHH')
+_FEATURES_DTYPES = {2: np.dtype('<f2'), 4: np.dtype('<f4')}
+
+def encode_features(features, dtype=None, compress=True, text=True):
+    """
+    Packs extract_features arrays into the versioned binary processed_music format.
+
+    By default the arrays are stored as float16 when that is exact and as float32
+    otherwise. float16 is exact for FEATURE_PARAMS, where every bin holds a multiple of 0.5
+    well below 1024; other fuzziness values or wider windows may need float32.
+
+    Args:
+        features (dict): 'ATB', 'RTB' and 'FTB' arrays of shape (n_windows, bins).
+        dtype (np.dtype): np.float16 or np.float32 storage type, None to pick one.
+        compress (bool): zlib-compress the arrays (the histograms are mostly zeros).
+        text (bool): Return base64 text for JSON/text columns instead of raw bytes.
+
+    Returns:
+        str or bytes: Encoded features.
+    """
+    arrays = [np.asarray(features[key]) for key in FEATURE_TYPES]
+    if dtype is None:
+        exact = all(np.array_equal(values.astype(np.float16), values) for values in arrays)
+        dtype = np.float16 if exact else np.float32
+    stored = np.dtype(dtype).newbyteorder('<')
+    if stored.itemsize not in _FEATURES_DTYPES or stored.kind != 'f':
+        raise ValueError("Unsupported feature dtype {}".format(dtype))
+    n_windows = len(arrays[0])
+    payload = b''.join(np.ascontiguousarray(values, dtype=stored).tobytes() for values in arrays)
+    flags = 0
+    if compress:
+        payload = zlib.compress(payload)
+        flags |= FEATURES_FLAG_ZLIB
+    header = _FEATURES_HEADER.pack(FEATURES_MAGIC, FEATURES_VERSION, stored.itemsize, flags, n_windows,
+                                   *(values.shape[1] if values.ndim == 2 else 0 for values in arrays))
+    packed = header + payload
+    return base64.b64encode(packed).decode('ascii') if text else packed
+
+def decode_features(data, dtype=np.float32):
+    """
+    Reads the packed processed_music format straight into NumPy arrays.
+
+    Args:
+        data (str or bytes): Output of encode_features, base64 text or raw bytes.
+        dtype (np.dtype): dtype of the returned arrays.
+
+    Returns:
+        dict: 'ATB', 'RTB' and 'FTB' arrays of shape (n_windows, bins).
+    """
+    if isinstance(data, str):
+        data = base64.b64decode(data)
+    if len(data) < _FEATURES_HEADER.size:
+        raise ValueError("Not a packed feature blob")
+    magic, version, dtype_code, flags, n_windows, *bins = _FEATURES_HEADER.unpack_from(data)
+    if magic != FEATURES_MAGIC:
+        raise ValueError("Not a packed feature blob")
+    if version != FEATURES_VERSION or dtype_code not in _FEATURES_DTYPES:
+        raise ValueError("Unsupported feature format version {}".format(version))
+    payload = memoryview(data)[_FEATURES_HEADER.size:]
+    if flags & FEATURES_FLAG_ZLIB:
+        try:
+            payload = zlib.decompress(payload)
+        except zlib.error as e:
+            raise ValueError("Corrupt feature blob: {}".format(e))
+    stored = np.frombuffer(payload, dtype=_FEATURES_DTYPES[dtype_code])
+
+    features = {}
+    start = 0
+    for key, width in zip(FEATURE_TYPES, bins):
+        end = start + n_windows * width
+        features[key] = stored[start:end].reshape(n_windows, width).astype(dtype)
+        start = end
+    return features
+
+def load_features(value):
+    """
+    Returns the feature arrays of a processed_music value in any stored form.
+
+    Args:
+        value (dict, list, str or bytes): extract_features arrays, the legacy JSON list of
+            per-window dicts, or encode_features output.
+
+    Returns:
+        dict: 'ATB', 'RTB' and 'FTB' arrays of shape (n_windows, bins).
+    """
+    if isinstance(value, dict):
+        return value
+    if isinstance(value, (str, bytes)):
+        return decode_features(value)
+    if len(value) == 0:
+        return {key: np.zeros((0, width), dtype=np.float32) for key, width in zip(FEATURE_TYPES, FEATURE_BINS)}
+    return {key: np.array([window[key] for window in value], dtype=np.float64) for key in FEATURE_TYPES}
 
 # Example usage:
 # similarity_score = calculate_similarity(shrink_vector_1, shrink_vector_2)
 # print("Highest similarity score:", similarity_score)
+def process_features(path, **feature_params):
+    pitch_array, bpm, ticks_per_beat = midi_to_pitch_sequence(path)
+    filtered = pitch_array[pitch_array != -1]
+    return extract_features(filtered, **{**FEATURE_PARAMS, **feature_params})
+
+def process_features_timed(midi_blob, **feature_params):
+    """
+    process_features for a worker process. A worker's own metrics are never served, so
+    its stage timings are only collected and returned with the features.
+
+    Returns:
+        tuple: The features and a {stage: (seconds, calls)} dict for metrics.record.
+    """
+    with track_request(observe=False) as timings:
+        features = process_features(midi_blob, **feature_params)
+    return features, timings.stages
+
 def process(path):
-    pitch_array, bpm, ticks_per_beat = midi_to_pitch_array_with_tempo(path)
-    filtered = filter_pitch_array(pitch_array)
-    # print(len(filtered))
-    
-    window_size = 40
-    hop_size = 8
-    windows = sliding_window(filtered, window_size=window_size, hop_size=hop_size)
-    normalized_windows = [normalize_pitches(window) for window in windows] 
-    hists = [convert_window_to_histograms(window) for window in normalized_windows]
-    shrink_vector = [shrink_histograms(hist) for hist in hists]
-    return shrink_vector
+    return features_to_windows(process_features(path))
 
 # v1 = process("naruto.mid")
 # v2 = process("dewicut10.mid")
@@ -1,6 +1,8 @@
 import os
+import numpy as np
 # import shutil
 import backend.functions.audio as audio
+from backend.functions.topk import top_k_items
 # import backend.functions.wav_to_midi as wav_to_midi
 # from io import BytesIO
 # from tempfile import TemporaryDirectory
@@ -17,28 +19,26 @@ def build_audio_database(folderpath):
         if filename.endswith('.mid'):
             filepath = os.path.join(folderpath, filename)
             print(f"Processing MIDI file: {filename}")
-            processed_data = audio.process(filepath)
+            processed_data = audio.process(path_to_blob(filepath))
             database.append({'name': filename, 'data': processed_data})
 
     return database
 
 
 
-def audio_query(database, query_path):
+def audio_query(database, query_path, top_k=None):
     """
     1. Use process() on query_path (.mid)
-    2. Iterate through database to get each element's similarity with query, then append the result with its name to a result array
-    3. Sort the result
-    4. Return the sorted result
+    2. Iterate through database to get each element's similarity with query
+    3. Keep the top_k most similar entries in a bounded heap (all of them when top_k is None)
+    4. Return them sorted, most similar first
     """
     print(f"Processing query MIDI file: {query_path}")
-    query_data = audio.process(query_path)
-    results = []
-    for entry in database:
-        similarity_score = audio.calculate_similarity(query_data, entry['data'])
-        results.append({'name': entry['name'], 'similarity': similarity_score})
-    sorted_results = sorted(results, key=lambda x: x['similarity'], reverse=True)
-    return sorted_results
+    # normalized once, in float64 like calculate_similarity does for window lists
+    query_data = audio.normalize_features(audio.process(path_to_blob(query_path)), dtype=np.float64)
+    scored = ((audio.calculate_similarity(query_data, entry['data']), index) for index, entry in enumerate(database))
+    best = top_k_items(scored, top_k, key=lambda x: x[0])
+    return [{'name': database[index]['name'], 'similarity': similarity_score} for similarity_score, index in best]
 
 def path_to_blob(midi_path):
     """
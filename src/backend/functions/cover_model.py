@@ -0,0 +1,262 @@
+import os
+import json
+import threading
+import logging
+import numpy as np
+from backend.functions.Album_Finder import IMAGE_SIZE
+from backend.functions.topk import top_k_indices
+from backend.functions.metrics import count
+
+
+def _flip_signs(components):
+    """
+    Makes the largest coordinate of every component positive, so refits and incremental
+    updates of the same data give the same basis.
+    """
+    signs = np.sign(components[np.arange(len(components)), np.argmax(np.abs(components), axis=1)])
+    signs[signs == 0] = 1
+    return components * signs[:, None]
+
+
+class IncrementalPCA:
+    """
+    PCA whose mean and basis are updated batch by batch, without keeping the batches.
+
+    partial_fit merges a batch into the current model by taking the SVD of the old
+    components scaled by their singular values, the centered batch and a mean-correction
+    row (Ross et al., 2008), which is exact up to the components dropped along the way.
+    """
+
+    def __init__(self, n_components=16):
+        self.n_components = n_components
+        self.n_seen = 0
+        self.mean = None
+        self.components = None
+        self.singular_values = None
+
+    def fit(self, data):
+        """
+        Refits the model from scratch on all rows of data.
+        """
+        self.n_seen = 0
+        return self.partial_fit(data)
+
+    def partial_fit(self, data):
+        """
+        Updates the model with a batch of rows, shape (n, d).
+        """
+        data = np.asarray(data, dtype=np.float64)
+        if len(data) == 0:
+            return self
+        batch_mean = data.mean(axis=0)
+        if self.n_seen == 0:
+            mean = batch_mean
+            stacked = data - batch_mean
+        else:
+            n_total = self.n_seen + len(data)
+            mean = (self.n_seen * self.mean + len(data) * batch_mean) / n_total
+            correction = np.sqrt(self.n_seen * len(data) / n_total) * (self.mean - batch_mean)
+            stacked = np.vstack([self.singular_values[:, None] * self.components, data - batch_mean, correction])
+
+        _, S, Vt = np.linalg.svd(stacked, full_matrices=False)
+        self.components = _flip_signs(Vt[:self.n_components])
+        self.singular_values = S[:self.n_components]
+        self.mean = mean
+        self.n_seen += len(data)
+        return self
+
+    def transform(self, data):
+        """
+        Projects rows of data onto the components, shape (n, k).
+        """
+        return (np.asarray(data, dtype=np.float64) - self.mean) @ self.components.T
+
+
+class CoverCatalog:
+    """
+    One PCA space shared by every album cover of the catalog.
+
+    Each new playlist's covers update the model incrementally; every refit_every playlists
+    the model is refitted on all covers, which are kept as flattened image_shape vectors. All
+    stored covers are projected into the current space, so a query needs one projection
+    and one nearest-neighbour search, and distances are comparable across playlists.
+
+    The catalog file at path is written by the caller, on refits and at shutdown; playlists
+    added since the last save are backfilled from their own models on the next start.
+    """
+
+    def __init__(self, n_components=16, refit_every=20, path=None, image_shape=IMAGE_SIZE):
+        self.n_components = n_components
+        self.refit_every = refit_every
+        self.path = path
+        self.image_shape = tuple(image_shape)
+        self.dimension = self.image_shape[0] * self.image_shape[1]
+        self._lock = threading.Lock()
+        self.model = IncrementalPCA(n_components)
+        self.vectors = np.zeros((0, self.dimension), dtype=np.float32)
+        self.projections = np.zeros((0, 0))
+        self.tracks = []
+        self.playlist_ids = set()
+        self.updates = 0
+        self.dirty = False
+
+    def __len__(self):
+        return len(self.tracks)
+
+    def _append(self, playlist, track_rows, vectors):
+        self.vectors = vectors if len(self.vectors) == 0 else np.concatenate([self.vectors, vectors])
+        self.dirty = True
+        for track in track_rows:
+            self.tracks.append({
+                'playlist_id': playlist['id'],
+                'playlist_name': playlist['name'],
+                'image_idx': track['image_idx'],
+                'image_url': track['image_url'],
+                'music_url': track['music_url'],
+                'name': track['name'],
+            })
+        self.playlist_ids.add(playlist['id'])
+
+    def check_covers(self, covers):
+        """
+        Raises ValueError unless covers are (N, m, n) at the catalog's image_shape. Called
+        before a playlist is written, so a mismatch never leaves it half added.
+        """
+        shape = tuple(np.shape(covers)[1:])
+        if shape != self.image_shape:
+            raise ValueError(f"Covers of shape {shape} do not match the global image model's {self.image_shape}")
+
+    def add_playlist(self, playlist, track_rows, covers):
+        """
+        Adds a playlist's covers and updates the shared model.
+
+        Args:
+            playlist (dict): {'id', 'name'} of the playlist.
+            track_rows (list of dict): Track rows with 'image_idx', 'image_url', 'music_url' and 'name'.
+            covers (np.ndarray): Resized grayscale covers in track order, shape (N, m, n).
+
+        Returns:
+            bool: Whether the model was refitted on all covers, a good time to save it.
+        """
+        self.check_covers(covers)
+        vectors = np.asarray(covers, dtype=np.float32).reshape(len(covers), -1)
+        with self._lock:
+            self._append(playlist, track_rows, vectors)
+            self.updates += 1
+            refitted = bool(self.refit_every and self.updates % self.refit_every == 0)
+            if refitted:
+                self.model.fit(self.vectors)
+            else:
+                self.model.partial_fit(vectors)
+            self.projections = self.model.transform(self.vectors)
+        return refitted
+
+    def refit(self):
+        """
+        Refits the model on every stored cover.
+        """
+        with self._lock:
+            self.model = IncrementalPCA(self.n_components).fit(self.vectors)
+            self.projections = self.model.transform(self.vectors)
+
+    def backfill(self, records):
+        """
+        Adds stored playlists missing from the catalog, then refits.
+
+        The covers themselves are not stored, so they are rebuilt from each playlist's own
+        model as myu + projections @ Uk.T, the best rank-k approximation that model kept.
+        """
+        added = 0
+        with self._lock:
+            for record in records:
+                if record['id'] in self.playlist_ids or not record['track']:
+                    continue
+                myu = np.array(record['myu'], dtype=np.float64).reshape(-1)
+                projections = np.array(record['projections'], dtype=np.float64)
+                if len(projections) != len(record['track']) or len(myu) != self.dimension:
+                    continue
+                vectors = (myu + projections @ np.array(record['uk'], dtype=np.float64).T).astype(np.float32)
+                track_rows = sorted(record['track'], key=lambda track: track['image_idx'])
+                self._append({'id': record['id'], 'name': record['name']}, track_rows, vectors)
+                added += 1
+        if added:
+            self.refit()
+        return added
+
+    def search(self, query_vector, top_k):
+        """
+        Returns the top_k closest covers of the catalog, closest first, in the
+        /query-by-image result format.
+        """
+        with self._lock:
+            model, projections, tracks = self.model, self.projections, self.tracks
+        if not tracks:
+            return []
+        distances = np.linalg.norm(projections - model.transform(query_vector[None, :]), axis=1)
+        count('tracks_scored_total', len(distances), index='cover_catalog')
+        max_distance = np.max(distances)
+        best = top_k_indices(distances, top_k, largest=False)
+        results = []
+        for i in best:
+            track = tracks[i]
+            similarity_percentage = (1 - distances[i] / max_distance) * 100 if max_distance else 100.0
+            results.append({
+                'distance': float(distances[i]),
+                'similarity_percentage': round(float(similarity_percentage), 2),
+                'playlist_id': track['playlist_id'],
+                'playlist_name': track['playlist_name'],
+                'track_idx': track['image_idx'],
+                'image_url': track['image_url'],
+                'music_url': track['music_url'],
+                'track_name': track['name']
+            })
+        return results
+
+    def save(self, path):
+        """
+        Writes the covers, model and track metadata to an .npz file.
+        """
+        with self._lock:
+            state = {
+                'vectors': self.vectors,
+                'mean': self.model.mean if self.model.mean is not None else np.zeros(0),
+                'components': self.model.components if self.model.components is not None else np.zeros((0, 0)),
+                'singular_values': self.model.singular_values if self.model.singular_values is not None else np.zeros(0),
+                'n_seen': np.array(self.model.n_seen),
+                'updates': np.array(self.updates),
+                'tracks': np.array(json.dumps(self.tracks)),
+            }
+            self.dirty = False
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(tmp_path, **state)
+        os.replace(tmp_path, path)
+
+    def load(self, path):
+        """
+        Restores a catalog written by save. Returns False when the file does not exist or
+        holds covers of another image_shape, which are left to be backfilled and refitted.
+        """
+        if not os.path.exists(path):
+            return False
+        with np.load(path) as state:
+            if state['vectors'].shape[1] != self.dimension:
+                logging.warning("Ignoring %s: its covers have %d pixels, not %d", path, state['vectors'].shape[1], self.dimension)
+                return False
+            model = IncrementalPCA(self.n_components)
+            model.n_seen = int(state['n_seen'])
+            if model.n_seen:
+                model.mean = state['mean']
+                model.components = state['components']
+                model.singular_values = state['singular_values']
+            tracks = json.loads(str(state['tracks']))
+            vectors = state['vectors']
+            updates = int(state['updates'])
+        with self._lock:
+            self.model = model
+            self.vectors = vectors
+            self.tracks = tracks
+            self.playlist_ids = {track['playlist_id'] for track in tracks}
+            self.updates = updates
+            self.dirty = False
+            self.projections = model.transform(vectors) if model.n_seen else np.zeros((0, 0))
+        return True
@@ -0,0 +1,165 @@
+import os
+import io
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+from backend.functions.audio import FEATURE_PARAMS, process_features, encode_features, decode_features
+
+
+class FeatureCache:
+    """
+    Content-addressed cache of audio.process_features results.
+
+    Entries are keyed by a SHA-256 of the MIDI bytes and the feature parameters. A bounded
+    in-memory LRU tier sits in front of an optional on-disk tier of packed feature files
+    (audio.encode_features, float32) that evicts least recently used files once it grows
+    past disk_max_bytes.
+    """
+
+    def __init__(self, max_entries=256, disk_dir=None, disk_max_bytes=256 * 2**20):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._disk = OrderedDict()
+        self._disk_bytes = 0
+        self.hits = self.memory_hits = self.disk_hits = self.misses = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self._scan_disk()
+
+    def _scan_disk(self):
+        entries = []
+        for name in os.listdir(self.disk_dir):
+            if name.endswith('.hf'):
+                path = os.path.join(self.disk_dir, name)
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, name[:-3], stat.st_size))
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_bytes += size
+
+    def _path(self, key):
+        return os.path.join(self.disk_dir, key + '.hf')
+
+    @staticmethod
+    def key(midi_bytes, **feature_params):
+        params = {**FEATURE_PARAMS, **feature_params}
+        digest = hashlib.sha256(midi_bytes)
+        digest.update(json.dumps(params, sort_keys=True).encode('utf-8'))
+        return digest.hexdigest()
+
+    def _remember(self, key, features):
+        self._memory[key] = features
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key):
+        """
+        Returns the cached features for key, or None. Disk hits are promoted to memory.
+        """
+        with self._lock:
+            features = self._memory.get(key)
+            if features is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                self.memory_hits += 1
+                return features
+            if key not in self._disk:
+                self.misses += 1
+                return None
+            self._disk.move_to_end(key)
+
+        try:
+            path = self._path(key)
+            with open(path, 'rb') as f:
+                features = decode_features(f.read())
+            os.utime(path)
+        except (OSError, ValueError):
+            with self._lock:
+                self._forget_disk(key)
+                self.misses += 1
+            return None
+
+        features = self._freeze(features)
+        with self._lock:
+            self._remember(key, features)
+            self.hits += 1
+            self.disk_hits += 1
+        return features
+
+    def _forget_disk(self, key):
+        size = self._disk.pop(key, None)
+        if size is not None:
+            self._disk_bytes -= size
+
+    @staticmethod
+    def _freeze(features):
+        # cached arrays are shared between callers
+        for values in features.values():
+            values.flags.writeable = False
+        return features
+
+    def put(self, key, features):
+        features = self._freeze(features)
+        with self._lock:
+            self._remember(key, features)
+        if not self.disk_dir:
+            return
+
+        packed = encode_features(features, dtype=np.float32, text=False)
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(packed)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._forget_disk(key)
+            self._disk[key] = len(packed)
+            self._disk_bytes += len(packed)
+            while self._disk_bytes > self.disk_max_bytes and len(self._disk) > 1:
+                old_key, size = self._disk.popitem(last=False)
+                self._disk_bytes -= size
+                try:
+                    os.remove(self._path(old_key))
+                except OSError:
+                    pass
+
+    def process(self, midi_blob, **feature_params):
+        """
+        Cached audio.process_features.
+
+        Args:
+            midi_blob (bytes or io.BytesIO): MIDI data in a binary blob.
+            **feature_params: extract_features parameters overriding audio.FEATURE_PARAMS.
+
+        Returns:
+            dict: Read-only 'ATB', 'RTB' and 'FTB' arrays.
+        """
+        if isinstance(midi_blob, io.BytesIO):
+            midi_blob = midi_blob.read()
+        key = self.key(midi_blob, **feature_params)
+        features = self.get(key)
+        if features is None:
+            features = process_features(midi_blob, **feature_params)
+            self.put(key, features)
+        return features
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'memory_entries': len(self._memory),
+                'disk_entries': len(self._disk),
+                'disk_bytes': self._disk_bytes,
+            }
@@ -0,0 +1,465 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from backend.functions.audio import FEATURE_BINS, normalize_features, feature_weights
+from backend.functions.topk import top_k_indices
+from backend.functions.metrics import count, span
+
+TRACK_COLUMNS = "id, name, image_url, music_url, image_idx, processed_music, playlist(id, name)"
+# The pruning bound basis is refitted each time the index doubles, until it was fitted on
+# this many tracks, from at most BOUND_SAMPLE_WINDOWS of their windows
+BOUND_SAMPLE_TRACKS = 2000
+BOUND_SAMPLE_WINDOWS = 50_000
+
+
+def _grow(buffer, needed):
+    """
+    Returns buffer, or a copy with doubled capacity when it cannot hold `needed` rows.
+    Rows already handed out to readers are never written again, so old buffers stay valid.
+    """
+    if needed <= len(buffer):
+        return buffer
+    capacity = max(needed, 2 * len(buffer), 64)
+    grown = np.zeros((capacity,) + buffer.shape[1:], dtype=buffer.dtype)
+    grown[:len(buffer)] = buffer
+    return grown
+
+
+def score_windows(weighted_query, block, track_offsets):
+    """
+    Best alignment score (see audio.alignment_scores) of every track in a block of windows,
+    computed over the whole block at once: window g gets the mean of query window i against
+    window g + i while g + i stays inside the same track.
+
+    Args:
+        weighted_query (np.ndarray): normalize_features query rows multiplied by feature_weights.
+        block (np.ndarray): normalize_features rows of consecutive tracks.
+        track_offsets (np.ndarray): Track t owns block[track_offsets[t]:track_offsets[t + 1]].
+
+    Returns:
+        np.ndarray: calculate_similarity(query, track) for each track of the block.
+    """
+    if len(weighted_query) == 0 or len(block) == 0:
+        return np.zeros(len(track_offsets) - 1)
+    return best_alignments(weighted_query @ block.T, track_offsets)
+
+
+def best_alignments(pairwise, track_offsets):
+    """
+    Best alignment score of every track from a (query window, block window) score matrix,
+    as in score_windows. Any elementwise upper bound of the matrix gives upper bounds.
+    """
+    n_query, n_block = pairwise.shape
+    lengths = np.diff(track_offsets)
+    scores = np.zeros(len(lengths))
+    if n_query == 0 or n_block == 0:
+        return scores
+
+    owner = np.repeat(np.arange(len(lengths)), lengths)
+    local = np.arange(n_block) - track_offsets[owner]
+    remaining = lengths[owner] - local
+
+    totals = np.zeros(n_block)
+    for i in range(min(n_query, n_block)):
+        totals[:n_block - i] += np.where(remaining[:n_block - i] > i, pairwise[i, i:], 0.0)
+    means = totals / np.minimum(n_query, remaining)
+    # offsets run over range(int(length - n_query / 2)), as in calculate_similarity
+    valid = local < np.trunc(lengths[owner] - n_query / 2)
+    means = np.where(valid, means, 0.0)
+
+    nonempty = lengths > 0
+    scores[nonempty] = np.maximum.reduceat(means, track_offsets[:-1][nonempty])
+    return np.maximum(scores, 0.0)
+
+
+def fit_bound_basis(windows, rank):
+    """
+    Orthonormal basis (d, rank) of the leading right singular vectors of windows, padded
+    with zero columns when windows have lower rank. Any orthonormal basis gives valid
+    bounds (see low_rank_windows); a good one gives tight bounds.
+    """
+    basis = np.zeros((windows.shape[1], rank), dtype=np.float32)
+    if len(windows):
+        _, _, Vt = np.linalg.svd(np.asarray(windows, dtype=np.float64), full_matrices=False)
+        basis[:, :min(rank, len(Vt))] = Vt[:rank].T
+    return basis
+
+
+def low_rank_windows(windows, basis):
+    """
+    Coordinates of windows in basis and the norm of what the basis leaves out.
+
+    For any two vectors q and t, q . t <= (q V) . (t V) + |q - q V V^T| * |t - t V V^T|
+    (Cauchy-Schwarz on the orthogonal remainders), so a (n_query, n_windows) score bound
+    costs a rank-sized matrix product instead of a feature-sized one.
+    """
+    windows = np.asarray(windows, dtype=np.float32)
+    low = windows @ basis
+    residuals = np.sqrt(np.maximum((windows * windows).sum(axis=1) - (low * low).sum(axis=1), 0.0))
+    return low, residuals
+
+
+class HummingIndex:
+    """
+    Process-resident index of every stored track's humming features.
+
+    All track windows live in one contiguous float32 matrix of normalize_features rows;
+    track t owns rows offsets[t]:offsets[t + 1]. Display metadata is kept in parallel lists
+    and only read for the top-k results of a search.
+
+    With an optional WindowLSH, searches only score the tracks whose windows collide with
+    the query's windows, and fall back to exhaustive scoring when that leaves fewer than
+    top_k candidates.
+
+    With prune, searches stay exact but first bound every track's score with best_alignments
+    over a low_rank_windows bound of the score matrix (bound_rank coordinates per window,
+    stored at add_track; the basis is refitted as the index grows, see BOUND_SAMPLE_TRACKS),
+    then score tracks exactly in decreasing bound order and stop once
+    the k-th best exact score is above every remaining bound. stats counts scored and
+    pruned tracks.
+
+    With workers > 1, the tracks to search are split into that many shards of about the
+    same number of windows, scored on a thread pool (NumPy releases the GIL in the matrix
+    products and elementwise passes), and the shards' local top-k lists are merged.
+    """
+
+    def __init__(self, window_budget=1 << 16, lsh=None, prune=False, bound_rank=64, workers=1):
+        self.window_budget = window_budget
+        self.lsh = lsh
+        self.prune = prune
+        self.bound_rank = bound_rank
+        self.bound_basis = None
+        self._basis_tracks = 0  # tracks indexed when bound_basis was fitted
+        self.workers = workers
+        self._executor = None
+        self._lock = threading.Lock()
+        self.stats = {'searches': 0, 'tracks_scored': 0, 'tracks_pruned': 0}
+        self._reset()
+
+    def _reset(self):
+        self._windows = np.zeros((0, sum(FEATURE_BINS)), dtype=np.float32)
+        self._low = np.zeros((0, self.bound_rank), dtype=np.float32)
+        self._residuals = np.zeros(0, dtype=np.float32)
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self._n_tracks = 0
+        self.metadata = []
+
+    def __len__(self):
+        return self._n_tracks
+
+    @property
+    def n_windows(self):
+        return int(self._offsets[self._n_tracks])
+
+    def add_track(self, track, features):
+        """
+        Appends one track.
+
+        Args:
+            track (dict): Track row with 'id', 'name', 'image_url', 'music_url', 'image_idx'
+                and 'playlist' ({'id', 'name'}).
+            features (dict, list, str or np.ndarray): Any processed_music form accepted by
+                audio.load_features, or a normalize_features matrix.
+        """
+        windows = features if isinstance(features, np.ndarray) else normalize_features(features)
+        with self._lock:
+            start = self.n_windows
+            end = start + len(windows)
+            self._windows = _grow(self._windows, end)
+            self._windows[start:end] = windows
+            self._offsets = _grow(self._offsets, self._n_tracks + 2)
+            self._offsets[self._n_tracks + 1] = end
+            if self.prune:
+                self._low = _grow(self._low, end)
+                self._residuals = _grow(self._residuals, end)
+                n_tracks = self._n_tracks + 1
+                if self.bound_basis is None or (self._basis_tracks < BOUND_SAMPLE_TRACKS and n_tracks >= 2 * self._basis_tracks):
+                    self._refit_bound_basis(end, n_tracks)
+                else:
+                    self._low[start:end], self._residuals[start:end] = low_rank_windows(windows, self.bound_basis)
+            if self.lsh is not None:
+                self.lsh.add(self._n_tracks, windows)
+            self.metadata.append({
+                'id': track.get('id'),
+                'name': track['name'],
+                'image_url': track['image_url'],
+                'music_url': track['music_url'],
+                'image_idx': track['image_idx'],
+                'playlist_id': track['playlist']['id'],
+                'playlist_name': track['playlist']['name'],
+            })
+            self._n_tracks += 1
+
+    def _refit_bound_basis(self, n_windows, n_tracks, seed=0):
+        """
+        Refits the bound basis on a sample of the first n_windows rows and recomputes their
+        bound coordinates into new arrays, as searches may still read the old ones.
+        Called with the lock held.
+        """
+        windows = self._windows[:n_windows]
+        sample = windows
+        if n_windows > BOUND_SAMPLE_WINDOWS:
+            sample = windows[np.sort(np.random.default_rng(seed).choice(n_windows, BOUND_SAMPLE_WINDOWS, replace=False))]
+        basis = fit_bound_basis(sample, self.bound_rank)
+        low = np.zeros_like(self._low)
+        residuals = np.zeros_like(self._residuals)
+        low[:n_windows], residuals[:n_windows] = low_rank_windows(windows, basis)
+        self.bound_basis, self._low, self._residuals = basis, low, residuals
+        self._basis_tracks = n_tracks
+
+    def load(self, tracks):
+        """
+        Replaces the index content with track rows that carry their 'processed_music'.
+        """
+        fresh = HummingIndex(self.window_budget, self.lsh.empty() if self.lsh is not None else None,
+                             self.prune, self.bound_rank, workers=1)
+        if self.prune:
+            fresh.bound_basis = self._sample_basis(tracks)
+            fresh._basis_tracks = len(tracks)
+        for track in tracks:
+            fresh.add_track(track, track['processed_music'])
+        with self._lock:
+            self.lsh = fresh.lsh
+            self._windows = fresh._windows
+            self.bound_basis = fresh.bound_basis
+            self._basis_tracks = fresh._basis_tracks
+            self._low = fresh._low
+            self._residuals = fresh._residuals
+            self._offsets = fresh._offsets
+            self.metadata = fresh.metadata
+            self._n_tracks = fresh._n_tracks
+
+    def _sample_basis(self, tracks, sample_tracks=2000, seed=0):
+        """
+        Bound basis fitted on the windows of up to sample_tracks random tracks.
+        """
+        rng = np.random.default_rng(seed)
+        picked = rng.permutation(len(tracks))[:sample_tracks]
+        sample = [normalize_features(tracks[i]['processed_music']) for i in picked]
+        return fit_bound_basis(np.concatenate(sample) if sample else np.zeros((0, sum(FEATURE_BINS))), self.bound_rank)
+
+    def refresh(self, supabase, page_size=1000):
+        """
+        Reloads the whole index from the track table, page by page.
+        """
+        tracks = []
+        start = 0
+        while True:
+            page = supabase.table("track").select(TRACK_COLUMNS) \
+                .order("id") \
+                .range(start, start + page_size - 1) \
+                .execute()
+            tracks.extend(page.data)
+            if len(page.data) < page_size:
+                break
+            start += page_size
+        self.load(tracks)
+        return len(self)
+
+    def _snapshot(self):
+        with self._lock:
+            n_tracks = self._n_tracks
+            offsets = self._offsets[:n_tracks + 1]
+            n_windows = offsets[-1]
+            return self._windows[:n_windows], offsets, (self.bound_basis, self._low[:n_windows], self._residuals[:n_windows])
+
+    def _blocks(self, offsets, tracks):
+        """
+        Splits track positions into (tracks, window indices, block offsets) groups of about
+        window_budget windows. Contiguous positions are read as slices, others are gathered.
+        """
+        if tracks is None:
+            tracks = np.arange(len(offsets) - 1)
+        # a run of consecutive positions (e.g. a shard) is read as slices too
+        contiguous = len(tracks) == 0 or (tracks[-1] - tracks[0] == len(tracks) - 1 and bool(np.all(np.diff(tracks) == 1)))
+        lengths = offsets[tracks + 1] - offsets[tracks]
+        ends = np.cumsum(lengths)
+        first = 0
+        while first < len(tracks):
+            # at least one track per block, then as many as fit in the window budget
+            last = int(np.searchsorted(ends, ends[first] - lengths[first] + self.window_budget, side='right'))
+            last = min(len(tracks), max(first + 1, last))
+            group = tracks[first:last]
+            block_offsets = np.concatenate([[0], np.cumsum(lengths[first:last])])
+            if contiguous:
+                rows = slice(offsets[group[0]], offsets[group[-1] + 1])
+            else:
+                rows = np.repeat(offsets[group] - block_offsets[:-1], lengths[first:last]) + np.arange(block_offsets[-1])
+            yield first, last, rows, block_offsets
+            first = last
+
+    def scores(self, query, tracks=None, atb_weight=0.6, rtb_weight=0.2, ftb_weight=0.2):
+        """
+        Scores the query against indexed tracks.
+
+        Args:
+            query (dict, list or np.ndarray): Query windows in any form accepted by calculate_similarity.
+            tracks (np.ndarray): Track positions to score, all tracks when None.
+
+        Returns:
+            np.ndarray: calculate_similarity(query, track) for each scored track.
+        """
+        windows, offsets, _ = self._snapshot()
+        query = query if isinstance(query, np.ndarray) else normalize_features(query)
+        weighted_query = (query * feature_weights(atb_weight, rtb_weight, ftb_weight)).astype(np.float32)
+        if tracks is not None:
+            tracks = np.asarray(tracks, dtype=np.int64)
+        return self._score(weighted_query, windows, offsets, tracks)
+
+    def _score(self, weighted_query, windows, offsets, tracks):
+        scores = np.zeros(len(offsets) - 1 if tracks is None else len(tracks))
+        for first, last, rows, block_offsets in self._blocks(offsets, tracks):
+            scores[first:last] = score_windows(weighted_query, windows[rows], block_offsets)
+        return scores
+
+    def upper_bounds(self, weighted_query, bounds_data, offsets, tracks):
+        """
+        An upper bound of every track's score, never below its exact score.
+        """
+        basis, low, residuals = bounds_data
+        query_low, query_residuals = low_rank_windows(weighted_query, basis)
+        bounds = np.zeros(len(offsets) - 1 if tracks is None else len(tracks))
+        if len(weighted_query) == 0:
+            return bounds
+        for first, last, rows, block_offsets in self._blocks(offsets, tracks):
+            pairwise = query_low @ low[rows].T + query_residuals[:, None] * residuals[rows][None, :]
+            bounds[first:last] = best_alignments(pairwise, block_offsets)
+        # float32 rounding differs between the bound and the exact score, keep a margin
+        return bounds * (1 + 1e-4) + 1e-5
+
+    def _pruned_search(self, query, tracks, top_k, weights):
+        """
+        Exact top_k positions and scores among tracks (all when None), scoring tracks in
+        decreasing bound order until no remaining bound can beat the k-th best score.
+        """
+        windows, offsets, bounds_data = self._snapshot()
+        if top_k <= 0 or len(offsets) == 1:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        weighted_query = (query * feature_weights(*weights)).astype(np.float32)
+        bounds = self.upper_bounds(weighted_query, bounds_data, offsets, tracks)
+        if tracks is None:
+            tracks = np.arange(len(offsets) - 1)
+        order = np.argsort(-bounds, kind='stable')
+
+        scored, scores = [], []
+        best = np.zeros(0)
+        start = 0
+        batch = max(4 * top_k, 64)
+        while start < len(order):
+            # a remaining track could at most tie the k-th score, ties go by position, keep going
+            if len(best) >= top_k and best[top_k - 1] > bounds[order[start]]:
+                break
+            chunk = np.sort(order[start:start + batch])
+            scored.append(chunk)
+            scores.append(self._score(weighted_query, windows, offsets, tracks[chunk]))
+            best = np.sort(np.concatenate([best, scores[-1]]))[::-1][:top_k]
+            start += len(chunk)
+            batch *= 2
+
+        with self._lock:
+            self.stats['tracks_scored'] += start
+            self.stats['tracks_pruned'] += len(order) - start
+        count('tracks_scored_total', start, index='humming')
+        if not scored:
+            return tracks[:0], np.zeros(0)
+        scored = np.concatenate(scored)
+        scores = np.concatenate(scores)
+        # scored positions are in bound order; rank by score, then by position like a stable sort
+        ranked = np.lexsort((tracks[scored], -scores))[:top_k]
+        return tracks[scored[ranked]], scores[ranked]
+
+    def candidates(self, query, top_k):
+        """
+        Track positions worth scoring exactly for a top_k search, or None for all of them.
+        """
+        # candidates fills the LSH's bucket array cache and add_track appends to its buckets,
+        # so both run under the lock; this also keeps every candidate inside the next snapshot
+        with self._lock:
+            if self.lsh is None:
+                return None
+            found = self.lsh.candidates(query)
+        return found if len(found) >= top_k else None
+
+    def result(self, position, similarity):
+        """
+        Joins one scored track with its display metadata, in the /query-by-humming result format.
+        """
+        track = self.metadata[position]
+        return {
+            'distance': 1 - similarity,
+            'similarity_percentage': round(similarity * 100, 2),
+            'playlist_id': track['playlist_id'],
+            'playlist_name': track['playlist_name'],
+            'track_idx': track['image_idx'],
+            'image_url': track['image_url'],
+            'music_url': track['music_url'],
+            'track_name': track['name']
+        }
+
+    def _search_tracks(self, query, tracks, top_k, weights):
+        """
+        Exact top_k positions and scores among tracks (all when None), best first.
+        """
+        if self.prune:
+            return self._pruned_search(query, tracks, top_k, weights)
+        scores = self.scores(query, tracks, *weights)
+        with self._lock:
+            self.stats['tracks_scored'] += len(scores)
+        count('tracks_scored_total', len(scores), index='humming')
+        if tracks is None:
+            tracks = np.arange(len(scores))
+        best = top_k_indices(scores, top_k)
+        return tracks[best], scores[best]
+
+    def _shards(self, tracks):
+        """
+        Splits track positions (all when None) into up to self.workers runs holding about
+        the same number of windows.
+        """
+        _, offsets, _ = self._snapshot()
+        if tracks is None:
+            tracks = np.arange(len(offsets) - 1)
+        windows_before = np.cumsum(offsets[tracks + 1] - offsets[tracks])
+        targets = windows_before[-1] * np.arange(1, self.workers) / self.workers if len(tracks) else []
+        cuts = np.searchsorted(windows_before, targets, side='right')
+        return [shard for shard in np.split(tracks, cuts) if len(shard)]
+
+    def close(self):
+        """
+        Stops the shard worker threads; a later sharded search starts new ones.
+        """
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown()
+
+    def _sharded_search(self, query, tracks, top_k, weights):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='humming')
+            executor = self._executor
+        shards = self._shards(tracks)
+        local = list(executor.map(lambda shard: self._search_tracks(query, shard, top_k, weights), shards))
+        if not local:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        positions = np.concatenate([p for p, _ in local])
+        scores = np.concatenate([s for _, s in local])
+        # same order as one exhaustive pass: by score, then by position
+        best = np.lexsort((positions, -scores))[:top_k]
+        return positions[best], scores[best]
+
+    def search(self, query, top_k, atb_weight=0.6, rtb_weight=0.2, ftb_weight=0.2):
+        """
+        Returns the top_k most similar tracks, best first.
+        """
+        query = query if isinstance(query, np.ndarray) else normalize_features(query)
+        tracks = self.candidates(query, top_k)
+        weights = (atb_weight, rtb_weight, ftb_weight)
+        with self._lock:
+            self.stats['searches'] += 1
+        with span("humming_search"):
+            if self.workers > 1:
+                positions, scores = self._sharded_search(query, tracks, top_k, weights)
+            else:
+                positions, scores = self._search_tracks(query, tracks, top_k, weights)
+        return [self.result(int(p), float(s)) for p, s in zip(positions, scores)]
@@ -0,0 +1,372 @@
+import json
+import time
+import logging
+import threading
+import numpy as np
+from backend.functions.Album_Finder import IMAGE_SIZE, decode_image, turn_to_1D
+from backend.functions.topk import top_k_indices
+from backend.functions.metrics import count
+
+
+def _grow(buffer, needed):
+    """
+    Returns buffer, or a copy with room for at least needed rows (doubling) when it is smaller.
+    """
+    if len(buffer) >= needed:
+        return buffer
+    grown = np.zeros((max(needed, 2 * len(buffer)),) + buffer.shape[1:], dtype=buffer.dtype)
+    grown[:len(buffer)] = buffer
+    return grown
+
+
+def _widen(buffer, k):
+    """
+    Returns buffer with its last axis zero-padded to k columns.
+    """
+    widened = np.zeros(buffer.shape[:-1] + (k,), dtype=buffer.dtype)
+    widened[..., :buffer.shape[-1]] = buffer
+    return widened
+
+
+def _decode_record(record):
+    """
+    The (shape, flattened myu, uk, projections, tracks) of a playlist row, or None when its
+    projections do not match its tracks.
+    """
+    projections = np.asarray(record['projections'], dtype=np.float64)
+    tracks = record['track']
+    if 'image_idx' in (tracks[0] if tracks else {}):
+        tracks = sorted(tracks, key=lambda track: track['image_idx'])
+    if len(projections) != len(tracks):
+        print(f"Skipping playlist {record['id']}: Mismatch between distances ({len(projections)}) and tracks ({len(tracks)})")
+        return None
+    if projections.size == 0:
+        print(f"Skipping playlist {record['id']}: Empty distances array")
+        return None
+    myu = np.asarray(record['myu'], dtype=np.float64)
+    shape = myu.shape if myu.ndim == 2 else IMAGE_SIZE
+    return shape, myu.reshape(-1), np.asarray(record['uk'], dtype=np.float64), projections, tracks
+
+
+class ImageIndex:
+    """
+    The album-cover PCA models of many playlists, stacked for one batched query.
+
+    Playlists are grouped by the resolution (m, n) of their model. Within a group, playlist
+    p keeps its mean image in myu[p] and its basis in uk[p]; bases with fewer components
+    than the widest one are padded with zero columns, which leaves every distance unchanged.
+    The projections of all tracks are concatenated, track t belongs to playlist owner[t],
+    and a playlist's tracks are consecutive.
+
+    An index is never modified: extended and without return new ones. The arrays are views
+    of buffers with spare rows, so extending the latest index of a chain writes past the
+    rows it reads and only copies when a buffer is full.
+    """
+
+    def __init__(self, buffers=None, sizes=None, owner=None, playlists=None, tracks=None, where=None):
+        self._buffers = buffers or {}
+        self._sizes = sizes or {}
+        self._owner = owner if owner is not None else np.zeros(0, dtype=np.int64)
+        self.playlists = playlists or []
+        self.tracks = tracks or []
+        # group and first group row of every playlist
+        self._where = where or []
+        self._head = [self]
+        self.owner = self._owner[:len(self.tracks)]
+        self.groups = {}
+        for shape, buffer in self._buffers.items():
+            n_playlists, n_rows = self._sizes[shape]
+            if n_playlists:
+                self.groups[shape] = {key: buffer[key][:n_playlists if key in ('myu', 'uk') else n_rows] for key in buffer}
+        self.starts = np.flatnonzero(np.r_[True, self.owner[1:] != self.owner[:-1]]) if len(self.owner) else self.owner
+
+    def __len__(self):
+        return len(self.tracks)
+
+    @property
+    def shapes(self):
+        return list(self.groups)
+
+    @property
+    def ids(self):
+        return {playlist['id'] for playlist in self.playlists}
+
+    @property
+    def nbytes(self):
+        """
+        Bytes held by the index arrays, spare rows included.
+        """
+        return sum(array.nbytes for buffer in self._buffers.values() for array in buffer.values()) + self._owner.nbytes
+
+    @classmethod
+    def from_records(cls, records):
+        """
+        Builds the index from playlist rows with 'id', 'name', 'myu', 'uk', 'projections'
+        and their 'track' rows. Playlists whose projections do not match their tracks are skipped.
+        """
+        return cls().extended(records)
+
+    def extended(self, records):
+        """
+        A new index with the playlists of records (as in from_records) appended. Callers
+        serialize the calls on one chain of indexes, as ImageModelCache does.
+        """
+        in_place = self._head[0] is self
+        if in_place:
+            buffers = {shape: dict(buffer) for shape, buffer in self._buffers.items()}
+            owner = self._owner
+        else:
+            buffers = {shape: {key: np.array(view) for key, view in group.items()} for shape, group in self.groups.items()}
+            owner = self.owner.copy()
+        sizes = dict(self._sizes)
+        playlists, tracks, where = list(self.playlists), list(self.tracks), list(self._where)
+
+        for record in records:
+            decoded = _decode_record(record)
+            if decoded is None:
+                continue
+            shape, myu, uk, projections, record_tracks = decoded
+            k, n = uk.shape[1], len(record_tracks)
+            if shape not in buffers:
+                buffers[shape] = {
+                    'myu': np.zeros((1, len(myu))),
+                    'uk': np.zeros((1, len(myu), k)),
+                    'projections': np.zeros((n, k)),
+                    'owner': np.zeros(n, dtype=np.int64),
+                    'rows': np.zeros(n, dtype=np.int64),
+                }
+            buffer = buffers[shape]
+            n_playlists, n_rows = sizes.get(shape, (0, 0))
+            if buffer['uk'].shape[2] < k:
+                buffer['uk'] = _widen(buffer['uk'], k)
+                buffer['projections'] = _widen(buffer['projections'], k)
+            buffer['myu'] = _grow(buffer['myu'], n_playlists + 1)
+            buffer['uk'] = _grow(buffer['uk'], n_playlists + 1)
+            for key in ('projections', 'owner', 'rows'):
+                buffer[key] = _grow(buffer[key], n_rows + n)
+            buffer['myu'][n_playlists] = myu
+            buffer['uk'][n_playlists] = 0
+            buffer['uk'][n_playlists, :, :k] = uk
+            buffer['projections'][n_rows:n_rows + n] = 0
+            buffer['projections'][n_rows:n_rows + n, :k] = projections
+            buffer['owner'][n_rows:n_rows + n] = n_playlists
+            buffer['rows'][n_rows:n_rows + n] = np.arange(len(tracks), len(tracks) + n)
+            owner = _grow(owner, len(tracks) + n)
+            owner[len(tracks):len(tracks) + n] = len(playlists)
+            sizes[shape] = (n_playlists + 1, n_rows + n)
+            where.append((shape, n_playlists, n_rows))
+            playlists.append({'id': record['id'], 'name': record['name']})
+            tracks.extend(record_tracks)
+
+        index = ImageIndex(buffers, sizes, owner, playlists, tracks, where)
+        if in_place:
+            index._head = self._head
+            self._head[0] = index
+        return index
+
+    def without(self, playlist_ids):
+        """
+        A new index without the given playlists, or this one when it holds none of them.
+        """
+        drop = set(playlist_ids)
+        if not drop & self.ids:
+            return self
+        ends = np.r_[self.starts[1:], len(self.tracks)]
+        kept = []
+        for p, playlist in enumerate(self.playlists):
+            if playlist['id'] in drop:
+                continue
+            shape, group_p, group_row = self._where[p]
+            group = self.groups[shape]
+            n = ends[p] - self.starts[p]
+            kept.append({
+                **playlist,
+                'myu': group['myu'][group_p].reshape(shape),
+                'uk': group['uk'][group_p],
+                'projections': group['projections'][group_row:group_row + n],
+                'track': self.tracks[self.starts[p]:ends[p]],
+            })
+        return ImageIndex.from_records(kept)
+
+    def distances(self, query_vectors):
+        """
+        Euclidean distance between the query and every track, each in its playlist's PCA space.
+
+        Args:
+            query_vectors (dict): Flattened preprocessed query image for each shape in
+                self.shapes (see query_vectors).
+
+        Returns:
+            np.ndarray: One distance per track, in index order.
+        """
+        distances = np.zeros(len(self))
+        for shape, group in self.groups.items():
+            query_projections = np.einsum('pd,pdk->pk', query_vectors[shape][None, :] - group['myu'], group['uk'])
+            distances[group['rows']] = np.linalg.norm(group['projections'] - query_projections[group['owner']], axis=1)
+        return distances
+
+    def similarity_percentages(self, distances, positions):
+        """
+        1 - distance / (largest distance in the same playlist), as a percentage, for the
+        tracks at positions.
+        """
+        max_distance = np.maximum.reduceat(distances, self.starts)[self.owner[positions]]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return (1 - distances[positions] / max_distance) * 100
+
+    def result(self, position, distance, similarity_percentage):
+        """
+        One scored track in the /query-by-image result format.
+        """
+        track = self.tracks[position]
+        playlist = self.playlists[self.owner[position]]
+        return {
+            'distance': float(distance),
+            'similarity_percentage': round(float(similarity_percentage), 2),
+            'playlist_id': playlist['id'],
+            'playlist_name': playlist['name'],
+            'track_idx': int(position - self.starts[self.owner[position]]),
+            'image_url': track['image_url'],
+            'music_url': track['music_url'],
+            'track_name': track['name']
+        }
+
+    def search(self, query_vectors, top_k):
+        """
+        Returns the top_k closest tracks over all playlists, closest first.
+        """
+        distances = self.distances(query_vectors)
+        count('tracks_scored_total', len(distances), index='image')
+        best = top_k_indices(distances, top_k, largest=False)
+        percentages = self.similarity_percentages(distances, best) if len(best) else []
+        return [self.result(int(i), distances[i], p) for i, p in zip(best, percentages)]
+
+
+class ImageModelCache:
+    """
+    Stacked playlist PCA models and track metadata, kept between /query-by-image calls.
+
+    The first get() loads every playlist once. Afterwards get() returns the cached
+    ImageIndex without touching the database; once ttl seconds have passed since the last
+    check it starts a background sync that compares playlist ids with the database, fetches
+    only new playlists and drops deleted ones. /upload adds its playlist with add_playlist,
+    so new playlists are visible immediately. Only the ImageIndex is kept: the rows are
+    decoded straight into its arrays, and new playlists are appended to them.
+    """
+
+    def __init__(self, columns, ttl=60.0):
+        self.columns = columns
+        self.ttl = ttl
+        self._lock = threading.RLock()
+        self._syncing = False
+        self.index = ImageIndex.from_records([])
+        self.loaded = False
+        self.checked_at = 0.0
+        self.version = 0
+        self.counters = {'hits': 0, 'loads': 0, 'syncs': 0, 'db_reads': 0}
+
+    def _swap(self, index):
+        # called with the lock held; readers keep using the previous index
+        self.index = index
+        self.version += 1
+
+    def refresh(self, supabase):
+        """
+        Reloads every playlist model from the database. The lock is held throughout, so a
+        playlist added meanwhile is not lost when the loaded index is swapped in.
+        """
+        with self._lock:
+            data = supabase.table('playlist').select(self.columns).execute().data
+            self.counters['db_reads'] += 1
+            self.counters['loads'] += 1
+            self._swap(ImageIndex.from_records(data))
+            self.loaded = True
+            self.checked_at = time.monotonic()
+
+    def sync(self, supabase):
+        """
+        Brings the cache in line with the playlist table: one id-only read, plus one read
+        of the new playlists' models when there are any.
+
+        Only playlists cached before the id read can be dropped, and fetched rows never
+        replace a playlist that add_playlist cached in the meantime.
+        """
+        with self._lock:
+            known = self.index.ids
+        ids = {row['id'] for row in supabase.table('playlist').select('id').execute().data}
+        with self._lock:
+            missing = list(ids - self.index.ids)
+        added = supabase.table('playlist').select(self.columns).in_('id', missing).execute().data if missing else []
+        with self._lock:
+            self.counters['db_reads'] += 1 + bool(missing)
+            self.counters['syncs'] += 1
+            cached = self.index.ids
+            removed = [playlist_id for playlist_id in known - ids if playlist_id in cached]
+            added = [record for record in added if record['id'] not in cached]
+            if added or removed:
+                self._swap(self.index.without(removed).extended(added))
+            self.checked_at = time.monotonic()
+
+    def _background_sync(self, supabase):
+        try:
+            self.sync(supabase)
+        except Exception as e:
+            logging.error("Error syncing image model cache: %s", e, exc_info=True)
+        finally:
+            self._syncing = False
+
+    def get(self, supabase):
+        """
+        The ImageIndex of every cached playlist, loading it on first use.
+        """
+        with self._lock:
+            if not self.loaded:
+                self.refresh(supabase)
+            self.counters['hits'] += 1
+            stale = time.monotonic() - self.checked_at > self.ttl and not self._syncing
+            if stale:
+                self._syncing = True
+        if stale:
+            threading.Thread(target=self._background_sync, args=(supabase,), daemon=True).start()
+        return self.index
+
+    def add_playlist(self, record):
+        """
+        Adds or replaces one playlist from its row ('id', 'name', 'myu', 'uk',
+        'projections') and its track rows in 'track', with only the columns of
+        PLAYLIST_MODEL_COLUMNS ('id', 'name', 'image_url', 'music_url', 'image_idx').
+        """
+        with self._lock:
+            self._swap(self.index.without([record['id']]).extended([record]))
+
+    def stats(self):
+        """
+        Counters and the memory held by the index arrays (with their spare rows) and track metadata.
+        """
+        with self._lock:
+            index = self.index
+            metadata_bytes = len(json.dumps(index.tracks, default=str)) + len(json.dumps(index.playlists, default=str))
+            return {
+                'playlists': len(index.playlists),
+                'tracks': len(index),
+                'version': self.version,
+                'seconds_since_check': round(time.monotonic() - self.checked_at, 1) if self.loaded else None,
+                'index_bytes': int(index.nbytes),
+                'metadata_bytes': metadata_bytes,
+                **self.counters,
+            }
+
+
+def query_vector(image_file, shape=IMAGE_SIZE):
+    """
+    Decodes a query image once to the given (m, n) resolution and flattens it.
+    """
+    image_file.seek(0)
+    return turn_to_1D(decode_image(image_file, *shape)).astype(np.float64)
+
+
+def query_vectors(image_file, shapes):
+    """
+    The query image at every resolution used by an ImageIndex, for ImageIndex.distances.
+    """
+    return {shape: query_vector(image_file, shape) for shape in shapes}
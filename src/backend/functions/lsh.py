@@ -0,0 +1,87 @@
+from collections import defaultdict
+import numpy as np
+from backend.functions.audio import FEATURE_BINS, feature_weights
+
+
+class WindowLSH:
+    """
+    Random-hyperplane LSH over normalize_features window rows.
+
+    Each row is scaled by the square root of its block weight before hashing, so the angle
+    between two hashed vectors follows the weighted ATB/RTB/FTB score used by
+    calculate_similarity. A track is a candidate for a query when at least min_collisions
+    (query window, table) pairs land in a bucket holding one of its windows; when
+    max_candidates is set, only that many tracks with the most collisions are kept.
+
+    More tables raise recall, more bits per table make buckets smaller, and a lower
+    max_candidates trades recall for fewer exact alignments.
+
+    Not thread-safe: candidates caches bucket arrays that add invalidates, so callers
+    serialize the two (HummingIndex holds its lock around both).
+    """
+
+    def __init__(self, n_tables=8, n_bits=12, min_collisions=1, max_candidates=None, seed=0,
+                 atb_weight=0.6, rtb_weight=0.2, ftb_weight=0.2):
+        self.n_tables = n_tables
+        self.n_bits = n_bits
+        self.min_collisions = min_collisions
+        self.max_candidates = max_candidates
+        self.seed = seed
+        self.weights = (atb_weight, rtb_weight, ftb_weight)
+        dim = sum(FEATURE_BINS)
+        rng = np.random.default_rng(seed)
+        self._planes = rng.standard_normal((dim, n_tables * n_bits)).astype(np.float32)
+        self._scale = np.sqrt(feature_weights(*self.weights)).astype(np.float32)
+        self._powers = (1 << np.arange(n_bits, dtype=np.int64))
+        self._buckets = [defaultdict(list) for _ in range(n_tables)]
+        # bucket lists converted to arrays on first read, dropped again when the bucket grows
+        self._arrays = [{} for _ in range(n_tables)]
+
+    def empty(self):
+        """
+        Returns a new, empty LSH with the same parameters and hyperplanes.
+        """
+        return WindowLSH(self.n_tables, self.n_bits, self.min_collisions, self.max_candidates, self.seed, *self.weights)
+
+    def _codes(self, windows):
+        """
+        Bucket code of every non-zero window in every table, shape (n_windows, n_tables).
+        """
+        windows = np.asarray(windows, dtype=np.float32)
+        # all-zero windows score 0.0 against everything, they are not worth a bucket
+        windows = windows[np.any(windows != 0, axis=1)]
+        bits = (windows * self._scale) @ self._planes > 0
+        return bits.reshape(len(windows), self.n_tables, self.n_bits) @ self._powers
+
+    def add(self, position, windows):
+        """
+        Registers the windows of the track at index position.
+        """
+        codes = self._codes(windows)
+        for table, buckets in enumerate(self._buckets):
+            for code in np.unique(codes[:, table]).tolist():
+                buckets[code].append(position)
+                self._arrays[table].pop(code, None)
+
+    def candidates(self, query_windows):
+        """
+        Returns the sorted positions of tracks colliding with the query often enough.
+        """
+        codes = self._codes(query_windows)
+        hits = []
+        for table, buckets in enumerate(self._buckets):
+            arrays = self._arrays[table]
+            for code in codes[:, table].tolist():
+                bucket = arrays.get(code)
+                if bucket is None and code in buckets:
+                    bucket = arrays[code] = np.array(buckets[code], dtype=np.int64)
+                if bucket is not None:
+                    hits.append(bucket)
+        if not hits:
+            return np.zeros(0, dtype=np.int64)
+        counts = np.bincount(np.concatenate(hits))
+        found = np.flatnonzero(counts >= self.min_collisions)
+        if self.max_candidates is not None and len(found) > self.max_candidates:
+            keep = np.argpartition(-counts[found], self.max_candidates - 1)[:self.max_candidates]
+            found = np.sort(found[keep])
+        return found
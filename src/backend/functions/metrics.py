@@ -0,0 +1,197 @@
+import time
+import bisect
+import threading
+import contextvars
+from functools import wraps
+from contextlib import contextmanager
+
+# Upper bounds (seconds) of the latency histogram buckets, from sub-millisecond decodes to
+# minute-long uploads
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+METRIC_PREFIX = 'hmo_'
+
+METRIC_HELP = {
+    'stage_seconds': ('histogram', "Time spent in each processing stage."),
+    'request_seconds': ('histogram', "Time to answer each HTTP route."),
+    'tracks_scored_total': ('counter', "Tracks scored against a query."),
+    'bytes_transferred_total': ('counter', "Bytes received from clients or sent to the storage bucket."),
+    'database_round_trips_total': ('counter', "Database queries executed."),
+    'database_rows_total': ('counter', "Rows returned or written by database queries."),
+}
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class MetricsRegistry:
+    """
+    Process-wide histograms and counters, keyed by metric name and label values, rendered
+    in the Prometheus text exposition format.
+    """
+
+    def __init__(self, prefix=METRIC_PREFIX, help_texts=METRIC_HELP):
+        self.prefix = prefix
+        self.help_texts = help_texts
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    def _header(self, lines, name, kind):
+        full_name = self.prefix + name
+        lines.append(f"# HELP {full_name} {self.help_texts.get(name, ('', name))[1]}")
+        lines.append(f"# TYPE {full_name} {kind}")
+
+    def render(self):
+        with self._lock:
+            histograms = sorted((key, h.buckets, list(h.counts), h.sum, h.count) for key, h in self._histograms.items())
+            counters = sorted(self._counters.items())
+
+        lines = []
+        current = None
+        for (name, labels), buckets, counts, total, count in histograms:
+            if name != current:
+                self._header(lines, name, 'histogram')
+                current = name
+            cumulative = 0
+            for bound, bucket_count in zip(list(buckets) + ['+Inf'], counts):
+                cumulative += bucket_count
+                le = bound if bound == '+Inf' else _format_value(float(bound))
+                lines.append(f"{self.prefix}{name}_bucket{_format_labels(labels, [('le', le)])} {cumulative}")
+            lines.append(f"{self.prefix}{name}_sum{_format_labels(labels)} {_format_value(total)}")
+            lines.append(f"{self.prefix}{name}_count{_format_labels(labels)} {count}")
+        for (name, labels), value in counters:
+            if name != current:
+                self._header(lines, name, 'counter')
+                current = name
+            lines.append(f"{self.prefix}{name}{_format_labels(labels)} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+class RequestTimings:
+    """
+    Total time and number of calls of each stage during one request, in first-seen order.
+    With observe False, spans only go here and not into the process-wide histograms.
+    """
+
+    def __init__(self, observe=True):
+        self._lock = threading.Lock()
+        self.observe = observe
+        self.stages = {}
+
+    def add(self, stage, seconds):
+        with self._lock:
+            total, calls = self.stages.get(stage, (0.0, 0))
+            self.stages[stage] = (total + seconds, calls + 1)
+
+    def server_timing(self, total=None):
+        """
+        The Server-Timing header value, durations in milliseconds.
+        """
+        with self._lock:
+            stages = list(self.stages.items())
+        entries = [f'{stage};dur={seconds * 1000:.3f}' + (f';desc="{calls} calls"' if calls > 1 else '')
+                   for stage, (seconds, calls) in stages]
+        if total is not None:
+            entries.append(f'total;dur={total * 1000:.3f}')
+        return ', '.join(entries)
+
+
+metrics = MetricsRegistry()
+
+# Timings of the request being handled; asyncio tasks and asyncio.to_thread inherit it
+_request_timings = contextvars.ContextVar('request_timings', default=None)
+
+
+@contextmanager
+def track_request(observe=True):
+    """
+    Collects the spans of the current request (and of the tasks and threads it starts with
+    asyncio.to_thread) into a new RequestTimings.
+    """
+    timings = RequestTimings(observe)
+    token = _request_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _request_timings.reset(token)
+
+
+@contextmanager
+def span(stage):
+    """
+    Times a block as one call of stage, in the stage histogram and the current request.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - start)
+
+
+def record(stage, seconds):
+    """
+    Records one call of stage that took seconds, e.g. one timed in a worker process.
+    """
+    timings = _request_timings.get()
+    if timings is None or timings.observe:
+        metrics.observe('stage_seconds', seconds, stage=stage)
+    if timings is not None:
+        timings.add(stage, seconds)
+
+
+def timed(stage):
+    """
+    Decorator running every call of a function in a span(stage).
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count(name, value=1, **labels):
+    metrics.inc(name, value, **labels)
@@ -0,0 +1,157 @@
+import threading
+import unicodedata
+from array import array
+from collections import defaultdict
+
+import numpy as np
+
+
+def normalize_name(text):
+    """
+    Lowercases, strips accents and collapses whitespace, so "Café  Del Mar" == "cafe del mar".
+    Letters of other scripts are kept; only combining marks are dropped.
+    """
+    text = ''.join(char for char in unicodedata.normalize('NFKD', str(text)) if not unicodedata.combining(char))
+    return ' '.join(unicodedata.normalize('NFC', text).casefold().split())
+
+
+def trigrams(text):
+    """
+    Trigrams of a normalized name, padded so that the start of every word counts.
+    """
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class NameIndex:
+    """
+    In-memory trigram index over playlist names and the names of their tracks.
+
+    Every name is a document whose trigrams point back to it; postings are int arrays, so
+    a query counts its shared trigrams per document with one np.bincount. A query matches a document
+    when the name contains it (substring or prefix) or when enough trigrams are shared,
+    which tolerates typos. Results are playlists, ranked by exact, prefix and substring
+    matches first, then trigram similarity; a playlist's own name ranks above its tracks'.
+    """
+
+    def __init__(self, min_similarity=0.35):
+        self.min_similarity = min_similarity
+        self._lock = threading.Lock()
+        self.playlists = {}
+        self._names = []  # (normalized name, playlist id, is track name)
+        self._grams = array('i')
+        self._postings = defaultdict(lambda: array('i'))
+
+    def __len__(self):
+        return len(self.playlists)
+
+    def _add_name(self, name, playlist_id, is_track):
+        normalized = normalize_name(name)
+        if not normalized:
+            return
+        doc = len(self._names)
+        grams = trigrams(normalized)
+        self._names.append((normalized, playlist_id, is_track))
+        self._grams.append(len(grams))
+        for gram in grams:
+            self._postings[gram].append(doc)
+
+    def add_playlist(self, playlist, track_names=()):
+        """
+        Indexes a playlist ({'id', 'name', 'img_url'}) and the names of its tracks.
+        """
+        with self._lock:
+            self.playlists[playlist['id']] = {key: playlist[key] for key in ('id', 'name', 'img_url')}
+            self._add_name(playlist['name'], playlist['id'], False)
+            for track_name in track_names:
+                self._add_name(track_name, playlist['id'], True)
+
+    def load(self, playlists, tracks):
+        """
+        Replaces the index content with playlist rows and track rows ('name', 'playlist_id').
+        """
+        fresh = NameIndex(self.min_similarity)
+        track_names = defaultdict(list)
+        for track in tracks:
+            track_names[track['playlist_id']].append(track['name'])
+        for playlist in playlists:
+            fresh.add_playlist(playlist, track_names.get(playlist['id'], ()))
+        with self._lock:
+            self.playlists = fresh.playlists
+            self._names = fresh._names
+            self._grams = fresh._grams
+            self._postings = fresh._postings
+
+    def refresh(self, supabase, page_size=1000):
+        """
+        Reloads every playlist and track name from the database.
+        """
+        playlists = supabase.table("playlist").select("id, name, img_url").execute().data
+        tracks = []
+        start = 0
+        while True:
+            page = supabase.table("track").select("name, playlist_id").order("id").range(start, start + page_size - 1).execute()
+            tracks.extend(page.data)
+            if len(page.data) < page_size:
+                break
+            start += page_size
+        self.load(playlists, tracks)
+        return len(self)
+
+    def _rank(self, doc, query, shared=0, query_grams=1):
+        name, _, is_track = self._names[doc]
+        similarity = 2 * shared / (query_grams + self._grams[doc])
+        return (name == query, name.startswith(query), query in name, similarity, not is_track, -len(name))
+
+    def _candidates(self, query):
+        """
+        Documents sharing enough trigrams with query to be a substring or a close match,
+        with their number of shared trigrams.
+        """
+        query_grams = trigrams(query)
+        postings = [np.frombuffer(self._postings[gram], dtype=np.int32)
+                    for gram in query_grams if gram in self._postings]
+        if not postings:
+            return [], len(query_grams)
+        shared = np.bincount(np.concatenate(postings), minlength=len(self._names))
+        # A name containing query has all of its distinct unpadded trigrams; anything else
+        # needs a Dice similarity of at least min_similarity, so at least this many shared trigrams.
+        inner = len({query[i:i + 3] for i in range(len(query) - 2)})
+        needed = min(inner, int(np.ceil(self.min_similarity * len(query_grams) / 2)))
+        docs = np.flatnonzero(shared >= max(needed, 1))
+        shared = shared[docs]
+        similarity = 2 * shared / (len(query_grams) + np.frombuffer(self._grams, dtype=np.int32)[docs])
+        keep = (shared >= inner) | (similarity >= self.min_similarity)
+        return list(zip(docs[keep].tolist(), shared[keep].tolist())), len(query_grams)
+
+    def search(self, query, limit=20):
+        """
+        Playlists matching query, best first, at most limit of them.
+        """
+        query = normalize_name(query)
+        if not query:
+            return []
+        with self._lock:
+            names, playlists = self._names, self.playlists
+            if len(query) < 3:
+                # too short for trigrams: substring scan, cheap at catalog sizes
+                ranked = [(self._rank(doc, query), doc) for doc in range(len(names)) if query in names[doc][0]]
+            else:
+                candidates, query_grams = self._candidates(query)
+                ranked = []
+                for doc, count in candidates:
+                    rank = self._rank(doc, query, count, query_grams)
+                    if rank[2] or rank[3] >= self.min_similarity:
+                        ranked.append((rank, doc))
+
+        ranked.sort(key=lambda item: item[0], reverse=True)
+        results, seen = [], set()
+        for _, doc in ranked:
+            playlist_id = names[doc][1]
+            if playlist_id in seen:
+                continue
+            seen.add(playlist_id)
+            results.append(playlists[playlist_id])
+            if len(results) >= limit:
+                break
+        return results
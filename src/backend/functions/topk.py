@@ -0,0 +1,46 @@
+import heapq
+import numpy as np
+
+
+def top_k_indices(scores, k, largest=True):
+    """
+    Positions of the k best scores, best first, in O(n + k log k).
+
+    Equal scores keep their original order, so the result is the same as
+    np.argsort(-scores, kind='stable')[:k] (or np.argsort(scores, kind='stable')[:k] when
+    largest is False), without sorting the whole array.
+
+    Args:
+        scores (np.ndarray): One score per candidate.
+        k (int): Number of positions to return.
+        largest (bool): Whether higher scores are better (similarities) or lower (distances).
+
+    Returns:
+        np.ndarray: Up to k positions into scores.
+    """
+    scores = np.asarray(scores)
+    keys = -scores if largest else scores
+    n = len(keys)
+    k = max(0, min(k, n))
+    if k == 0:
+        return np.zeros(0, dtype=np.int64)
+    if k < n:
+        kth = keys[np.argpartition(keys, k - 1)[k - 1]]
+        better = np.flatnonzero(keys < kth)
+        ties = np.flatnonzero(keys == kth)[:k - len(better)]
+        survivors = np.concatenate([better, ties])
+    else:
+        survivors = np.arange(n)
+    # lexsort sorts by the last key first: score, then position for ties
+    return survivors[np.lexsort((survivors, keys[survivors]))]
+
+
+def top_k_items(items, k, key, largest=True):
+    """
+    The k best items of an iterable, best first, keeping at most k of them in a heap.
+
+    Equivalent to sorted(items, key=key, reverse=largest)[:k], including the order of ties.
+    """
+    if k is None:
+        return sorted(items, key=key, reverse=largest)
+    return heapq.nlargest(k, items, key=key) if largest else heapq.nsmallest(k, items, key=key)
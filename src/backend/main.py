@@ -1,18 +1,33 @@
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi import FastAPI, File, UploadFile, HTTPException, Form, Query
-from fastapi.responses import JSONResponse
-import zipfile
+from fastapi import FastAPI, File, UploadFile, HTTPException, Form, Query, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
+from fastapi.staticfiles import StaticFiles
+from starlette.formparsers import MultiPartParser
 from io import BytesIO
 import json
 from datetime import datetime
 from backend.db.index import supabase
 from backend.db.index import bucket
+from backend.db.index import STORAGE_BACKEND, LOCAL_STORAGE_ROOT
 import uuid
 import logging
-import numpy as np
-from backend.functions.Album_Finder import data_centering, singular_value_decomposition, query_projection, compute_euclidean_distance
-from backend.functions.audio import process, calculate_similarity
+from backend.functions.image_index import ImageModelCache, query_vector, query_vectors
+from backend.functions.cover_model import CoverCatalog
+from backend.functions.Album_Finder import shutdown_decode_pools
+from backend.functions.name_index import NameIndex
+from backend.functions.audio import normalize_features, encode_features
+from backend.functions.feature_cache import FeatureCache
+from backend.functions.humming_index import HummingIndex
+from backend.functions.lsh import WindowLSH
+from backend.functions.metrics import metrics, span, track_request
+from backend.services.ingest import UPLOAD_SPOOL_BYTES, UploadSizeLimit, fit_image_model, fit_streamed_image_model, ingest_members, open_zip_upload, read_upload, shutdown_feature_pool, write_playlist
+from backend.services.storage import BucketUploader, summarize_uploads
+from backend.services.listing import ListingCache, fetch_playlist_page
+import os
+import time
+import asyncio
 from math import ceil
+from typing import Optional
 
 
 app = FastAPI()
@@ -23,6 +38,12 @@ origins = [
 ]
 
 
+# /upload archives are parsed by FastAPI for its File() parameters, which has no per-request
+# spool setting: this class attribute sets it for every multipart form of the process
+MultiPartParser.max_file_size = UPLOAD_SPOOL_BYTES
+app.add_middleware(UploadSizeLimit)
+
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
@@ -32,12 +53,161 @@ app.add_middleware(
 )
 
 
-def upload_to_firebase(file_path, file_content, mimetype):
-    blob = bucket.blob(file_path)
-    blob.upload_from_string(file_content, content_type=mimetype)
-    blob.make_public()
-    return blob.public_url
+# Per-stage timings of every request: Server-Timing header and the /metrics histograms
+@app.middleware("http")
+async def record_stage_timings(request: Request, call_next):
+    with track_request() as timings:
+        start = time.perf_counter()
+        response = await call_next(request)
+        total = time.perf_counter() - start
+    route = request.scope.get("route")
+    metrics.observe('request_seconds', total, route=route.path if route else "unmatched",
+                    method=request.method, status=str(response.status_code))
+    response.headers["Server-Timing"] = timings.server_timing(total)
+    return response
+
+
+# With the local bucket in a directory, serve its files where its public URLs point
+if STORAGE_BACKEND == 'local' and LOCAL_STORAGE_ROOT:
+    os.makedirs(LOCAL_STORAGE_ROOT, exist_ok=True)
+    app.mount("/files", StaticFiles(directory=LOCAL_STORAGE_ROOT), name="files")
+
+
+# Track features for /query-by-humming, loaded once and kept up to date by /upload.
+# HUMMING_LSH_TABLES > 0 turns on the approximate candidate index (see bench_humming_lsh).
+HUMMING_LSH_TABLES = int(os.getenv('HUMMING_LSH_TABLES', '0'))
+HUMMING_LSH_BITS = int(os.getenv('HUMMING_LSH_BITS', '16'))
+HUMMING_LSH_MAX_CANDIDATES = int(os.getenv('HUMMING_LSH_MAX_CANDIDATES', '0')) or None
+# HUMMING_PRUNE=1 skips tracks whose score bound cannot reach the top_k (see bench_humming_prune)
+HUMMING_PRUNE = os.getenv('HUMMING_PRUNE', '0') == '1'
+HUMMING_BOUND_RANK = int(os.getenv('HUMMING_BOUND_RANK', '64'))
+# Threads scoring shards of the corpus in parallel for each query
+HUMMING_WORKERS = int(os.getenv('HUMMING_WORKERS', '1'))
+
+humming_index = HummingIndex(
+    lsh=WindowLSH(HUMMING_LSH_TABLES, HUMMING_LSH_BITS, max_candidates=HUMMING_LSH_MAX_CANDIDATES)
+    if HUMMING_LSH_TABLES > 0 else None,
+    prune=HUMMING_PRUNE,
+    bound_rank=HUMMING_BOUND_RANK,
+    workers=HUMMING_WORKERS
+)
+
+
+# Features of recently seen MIDI files, shared by /upload and /query-by-humming.
+# FEATURE_CACHE_DIR adds an on-disk tier that survives restarts.
+feature_cache = FeatureCache(
+    max_entries=int(os.getenv('FEATURE_CACHE_ENTRIES', '256')),
+    disk_dir=os.getenv('FEATURE_CACHE_DIR') or None,
+    disk_max_bytes=int(os.getenv('FEATURE_CACHE_DISK_MB', '256')) * 2**20
+)
+
+
+@app.on_event("startup")
+def load_humming_index():
+    try:
+        count = humming_index.refresh(supabase)
+        print(f"Loaded {count} tracks into the humming index")
+    except Exception as e:
+        logging.error("Error loading humming index: %s", e, exc_info=True)
+
+
+# Optional catalog-wide cover model for /query-by-image (GLOBAL_IMAGE_MODEL=1). It is saved to
+# GLOBAL_IMAGE_MODEL_PATH on refits and at shutdown; playlists missing from that file are
+# rebuilt from their own models.
+GLOBAL_IMAGE_MODEL = os.getenv('GLOBAL_IMAGE_MODEL', '0') == '1'
+PLAYLIST_MODEL_COLUMNS = 'id, myu, uk, projections, name, track(id, image_url, music_url, name, image_idx)'
+IMAGE_MODEL_TRACK_COLUMNS = ('id', 'image_url', 'music_url', 'name', 'image_idx')
+
+# Cached playlist listing responses, revalidated with ETag/Last-Modified; /upload invalidates them
+playlist_listing = ListingCache(
+    max_entries=int(os.getenv('LISTING_CACHE_ENTRIES', '256')),
+    ttl=float(os.getenv('LISTING_CACHE_TTL', '300'))
+)
+
+# Playlist and track names for /search-playlists, loaded at startup and updated by /upload.
+# Until it has loaded, searches fall back to the database.
+name_index = NameIndex()
+name_index_loaded = False
+
+
+@app.on_event("startup")
+def load_name_index():
+    global name_index_loaded
+    try:
+        count = name_index.refresh(supabase)
+        name_index_loaded = True
+        print(f"Loaded {count} playlists into the name index")
+    except Exception as e:
+        logging.error("Error loading name index: %s", e, exc_info=True)
+
+
+# Decoded playlist models for /query-by-image, checked against the playlist table every
+# IMAGE_MODEL_CACHE_TTL seconds in the background
+image_model_cache = ImageModelCache(PLAYLIST_MODEL_COLUMNS, ttl=float(os.getenv('IMAGE_MODEL_CACHE_TTL', '60')))
 
+cover_catalog = CoverCatalog(
+    n_components=int(os.getenv('GLOBAL_IMAGE_COMPONENTS', '16')),
+    refit_every=int(os.getenv('GLOBAL_IMAGE_REFIT_EVERY', '20')),
+    path=os.getenv('GLOBAL_IMAGE_MODEL_PATH', 'cover_catalog.npz')
+) if GLOBAL_IMAGE_MODEL else None
+
+
+@app.on_event("startup")
+def load_image_model_cache():
+    try:
+        image_model_cache.refresh(supabase)
+        print(f"Loaded {len(image_model_cache.index.playlists)} playlist image models")
+    except Exception as e:
+        logging.error("Error loading image model cache: %s", e, exc_info=True)
+
+
+@app.on_event("startup")
+def load_cover_catalog():
+    if cover_catalog is None:
+        return
+    try:
+        cover_catalog.load(cover_catalog.path)
+        records = supabase.table('playlist').select(PLAYLIST_MODEL_COLUMNS).execute().data
+        added = cover_catalog.backfill(records)
+        if added:
+            cover_catalog.save(cover_catalog.path)
+        print(f"Loaded {len(cover_catalog)} covers into the global image model ({added} playlists backfilled)")
+    except Exception as e:
+        logging.error("Error loading global image model: %s", e, exc_info=True)
+
+
+@app.on_event("shutdown")
+def stop_feature_pool():
+    shutdown_feature_pool()
+
+
+@app.on_event("shutdown")
+def stop_decode_pools():
+    shutdown_decode_pools()
+
+
+@app.on_event("shutdown")
+def stop_humming_workers():
+    humming_index.close()
+
+
+@app.on_event("shutdown")
+def save_cover_catalog():
+    if cover_catalog is not None and cover_catalog.dirty:
+        cover_catalog.save(cover_catalog.path)
+
+
+# Bucket transfers (Firebase Storage or the local bucket), UPLOAD_CONCURRENCY at a time with retries on transient errors
+uploader = BucketUploader(
+    bucket,
+    max_concurrency=int(os.getenv('UPLOAD_CONCURRENCY', '8')),
+    max_retries=int(os.getenv('UPLOAD_RETRIES', '3'))
+)
+
+
+@app.on_event("shutdown")
+def stop_uploader():
+    uploader.close()
 
 
 
@@ -53,77 +223,85 @@ async def upload_files(
         datetimenow = datetime.now().isoformat()
 
 
-        images_zip = zipfile.ZipFile(BytesIO(await images.read()))
-        audios_zip = zipfile.ZipFile(BytesIO(await audios.read()))
-        playlistImages_content = await playlistImage.read()
-        mapper_content = await mapper.read()
-        mapper_data = json.loads(mapper_content.decode('utf-8'))
+        # Archives stay in their spooled temporary files, members are read one chunk at a time
+        with span("request_read"):
+            images_zip = open_zip_upload(images)
+            audios_zip = open_zip_upload(audios)
+            playlistImages_content = await read_upload(playlistImage)
+            mapper_content = await read_upload(mapper)
+            mapper_data = json.loads(mapper_content.decode('utf-8'))
 
 
         # Upload playlist image
         playlist_img_path = f"HMO/{playlistName}_{datetimenow}/playlist/{datetime.now().isoformat()}.png"
-        playlist_img_url = upload_to_firebase(playlist_img_path, playlistImages_content, "image/png")
-       
+        playlist_img_url = (await asyncio.to_thread(uploader.upload, playlist_img_path, playlistImages_content, "image/png"))['url']
         playlist_id = str(uuid.uuid4())
-        supabase.table('playlist').insert({
-            'id': playlist_id,
-            'name': playlistName,
-            'created_at': datetimenow,
-            'img_url' : playlist_img_url
-        }).execute()
 
 
-        image_paths = [images_zip.open(item['pic_name']) for item in mapper_data]
-        myu, standardized_data = data_centering(image_paths)
-        projections, Uk, _ = singular_value_decomposition(standardized_data, 2)
+        # Read every cover and MIDI file once: preprocess, extract features and upload it
+        covers, cover_stats, track_features, uploads = await ingest_members(
+            images_zip, audios_zip, mapper_data, f"HMO/{playlistName}_{datetimenow}", uploader, feature_cache
+        )
+        print(f"Uploaded {playlistName}: {summarize_uploads(uploads)}\n")
+        if covers is not None:
+            myu, Uk, projections = await fit_image_model(covers)
+        else:
+            # Too many covers to keep: finish the streamed covariance with a second pass
+            myu, Uk, projections = await fit_streamed_image_model(cover_stats, images_zip, mapper_data)
 
 
-        supabase.table('playlist').update({
+        if cover_catalog is not None and covers is not None:
+            cover_catalog.check_covers(covers)
+
+        # Write the playlist with its model once, then its tracks in bulk
+        track_rows = []
+        for idx, item in enumerate(mapper_data):
+            track_rows.append({
+                'id': str(uuid.uuid4()),
+                'playlist_id': playlist_id,
+                'name': item['audio_name'],
+                'image_url': uploads[2 * idx]['url'],
+                'music_url': uploads[2 * idx + 1]['url'],
+                'image_idx': idx,
+                'processed_music': encode_features(track_features[idx]),
+            })
+        round_trips = await asyncio.to_thread(write_playlist, supabase, {
+            'id': playlist_id,
+            'name': playlistName,
+            'created_at': datetimenow,
+            'img_url' : playlist_img_url,
             'myu': myu.tolist(),
             'uk': Uk.tolist(),
             'projections': projections.tolist()
-        }).eq('id', playlist_id).execute()
-
-
-       
-        for idx, item in enumerate(mapper_data):
-            name = item['audio_name']
-            image_filename = item['pic_name']
-            audio_filename = item['audio_file']
-           
-            # Extract and upload image
-            image_file = images_zip.open(image_filename)
-            image_content = image_file.read()
-            image_path = f"HMO/{playlistName}_{datetimenow}/images/{name}_{datetime.now().isoformat()}.png"
-            print(f"Uploading {image_path}...\n")
-            image_url = upload_to_firebase(image_path, image_content, "image/png")
-
-
-            # Extract and upload audio
-            audio_file = audios_zip.open(audio_filename)
-            audio_content = audio_file.read()
-            audio_path = f"HMO/{playlistName}_{datetimenow}/audios/{name}_{datetime.now().isoformat()}.mid"
-            print(f"Uploading {audio_path}...\n")
-            audio_url = upload_to_firebase(audio_path, audio_content, "audio/midi")
-
-
-            # Extract audio file for processing
-            audio_blob = BytesIO(audio_content)
-            audio_vector = process(audio_blob)
+        }, track_rows)
+        print(f"Stored {len(track_rows)} tracks of {playlistName} in {round_trips} database round trips\n")
+        with span("index_update"):
+            playlist_listing.changed(added=1)
+            name_index.add_playlist({'id': playlist_id, 'name': playlistName, 'img_url': playlist_img_url},
+                                    [track_row['name'] for track_row in track_rows])
+            image_model_cache.add_playlist({
+                'id': playlist_id, 'name': playlistName, 'myu': myu, 'uk': Uk, 'projections': projections,
+                'track': [{key: track_row[key] for key in IMAGE_MODEL_TRACK_COLUMNS} for track_row in track_rows]
+            })
 
 
-            # Insert track into the database
-            supabase.table('track').insert({
-                'playlist_id': playlist_id,
-                'name': name,
-                'image_url': image_url,
-                'music_url': audio_url,
-                'image_idx': idx,
-                'processed_music': audio_vector,
-            }).execute()
+            playlist = {'id': playlist_id, 'name': playlistName}
+            for track_row, audio_features in zip(track_rows, track_features):
+                humming_index.add_track({**track_row, 'playlist': playlist}, audio_features)
+        if cover_catalog is not None and covers is not None:
+            if await asyncio.to_thread(cover_catalog.add_playlist, playlist, track_rows, covers):
+                await asyncio.to_thread(cover_catalog.save, cover_catalog.path)
+        elif cover_catalog is not None:
+            await asyncio.to_thread(cover_catalog.backfill, [{
+                **playlist, 'myu': myu, 'uk': Uk, 'projections': projections, 'track': track_rows
+            }])
 
 
         return JSONResponse(content={"message": "Files uploaded successfully"})
+
+    except HTTPException as e:
+        print("Rejected file upload:", e.detail)
+        return JSONResponse(content={"error": e.detail}, status_code=e.status_code)
    
     except Exception as e:
         print("Error during file upload:", e)
@@ -132,14 +310,16 @@ async def upload_files(
 
 
 @app.get("/get-all-playlist")
-async def get_all_playlist():
+async def get_all_playlist(request: Request):
     try:
-        playlists = supabase.table("playlist").select("id, name, img_url").execute()
-        if not playlists.data:
-            raise HTTPException(status_code=404, detail="No playlists found")
+        def build():
+            playlists = supabase.table("playlist").select("id, name, img_url").order("created_at").order("id").execute()
+            if not playlists.data:
+                raise HTTPException(status_code=404, detail="No playlists found")
+            return {"playlists": playlists.data}
 
 
-        return JSONResponse(content={"playlists": playlists.data})
+        return await asyncio.to_thread(playlist_listing.respond, request, ("all",), build)
 
 
     except Exception as e:
@@ -148,37 +328,45 @@ async def get_all_playlist():
    
 @app.get("/get-playlists-paginated")
 async def get_playlists_paginated(
+    request: Request,
     page: int = Query(1, ge=1, description="Page number starting from 1"),
-    limit: int = Query(10, ge=1, le=100, description="Number of playlists per page")
+    limit: int = Query(10, ge=1, le=100, description="Number of playlists per page"),
+    cursor: Optional[str] = Query(None, description="nextCursor of the previous page, instead of page")
 ):
     try:
-        # Calculate the offset based on the page and limit
-        offset = (page - 1) * limit
+        def build():
+            # Keyset read after the page's start cursor; a page reached for the first time
+            # without one falls back to an offset read once, then its cursor is remembered
+            start = cursor if cursor is not None else playlist_listing.page_cursor(limit, page)
+            offset = None if cursor is not None or start is not None else (page - 1) * limit
+            playlists, next_cursor = fetch_playlist_page(supabase, limit, start, offset)
+            if cursor is None:
+                playlist_listing.remember_cursor(limit, page + 1, next_cursor)
+
 
+            if not playlists:
+                raise HTTPException(status_code=404, detail="No playlists found")
 
-        # Fetch paginated playlists from the database
-        playlists = supabase.table("playlist") \
-            .select("id, name, img_url", count="exact") \
-            .range(offset, offset + limit - 1) \
-            .execute()
 
+            totalPlaylists = playlist_listing.total(supabase)
+            maxPage = ceil(totalPlaylists / limit)
 
-        if not playlists.data:
-            raise HTTPException(status_code=404, detail="No playlists found")
 
+            return {
+                "playlists": playlists,
+                "page": page,
+                "limit": limit,
+                "total": totalPlaylists,
+                "maxPage": maxPage,
+                "nextCursor": next_cursor
+            }
 
-        totalPlaylists = playlists.count
-        maxPage = ceil(totalPlaylists / limit)
 
+        return await asyncio.to_thread(playlist_listing.respond, request, ("paginated", page, limit, cursor), build)
 
-        return JSONResponse(content={
-            "playlists": playlists.data,
-            "page": page,
-            "limit": limit,
-            "total": totalPlaylists,
-            "maxPage": maxPage
-        })
 
+    except HTTPException as e:
+        return JSONResponse(content={"error": e.detail}, status_code=e.status_code)
 
     except Exception as e:
         print(f"Error getting paginated playlists: {e}")
@@ -186,19 +374,27 @@ async def get_playlists_paginated(
 
 
 @app.get("/search-playlists")
-async def search_playlists(playlist_name: str = Query(..., description="Name of the playlist to search for")):
+async def search_playlists(
+    playlist_name: str = Query(..., description="Name of the playlist to search for"),
+    limit: int = Query(20, ge=1, le=100, description="Maximum number of playlists to return")
+):
     try:
-        response = supabase.table("playlist") \
-            .select("id, name, img_url") \
-            .ilike("name", f"%{playlist_name}%") \
-            .execute()
-
-
-        if not response.data:
+        if name_index_loaded:
+            # Playlist and track names from the in-memory trigram index, no database round trip
+            playlists = name_index.search(playlist_name, limit)
+        else:
+            playlists = supabase.table("playlist") \
+                .select("id, name, img_url") \
+                .ilike("name", f"%{playlist_name}%") \
+                .limit(limit) \
+                .execute().data
+
+
+        if not playlists:
             raise HTTPException(status_code=404, detail="No matching playlists found")
 
 
-        return JSONResponse(content={"playlists": response.data})
+        return JSONResponse(content={"playlists": playlists})
 
 
     except Exception as e:
@@ -235,55 +431,21 @@ async def query_by_image(
         query_image_content = await query_image.read()
         query_image_blob = BytesIO(query_image_content)
 
-        # Fetch playlist data with tracks
-        svd_data_records = supabase.table('playlist').select('id, myu, uk, projections, name, track(id, image_url, music_url, name)').execute()
-        svd_data = svd_data_records.data
-
-        all_similarities = []
-
-        for record in svd_data:
-            myu = np.array(record['myu'])
-            Uk = np.array(record['uk'])
-            projections = np.array(record['projections'])
-            playlist_id = record['id']
-            playlist_name = record['name']
-            tracks = record['track']
-
-            # Compute query projection
-            query_proj = query_projection(query_image_blob, myu, Uk)
+        if cover_catalog is not None and len(cover_catalog):
+            # One projection into the shared space, one nearest-neighbour search
+            vector = await asyncio.to_thread(query_vector, query_image_blob)
+            with span("image_search"):
+                top_tracks = await asyncio.to_thread(cover_catalog.search, vector, top_k)
+            return JSONResponse(content={"top_tracks": top_tracks})
 
-            # Compute Euclidean distances
-            distances = compute_euclidean_distance(query_proj, projections)
+        # Cached playlist models; the database is only read on first use and by background syncs
+        with span("model_cache"):
+            image_index = await asyncio.to_thread(image_model_cache.get, supabase)
 
-            # Ensure distances and tracks have the same length
-            if len(distances) != len(tracks):
-                print(f"Skipping playlist {playlist_id}: Mismatch between distances ({len(distances)}) and tracks ({len(tracks)})")
-                continue
-
-            # Check if distances array is empty
-            if distances.size == 0:
-                print(f"Skipping playlist {playlist_id}: Empty distances array")
-                continue
-
-            max_distance = np.max(distances)
-
-            for idx, distance in enumerate(distances):
-                similarity_percentage = (1 - (distance / max_distance)) * 100
-
-                all_similarities.append({
-                    'distance': distance,
-                    'similarity_percentage': round(similarity_percentage, 2),
-                    'playlist_id': playlist_id,
-                    'playlist_name': playlist_name,
-                    'track_idx': idx,
-                    'image_url': tracks[idx]['image_url'],
-                    'music_url': tracks[idx]['music_url'],
-                    'track_name': tracks[idx]['name']
-                })
-
-        # Sort by distance and return top_k results
-        all_similarities = sorted(all_similarities, key=lambda x: x['distance'])
-        top_tracks = all_similarities[:top_k]
+        # Project the query into every playlist's PCA space in one batch, then rank all tracks together
+        vectors = await asyncio.to_thread(query_vectors, query_image_blob, image_index.shapes)
+        with span("image_search"):
+            top_tracks = await asyncio.to_thread(image_index.search, vectors, top_k)
 
         return JSONResponse(content={"top_tracks": top_tracks})
 
@@ -302,39 +464,57 @@ async def query_by_humming(
 ):
     try:
         midi_content = await query_midi.read()
-        midi_blob = BytesIO(midi_content)
-        midi_vector = process(midi_blob)
-
-        # Fetch all tracks with their associated playlist data
-        tracks_data = supabase.table("track").select("*, playlist(id, name)").execute()
-
-        similarities = []
-
-        for track in tracks_data.data:
-            track_processed_data = track['processed_music']
-            similarity = calculate_similarity(midi_vector, track_processed_data)
-
-            # Calculate distance from similarity (assuming similarity is between 0 and 1)
-            distance = 1 - similarity
-
-            # Append the track data with the required structure
-            similarities.append({
-                'distance': distance,
-                'similarity_percentage': round(similarity * 100, 2),  # Convert to percentage
-                'playlist_id': track['playlist']['id'],
-                'playlist_name': track['playlist']['name'],
-                'track_idx': track['image_idx'],  # Assuming image_idx is the track index
-                'image_url': track['image_url'],
-                'music_url': track['music_url'],
-                'track_name': track['name']
-            })
+        features = await asyncio.to_thread(feature_cache.process, midi_content)
+        midi_vector = await asyncio.to_thread(normalize_features, features)
 
-        # Sort by distance (ascending) and return top_k results
-        top_similar_tracks = sorted(similarities, key=lambda x: x['distance'])[:top_k]
+        # Score against the resident index; only the top_k tracks are joined with metadata
+        top_similar_tracks = await asyncio.to_thread(humming_index.search, midi_vector, top_k)
 
         return JSONResponse(content={"top_tracks": top_similar_tracks}, status_code=200)
 
     except Exception as e:
         print("Error during query:", e)
         logging.error("Error during query: %s", e, exc_info=True)
-        return JSONResponse(content={"error": str(e)}, status_code=500)
\ No newline at end of file
+        return JSONResponse(content={"error": str(e)}, status_code=500)
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    # Prometheus text exposition format
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/feature-cache-stats")
+async def feature_cache_stats():
+    return JSONResponse(content=feature_cache.stats())
+
+
+@app.get("/listing-cache-stats")
+async def listing_cache_stats():
+    return JSONResponse(content=playlist_listing.stats())
+
+
+@app.get("/image-model-cache-stats")
+async def image_model_cache_stats():
+    return JSONResponse(content=image_model_cache.stats())
+
+
+@app.get("/humming-index-stats")
+async def humming_index_stats():
+    return JSONResponse(content={
+        "tracks": len(humming_index),
+        "windows": humming_index.n_windows,
+        **humming_index.stats
+    })
+
+
+@app.post("/refresh-humming-index")
+async def refresh_humming_index():
+    try:
+        count = await asyncio.to_thread(humming_index.refresh, supabase)
+        return JSONResponse(content={"tracks": count, "windows": humming_index.n_windows})
+
+    except Exception as e:
+        print("Error refreshing humming index:", e)
+        logging.error("Error refreshing humming index: %s", e, exc_info=True)
+        return JSONResponse(content={"error": str(e)}, status_code=500)
@@ -0,0 +1,362 @@
+import io
+import os
+import time
+import asyncio
+import logging
+import zipfile
+import multiprocessing
+from datetime import datetime
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+from backend.functions.audio import process_features_timed
+from backend.functions.metrics import count, record, span, timed
+from backend.functions.Album_Finder import IMAGE_SIZE, NUM_COMPONENTS, StreamingPCA, images_to_dataset, center_dataset, singular_value_decomposition
+
+# Worker processes for track feature extraction, FEATURE_WORKERS defaults to one per core.
+# They are started by a fork server (spawned where there is none, e.g. Windows), never forked
+# from this process: its upload, to_thread and sync threads may hold locks at fork time.
+FEATURE_WORKERS = int(os.getenv('FEATURE_WORKERS', '0')) or os.cpu_count()
+FEATURE_START_METHOD = os.getenv('FEATURE_START_METHOD') or (
+    'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+)
+# Track rows per bulk insert and attempts per chunk
+TRACK_INSERT_BATCH = int(os.getenv('TRACK_INSERT_BATCH', '500'))
+TRACK_INSERT_RETRIES = int(os.getenv('TRACK_INSERT_RETRIES', '2'))
+# Upload limits and the number of tracks whose files are held in memory at once
+MAX_ARCHIVE_BYTES = int(os.getenv('MAX_ARCHIVE_MB', '4096')) * 2**20
+MAX_MEMBER_BYTES = int(os.getenv('MAX_MEMBER_MB', '64')) * 2**20
+INGEST_CHUNK_TRACKS = int(os.getenv('INGEST_CHUNK_TRACKS', '32'))
+# Playlists whose covers would take more than this are fitted with StreamingPCA instead, when
+# its d x d statistics are the smaller of the two
+IMAGE_MODEL_MEMORY_BYTES = int(os.getenv('IMAGE_MODEL_MEMORY_MB', '64')) * 2**20
+
+# Form files larger than this are spooled to a temporary file (see main); whole request
+# bodies larger than MAX_UPLOAD_BYTES are cut off while they stream (UploadSizeLimit)
+UPLOAD_SPOOL_BYTES = int(os.getenv('UPLOAD_SPOOL_MB', '1')) * 2**20
+MAX_UPLOAD_BYTES = int(os.getenv('MAX_UPLOAD_MB', '0')) * 2**20 or 2 * (MAX_ARCHIVE_BYTES + MAX_MEMBER_BYTES)
+
+_feature_pool = None
+
+
+def get_feature_pool():
+    """
+    Returns the shared feature extraction process pool, creating it on first use.
+    """
+    global _feature_pool
+    if _feature_pool is None:
+        _feature_pool = ProcessPoolExecutor(max_workers=FEATURE_WORKERS,
+                                            mp_context=multiprocessing.get_context(FEATURE_START_METHOD))
+    return _feature_pool
+
+
+def shutdown_feature_pool():
+    global _feature_pool
+    if _feature_pool is not None:
+        _feature_pool.shutdown(cancel_futures=True)
+        _feature_pool = None
+
+
+def _replace_broken_pool(pool):
+    """
+    Drops a pool whose worker died; the next get_feature_pool starts a new one. Every task
+    of the broken pool fails, only the first one to get here replaces it.
+    """
+    global _feature_pool
+    if _feature_pool is pool:
+        _feature_pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+async def extract_track_features(midi_contents, cache=None, **feature_params):
+    """
+    Runs audio.process_features for every MIDI file on the process pool. The workers'
+    midi_parse and histograms timings are recorded here, in the request's metrics.
+
+    Args:
+        midi_contents (list of bytes): MIDI files of a playlist.
+        cache (FeatureCache): Optional cache consulted before and filled after extraction.
+        **feature_params: extract_features parameters overriding audio.FEATURE_PARAMS.
+
+    Returns:
+        list of dict: Features of each file, in the order of midi_contents.
+    """
+    loop = asyncio.get_running_loop()
+
+    def lookup(content):
+        key = cache.key(content, **feature_params)
+        return key, cache.get(key)
+
+    async def process(content):
+        pool = get_feature_pool()
+        try:
+            return await loop.run_in_executor(pool, partial(process_features_timed, content, **feature_params))
+        except BrokenProcessPool:
+            # a worker died (e.g. killed for memory): start a new pool and retry once
+            logging.warning("Feature worker pool broke, restarting it")
+            _replace_broken_pool(pool)
+            return await loop.run_in_executor(get_feature_pool(), partial(process_features_timed, content, **feature_params))
+
+    async def extract(content):
+        # hashing and the disk tier block, keep them off the event loop
+        key, features = await asyncio.to_thread(lookup, content) if cache is not None else (None, None)
+        if features is None:
+            features, stages = await process(content)
+            for stage, (seconds, _) in stages.items():
+                record(stage, seconds)
+            if cache is not None:
+                await asyncio.to_thread(cache.put, key, features)
+        return features
+
+    with span("midi_features"):
+        return await asyncio.gather(*(extract(content) for content in midi_contents))
+
+
+@timed("image_model_fit")
+def _fit_image_model(dataset, num_components):
+    myu, standardized_data = center_dataset(dataset)
+    projections, Uk, _ = singular_value_decomposition(standardized_data, num_components)
+    return myu, Uk, projections
+
+
+async def fit_image_model(dataset, num_components=NUM_COMPONENTS):
+    """
+    Fits the playlist's album-cover PCA model off the event loop.
+
+    Args:
+        dataset (np.ndarray): Resized grayscale covers, shape (N, m, n).
+
+    Returns:
+        tuple: myu, Uk and the projections of every image.
+    """
+    return await asyncio.to_thread(_fit_image_model, dataset, num_components)
+
+
+@timed("image_model_fit")
+def _project_streamed_covers(stats, images_zip, mapper_data, num_components, chunk_size, max_member_bytes):
+    myu, Uk, _ = stats.components(num_components)
+    projections = np.empty((len(mapper_data), Uk.shape[1]))
+    chunk = np.empty((chunk_size,) + stats.image_shape, dtype=np.float32)
+    for start in range(0, len(mapper_data), chunk_size):
+        items = mapper_data[start:start + chunk_size]
+        contents = [io.BytesIO(read_member(images_zip, item['pic_name'], max_member_bytes)) for item in items]
+        images_to_dataset(contents, *stats.image_shape, out=chunk[:len(items)])
+        projections[start:start + len(items)] = stats.project(chunk[:len(items)], Uk)
+    return myu, Uk, projections
+
+
+async def fit_streamed_image_model(stats, images_zip, mapper_data, num_components=NUM_COMPONENTS,
+                                   chunk_size=INGEST_CHUNK_TRACKS, max_member_bytes=MAX_MEMBER_BYTES):
+    """
+    Finishes a playlist model accumulated by ingest_members when its covers were not kept.
+
+    The basis comes from the accumulated covariance; the projections need a second pass
+    over the cover archive, again chunk_size covers at a time.
+
+    Returns:
+        tuple: myu, Uk and the projections of every image.
+    """
+    return await asyncio.to_thread(_project_streamed_covers, stats, images_zip, mapper_data,
+                                   num_components, chunk_size, max_member_bytes)
+
+
+class UploadSizeLimit:
+    """
+    ASGI middleware answering 413 to requests on paths whose body exceeds max_bytes, while
+    the body streams in rather than after Starlette has spooled all of it to disk: up front
+    from Content-Length, otherwise once the received chunks add up to more.
+    """
+
+    def __init__(self, app, max_bytes=MAX_UPLOAD_BYTES, paths=("/upload",)):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.paths = set(paths)
+
+    def _too_large(self, size):
+        return HTTPException(status_code=413, detail=f"Request body is {size} bytes or more, the limit is {self.max_bytes}")
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['path'] not in self.paths:
+            return await self.app(scope, receive, send)
+        length = dict(scope['headers']).get(b'content-length')
+        if length is not None and length.isdigit() and int(length) > self.max_bytes:
+            response = JSONResponse(content={"detail": self._too_large(int(length)).detail}, status_code=413)
+            return await response(scope, receive, send)
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message['type'] == 'http.request':
+                received += len(message.get('body', b''))
+                if received > self.max_bytes:
+                    # raised inside the form parser, FastAPI turns it into the 413 response
+                    raise self._too_large(received)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+def upload_size(upload):
+    if upload.size is not None:
+        return upload.size
+    upload.file.seek(0, os.SEEK_END)
+    size = upload.file.tell()
+    upload.file.seek(0)
+    return size
+
+
+def _check_size(name, size, limit):
+    if size > limit:
+        raise HTTPException(status_code=413, detail=f"{name} is {size} bytes, the limit is {limit}")
+
+
+async def read_upload(upload, max_bytes=MAX_MEMBER_BYTES):
+    """
+    Reads a small form file (playlist image, mapper) after checking its size.
+    """
+    size = upload_size(upload)
+    _check_size(upload.filename, size, max_bytes)
+    count('bytes_transferred_total', size, channel='client')
+    return await upload.read()
+
+
+def open_zip_upload(upload, max_bytes=MAX_ARCHIVE_BYTES):
+    """
+    Opens an uploaded ZIP archive in place, on its spooled file, without reading it into memory.
+    """
+    size = upload_size(upload)
+    _check_size(upload.filename, size, max_bytes)
+    count('bytes_transferred_total', size, channel='client')
+    upload.file.seek(0)
+    return zipfile.ZipFile(upload.file)
+
+
+def read_member(archive, name, max_bytes=MAX_MEMBER_BYTES):
+    _check_size(name, archive.getinfo(name).file_size, max_bytes)
+    return archive.read(name)
+
+
+@timed("zip_read")
+def _read_chunk(images_zip, audios_zip, items, max_member_bytes):
+    return [(read_member(images_zip, item['pic_name'], max_member_bytes),
+             read_member(audios_zip, item['audio_file'], max_member_bytes)) for item in items]
+
+
+@timed("cover_decode")
+def _decode_covers(image_contents, out, stats=None):
+    images_to_dataset([io.BytesIO(content) for content in image_contents], out=out)
+    if stats is not None:
+        stats.update(out)
+
+
+def stream_image_model(n_covers, image_size=IMAGE_SIZE, model_memory_bytes=IMAGE_MODEL_MEMORY_BYTES):
+    """
+    Whether a playlist of n_covers should be fitted with StreamingPCA.
+
+    Keeping the covers takes N * d float32. StreamingPCA takes a d x d float64 scatter
+    matrix, plus a product of the same size on each update and the eigh workspace,
+    whatever N is: at 128x128 that is over 2 GiB. It is only used when the covers exceed
+    model_memory_bytes and its own statistics are smaller than they are; otherwise the
+    covers are kept and fitted by the Gram or randomized solver.
+    """
+    d = image_size[0] * image_size[1]
+    batch_bytes = n_covers * d * 4
+    streamed_bytes = 2 * d * d * 8
+    return batch_bytes > model_memory_bytes and streamed_bytes < batch_bytes
+
+
+async def ingest_members(images_zip, audios_zip, mapper_data, path_prefix, uploader, cache=None,
+                         chunk_size=INGEST_CHUNK_TRACKS, max_member_bytes=MAX_MEMBER_BYTES,
+                         model_memory_bytes=IMAGE_MODEL_MEMORY_BYTES):
+    """
+    Streams a playlist's archives through feature extraction and storage upload.
+
+    Tracks are handled chunk_size at a time: each cover and MIDI member is read from its
+    archive exactly once, and the same bytes go to cover preprocessing, track feature
+    extraction and the bucket upload. Only the small per-track results are kept, so memory
+    stays bounded by one chunk of files whatever the archive size.
+
+    The resized covers are kept for fit_image_model unless stream_image_model picks the
+    StreamingPCA path, where only their mean and covariance are accumulated, to be
+    finished by fit_streamed_image_model.
+
+    Returns:
+        tuple:
+            - np.ndarray: Resized grayscale covers, shape (N, m, n), or None when streamed.
+            - StreamingPCA: Cover statistics when streamed, otherwise None.
+            - list of dict: Features of each track.
+            - list of dict: Upload results, cover then MIDI file for each track.
+    """
+    streamed = stream_image_model(len(mapper_data), IMAGE_SIZE, model_memory_bytes)
+    if streamed:
+        stats = StreamingPCA(IMAGE_SIZE)
+        covers = None
+        chunk_covers = np.empty((chunk_size,) + IMAGE_SIZE, dtype=np.float32)
+    else:
+        stats = None
+        covers = np.empty((len(mapper_data),) + IMAGE_SIZE, dtype=np.float32)
+    track_features, uploads = [], []
+    for start in range(0, len(mapper_data), chunk_size):
+        items = mapper_data[start:start + chunk_size]
+        contents = await asyncio.to_thread(_read_chunk, images_zip, audios_zip, items, max_member_bytes)
+
+        transfers = []
+        for item, (image_content, audio_content) in zip(items, contents):
+            name = item['audio_name']
+            transfers.append((f"{path_prefix}/images/{name}_{datetime.now().isoformat()}.png", image_content, "image/png"))
+            transfers.append((f"{path_prefix}/audios/{name}_{datetime.now().isoformat()}.mid", audio_content, "audio/midi"))
+
+        _, chunk_features, chunk_uploads = await asyncio.gather(
+            asyncio.to_thread(_decode_covers, [image_content for image_content, _ in contents],
+                              chunk_covers[:len(items)] if streamed else covers[start:start + len(items)], stats),
+            extract_track_features([audio_content for _, audio_content in contents], cache),
+            uploader.upload_many(transfers)
+        )
+        track_features.extend(chunk_features)
+        uploads.extend(chunk_uploads)
+        del contents, transfers
+
+    return covers, stats, track_features, uploads
+
+
+def _insert_chunk(supabase, rows, max_retries, backoff=0.5):
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            # rows carry their own ids, so a retry after a lost response does not duplicate them
+            return supabase.table('track').upsert(rows).execute()
+        except Exception as e:
+            if attempt > max_retries:
+                raise
+            logging.warning("Track insert of %d rows failed (%s), retrying", len(rows), e)
+            time.sleep(backoff * 2 ** (attempt - 1))
+
+
+def write_playlist(supabase, playlist_row, track_rows, batch_size=TRACK_INSERT_BATCH, max_retries=TRACK_INSERT_RETRIES):
+    """
+    Writes a playlist, with its PCA model already in playlist_row, and all of its tracks.
+
+    The playlist is inserted once, then the tracks in chunked bulk inserts of batch_size
+    rows. A chunk that still fails after max_retries retries rolls back everything written
+    for the playlist before the error is raised.
+
+    Returns:
+        int: Number of database round trips used.
+    """
+    supabase.table('playlist').insert(playlist_row).execute()
+    round_trips = 1
+    try:
+        for start in range(0, len(track_rows), batch_size):
+            _insert_chunk(supabase, track_rows[start:start + batch_size], max_retries)
+            round_trips += 1
+    except Exception:
+        logging.error("Rolling back playlist %s", playlist_row['id'])
+        supabase.table('track').delete().eq('playlist_id', playlist_row['id']).execute()
+        supabase.table('playlist').delete().eq('id', playlist_row['id']).execute()
+        raise
+    return round_trips
@@ -0,0 +1,183 @@
+import json
+import time
+import base64
+import hashlib
+import threading
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+from fastapi import HTTPException
+from fastapi.responses import Response
+
+PLAYLIST_LIST_COLUMNS = "id, name, img_url, created_at"
+
+
+def encode_cursor(row):
+    """
+    Opaque cursor pointing just after a playlist row in (created_at, id) order.
+    """
+    raw = json.dumps([row['created_at'], row['id']]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+
+def decode_cursor(cursor):
+    try:
+        created_at, playlist_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return str(created_at), str(playlist_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def fetch_playlist_page(supabase, limit, cursor=None, offset=None):
+    """
+    One page of playlists ordered by (created_at, id).
+
+    With a cursor the page is a keyset read (rows after the cursor), whose cost does not
+    depend on how deep the page is; offset is only used to reach a page whose start
+    cursor is not known yet.
+
+    Returns:
+        tuple: The rows (without created_at) and the cursor of the next page, or None.
+    """
+    query = supabase.table("playlist").select(PLAYLIST_LIST_COLUMNS).order("created_at").order("id")
+    if cursor is not None:
+        created_at, playlist_id = decode_cursor(cursor)
+        query = query.or_(f'created_at.gt."{created_at}",and(created_at.eq."{created_at}",id.gt."{playlist_id}")')
+    if offset:
+        query = query.range(offset, offset + limit)
+    else:
+        query = query.limit(limit + 1)
+    rows = query.execute().data
+
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return [{key: row[key] for key in ("id", "name", "img_url")} for row in rows[:limit]], next_cursor
+
+
+def count_playlists(supabase):
+    return supabase.table("playlist").select("id", count="exact").limit(1).execute().count
+
+
+class ListingCache:
+    """
+    In-process cache of playlist listing responses with ETag/Last-Modified validation.
+
+    Every listing response is cached under its endpoint and parameters, for the current
+    catalog version. changed() (called by /upload) bumps the version, which drops the
+    cached bodies and page cursors and moves Last-Modified. The playlist count is read
+    once and then kept up to date by changed(). After ttl seconds everything is reloaded
+    once, in case another process wrote to the table.
+    """
+
+    def __init__(self, max_entries=256, ttl=300.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._page_cursors = {}
+        self._total = None
+        self.version = 0
+        self.last_modified = time.time()
+        self.checked_at = time.monotonic()
+        self.counters = {'hits': 0, 'misses': 0, 'not_modified': 0}
+
+    def _reset(self):
+        self.version += 1
+        self.last_modified = time.time()
+        self._entries.clear()
+        self._page_cursors.clear()
+
+    def changed(self, added=0):
+        """
+        Records a catalog change, e.g. added playlists from /upload.
+        """
+        with self._lock:
+            self._reset()
+            if self._total is not None:
+                self._total += added
+
+    def _expire(self):
+        with self._lock:
+            if time.monotonic() - self.checked_at > self.ttl:
+                self._reset()
+                self._total = None
+                self.checked_at = time.monotonic()
+
+    def total(self, supabase):
+        """
+        Number of playlists, counted in the database only when not known yet.
+        """
+        if self._total is None:
+            total = count_playlists(supabase)
+            with self._lock:
+                self._total = total
+        return self._total
+
+    def page_cursor(self, limit, page):
+        """
+        Start cursor of a page already reached with this limit, None for the first page
+        or when the page has not been reached yet.
+        """
+        return self._page_cursors.get((limit, page))
+
+    def remember_cursor(self, limit, page, cursor):
+        if cursor is not None:
+            with self._lock:
+                self._page_cursors[(limit, page)] = cursor
+
+    def _not_modified(self, request, etag):
+        if_none_match = request.headers.get('if-none-match')
+        if if_none_match is not None:
+            return etag in [tag.strip() for tag in if_none_match.split(',')] or if_none_match.strip() == '*'
+        if_modified_since = request.headers.get('if-modified-since')
+        if if_modified_since:
+            try:
+                return int(self.last_modified) <= parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def respond(self, request, key, build):
+        """
+        The listing response for key, built with build() on a miss, or a 304 when the
+        client's If-None-Match / If-Modified-Since validators are still current.
+        """
+        self._expire()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == self.version:
+                self._entries.move_to_end(key)
+                self.counters['hits'] += 1
+            else:
+                entry = None
+        if entry is None:
+            version = self.version
+            body = json.dumps(build()).encode('utf-8')
+            etag = f'"{version}-{hashlib.sha1(body).hexdigest()[:16]}"'
+            entry = (version, etag, body)
+            with self._lock:
+                self.counters['misses'] += 1
+                if version == self.version:
+                    self._entries[key] = entry
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+
+        _, etag, body = entry
+        headers = {
+            'ETag': etag,
+            'Last-Modified': formatdate(self.last_modified, usegmt=True),
+            'Cache-Control': 'no-cache',
+        }
+        if self._not_modified(request, etag):
+            with self._lock:
+                self.counters['not_modified'] += 1
+            return Response(status_code=304, headers=headers)
+        return Response(content=body, media_type='application/json', headers=headers)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'version': self.version,
+                'total': self._total,
+                'page_cursors': len(self._page_cursors),
+                **self.counters,
+            }
@@ -0,0 +1,169 @@
+import os
+import time
+import asyncio
+import logging
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from backend.functions.metrics import count, span
+
+# Network failures as raised by the Firebase client (requests and google-auth transports,
+# which do not subclass the builtins) and the retryable HTTP statuses of google-api-core
+TRANSIENT_ERRORS = (ConnectionError, TimeoutError)
+try:
+    import requests
+    TRANSIENT_ERRORS += (requests.exceptions.ConnectionError, requests.exceptions.Timeout)
+except ImportError:
+    pass
+try:
+    from google.auth import exceptions as google_auth_exceptions
+    TRANSIENT_ERRORS += (google_auth_exceptions.TransportError,)
+except ImportError:
+    pass
+try:
+    from google.api_core import exceptions as google_exceptions
+    TRANSIENT_ERRORS += (
+        google_exceptions.TooManyRequests,
+        google_exceptions.InternalServerError,
+        google_exceptions.BadGateway,
+        google_exceptions.ServiceUnavailable,
+        google_exceptions.GatewayTimeout,
+    )
+except ImportError:
+    pass
+
+class BucketUploader:
+    """
+    Uploads objects to a storage bucket (firebase_admin.storage bucket or a stand-in with the
+    same blob(path).upload_from_string / make_public / public_url interface), running up to
+    max_concurrency transfers at once and retrying transient failures with exponential backoff.
+    """
+
+    def __init__(self, bucket, max_concurrency=8, max_retries=3, backoff=0.5):
+        self.bucket = bucket
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff = backoff
+        # transfers block in the storage client, so they run on threads of their own
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="upload")
+
+    def upload(self, path, content, mimetype):
+        """
+        Uploads one object and makes it public, blocking.
+
+        Returns:
+            dict: 'path', 'url', 'bytes', 'attempts' and 'seconds' of the transfer.
+        """
+        start = time.perf_counter()
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                with span("bucket_upload"):
+                    blob = self.bucket.blob(path)
+                    blob.upload_from_string(content, content_type=mimetype)
+                    blob.make_public()
+                break
+            except TRANSIENT_ERRORS as e:
+                if attempt > self.max_retries:
+                    raise
+                delay = self.backoff * 2 ** (attempt - 1)
+                logging.warning("Upload of %s failed (%s), retrying in %.1fs", path, e, delay)
+                time.sleep(delay)
+        count('bytes_transferred_total', len(content), channel='bucket')
+        return {
+            'path': path,
+            'url': blob.public_url,
+            'bytes': len(content),
+            'attempts': attempt,
+            'seconds': time.perf_counter() - start,
+        }
+
+    async def upload_many(self, items):
+        """
+        Uploads (path, content, mimetype) items concurrently.
+
+        Returns:
+            list of dict: upload results, in the order of items.
+        """
+        loop = asyncio.get_running_loop()
+        # each transfer runs in a copy of the caller's context, so its spans count for the request
+        return await asyncio.gather(*(
+            loop.run_in_executor(self._executor, contextvars.copy_context().run, self.upload, *item) for item in items
+        ))
+
+    def close(self):
+        """
+        Waits for the running transfers and stops the upload threads.
+        """
+        self._executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def summarize_uploads(results):
+    """
+    Totals of a batch of upload results, for logging.
+    """
+    seconds = [result['seconds'] for result in results]
+    return {
+        'objects': len(results),
+        'bytes': sum(result['bytes'] for result in results),
+        'retries': sum(result['attempts'] - 1 for result in results),
+        'slowest_seconds': max(seconds, default=0.0),
+        'transfer_seconds': sum(seconds),
+    }
+
+
+class LocalBlob:
+    def __init__(self, bucket, path):
+        self.bucket = bucket
+        self.name = path
+
+    def upload_from_string(self, data, content_type=None):
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        self.bucket._write(self.name, data)
+        self.content_type = content_type
+
+    def download_as_bytes(self):
+        return self.bucket._read(self.name)
+
+    def make_public(self):
+        pass
+
+    @property
+    def public_url(self):
+        return f"{self.bucket.base_url}/{self.name}"
+
+
+class LocalBucket:
+    """
+    Storage bucket stand-in keeping objects in a directory, or in memory when root is None.
+    """
+
+    def __init__(self, root=None, base_url="http://localhost:8000/files"):
+        self.root = root
+        self.base_url = base_url.rstrip('/')
+        self.objects = {}
+
+    def blob(self, path):
+        return LocalBlob(self, path)
+
+    def _write(self, path, data):
+        if self.root is None:
+            self.objects[path] = bytes(data)
+            return
+        target = os.path.join(self.root, path)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, 'wb') as f:
+            f.write(data)
+
+    def _read(self, path):
+        if self.root is None:
+            return self.objects[path]
+        with open(os.path.join(self.root, path), 'rb') as f:
+            return f.read()
@@ -0,0 +1,109 @@
+import numpy as np
+import pytest
+
+from backend.functions.Album_Finder import center_dataset, singular_value_decomposition
+from backend.functions.cover_model import CoverCatalog, IncrementalPCA
+
+SHAPE = (6, 5)
+
+
+def make_covers(n, seed):
+    rng = np.random.default_rng(seed)
+    basis = np.random.default_rng(0).standard_normal((4, SHAPE[0] * SHAPE[1]))
+    return (128 + rng.standard_normal((n, 4)) * [40, 30, 20, 10] @ basis).reshape((n,) + SHAPE).astype(np.float32)
+
+
+def playlist(p, n):
+    tracks = [{'image_idx': i, 'image_url': f"img/{p}/{i}", 'music_url': f"mid/{p}/{i}", 'name': f"{p}-{i}"}
+              for i in range(n)]
+    return {'id': str(p), 'name': f"Playlist {p}"}, tracks, make_covers(n, seed=p + 1)
+
+
+def playlist_record(p, n, num_components=4):
+    info, tracks, covers = playlist(p, n)
+    myu, centered = center_dataset(covers)
+    projections, uk, _ = singular_value_decomposition(centered, num_components, solver="full")
+    return {**info, 'myu': myu.tolist(), 'uk': uk.tolist(), 'projections': projections.tolist(), 'track': tracks[::-1]}
+
+
+def names(results):
+    return [result['track_name'] for result in results]
+
+
+def test_incremental_pca_matches_a_full_fit():
+    data = make_covers(60, seed=9).reshape(60, -1)
+    incremental = IncrementalPCA(6)
+    for batch in np.array_split(data, 5):
+        incremental.partial_fit(batch)
+    full = IncrementalPCA(6).fit(data)
+    np.testing.assert_allclose(incremental.mean, full.mean, rtol=1e-10)
+    np.testing.assert_allclose(incremental.singular_values[:4], full.singular_values[:4], rtol=1e-6)
+    np.testing.assert_allclose(np.abs(incremental.transform(data)[:, :4]), np.abs(full.transform(data)[:, :4]), rtol=1e-5, atol=1e-4)
+
+
+def test_add_playlist_refits_every_n_playlists_and_finds_its_covers():
+    catalog = CoverCatalog(n_components=4, refit_every=2, image_shape=SHAPE)
+    refits = [catalog.add_playlist(*playlist(p, 5)) for p in range(4)]
+    assert refits == [False, True, False, True]
+    assert len(catalog) == 20 and catalog.dirty
+    _, _, covers = playlist(2, 5)
+    best = catalog.search(covers[3].reshape(-1), 3)
+    assert best[0]['track_name'] == "2-3" and best[0]['distance'] == pytest.approx(0, abs=1e-2)
+    assert best[0]['playlist_id'] == '2' and best[0]['track_idx'] == 3
+
+
+def test_check_covers_rejects_another_resolution():
+    catalog = CoverCatalog(image_shape=SHAPE)
+    with pytest.raises(ValueError):
+        catalog.add_playlist({'id': '1', 'name': "x"}, [], np.zeros((1, 5, 6)))
+    assert len(catalog) == 0
+
+
+def test_save_and_load_round_trip(tmp_path):
+    path = str(tmp_path / "catalog.npz")
+    catalog = CoverCatalog(n_components=4, refit_every=3, image_shape=SHAPE)
+    for p in range(4):
+        catalog.add_playlist(*playlist(p, 4))
+    catalog.save(path)
+    assert not catalog.dirty
+
+    restored = CoverCatalog(n_components=4, refit_every=3, image_shape=SHAPE)
+    assert restored.load(path)
+    assert restored.playlist_ids == {'0', '1', '2', '3'} and restored.updates == 4
+    query = make_covers(1, seed=99)[0].reshape(-1)
+    assert restored.search(query, 10) == catalog.search(query, 10)
+    # the next update continues the refit schedule where it stopped
+    assert not restored.add_playlist(*playlist(4, 4))
+    assert restored.add_playlist(*playlist(5, 4))
+
+
+def test_load_ignores_missing_and_mismatched_files(tmp_path):
+    path = str(tmp_path / "catalog.npz")
+    assert not CoverCatalog(image_shape=SHAPE).load(path)
+    catalog = CoverCatalog(n_components=4, image_shape=SHAPE)
+    catalog.add_playlist(*playlist(0, 4))
+    catalog.save(path)
+    assert not CoverCatalog(image_shape=(4, 4)).load(path)
+
+
+def test_empty_catalog_round_trip(tmp_path):
+    path = str(tmp_path / "catalog.npz")
+    CoverCatalog(image_shape=SHAPE).save(path)
+    restored = CoverCatalog(image_shape=SHAPE)
+    assert restored.load(path) and len(restored) == 0
+    assert restored.search(np.zeros(SHAPE[0] * SHAPE[1]), 5) == []
+
+
+def test_backfill_rebuilds_covers_from_playlist_models():
+    catalog = CoverCatalog(n_components=4, image_shape=SHAPE)
+    catalog.add_playlist(*playlist(0, 5))
+    records = [playlist_record(p, 5) for p in range(3)]
+    mismatched = {**playlist_record(3, 5), 'projections': playlist_record(3, 5)['projections'][:-1]}
+    assert catalog.backfill(records + [mismatched, {**playlist_record(4, 5), 'track': []}]) == 2
+    assert catalog.playlist_ids == {'0', '1', '2'} and len(catalog) == 15
+    assert catalog.backfill(records) == 0
+
+    # the rank-4 models of rank-4 covers rebuild them exactly, in image_idx order
+    _, _, covers = playlist(1, 5)
+    best = catalog.search(covers[2].reshape(-1), 1)
+    assert names(best) == ["1-2"] and best[0]['distance'] == pytest.approx(0, abs=1e-2)
@@ -0,0 +1,94 @@
+import os
+
+import numpy as np
+import pytest
+
+from backend.functions import audio
+from backend.functions.feature_cache import FeatureCache
+
+
+def features(seed, n_windows=4):
+    rng = np.random.default_rng(seed)
+    return {key: rng.integers(0, 5, (n_windows, width)).astype(np.float32)
+            for key, width in zip(audio.FEATURE_TYPES, audio.FEATURE_BINS)}
+
+
+def assert_same(cached, expected):
+    for key in audio.FEATURE_TYPES:
+        np.testing.assert_array_equal(cached[key], expected[key])
+
+
+def test_key_depends_on_bytes_and_parameters():
+    assert FeatureCache.key(b'a') == FeatureCache.key(b'a', **audio.FEATURE_PARAMS)
+    assert FeatureCache.key(b'a') != FeatureCache.key(b'b')
+    assert FeatureCache.key(b'a') != FeatureCache.key(b'a', window_size=20)
+
+
+def test_memory_tier_evicts_least_recently_used():
+    cache = FeatureCache(max_entries=2)
+    cache.put('a', features(1))
+    cache.put('b', features(2))
+    assert cache.get('a') is not None  # 'b' is now the least recently used
+    cache.put('c', features(3))
+    assert cache.get('b') is None
+    assert_same(cache.get('a'), features(1))
+    assert_same(cache.get('c'), features(3))
+    assert cache.stats()['memory_entries'] == 2
+    assert cache.stats()['misses'] == 1
+
+
+def test_cached_arrays_are_read_only():
+    cache = FeatureCache()
+    cache.put('a', features(1))
+    assert not cache.get('a')['ATB'].flags.writeable
+
+
+def test_disk_tier_survives_memory_eviction_and_restarts(tmp_path):
+    cache = FeatureCache(max_entries=1, disk_dir=str(tmp_path))
+    cache.put('a', features(1))
+    cache.put('b', features(2))
+    assert_same(cache.get('a'), features(1))
+    assert cache.stats()['disk_hits'] == 1
+
+    restarted = FeatureCache(max_entries=1, disk_dir=str(tmp_path))
+    assert restarted.stats()['disk_entries'] == 2
+    assert_same(restarted.get('b'), features(2))
+
+
+def test_disk_tier_evicts_least_recently_used(tmp_path):
+    size = len(audio.encode_features(features(0), dtype=np.float32, text=False))
+    cache = FeatureCache(max_entries=1, disk_dir=str(tmp_path), disk_max_bytes=2 * size)
+    for key, seed in (('a', 1), ('b', 2), ('c', 3)):
+        cache.put(key, features(seed))
+    assert sorted(os.listdir(tmp_path)) == ['b.hf', 'c.hf']
+    assert cache.stats()['disk_bytes'] <= 2 * size
+    assert cache.get('a') is None
+
+
+def test_unreadable_disk_entry_is_a_miss(tmp_path):
+    cache = FeatureCache(max_entries=1, disk_dir=str(tmp_path))
+    cache.put('a', features(1))
+    cache.put('b', features(2))
+    (tmp_path / 'a.hf').write_bytes(b'not features')
+    assert cache.get('a') is None
+    assert cache.stats()['disk_entries'] == 1
+
+
+def test_truncated_disk_entry_is_a_miss(tmp_path):
+    cache = FeatureCache(max_entries=1, disk_dir=str(tmp_path))
+    cache.put('a', features(1))
+    cache.put('b', features(2))
+    packed = (tmp_path / 'a.hf').read_bytes()
+    (tmp_path / 'a.hf').write_bytes(packed[:len(packed) // 2])
+    assert cache.get('a') is None
+
+
+def test_process_computes_once():
+    pytest.importorskip("mido")
+    from backend.benchmarks.corpus import make_midi
+    blob = make_midi(500, seed=7)
+    cache = FeatureCache()
+    first = cache.process(blob)
+    assert cache.process(blob) is first
+    assert_same(first, audio.process_features(blob))
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from backend.functions import audio
+from backend.benchmarks.bench_humming_lsh import random_walk
+
+
+def features(fuzziness=0.5):
+    return audio.extract_features(random_walk(np.random.default_rng(5), 1_000), fuzziness=fuzziness)
+
+
+def test_encoded_features_round_trip():
+    original = features()
+    for dtype in (np.float16, np.float32):
+        for compress in (False, True):
+            for text in (False, True):
+                decoded = audio.load_features(audio.encode_features(original, dtype=dtype, compress=compress, text=text))
+                for key in audio.FEATURE_TYPES:
+                    np.testing.assert_array_equal(decoded[key], original[key])
+
+
+def test_legacy_json_features_still_load():
+    original = features()
+    decoded = audio.load_features(audio.features_to_windows(original))
+    for key in audio.FEATURE_TYPES:
+        np.testing.assert_array_equal(decoded[key], original[key])
+
+
+def test_encode_features_keeps_float32_when_float16_is_not_exact():
+    original = features(fuzziness=0.3)
+    packed = audio.encode_features(original, text=False)
+    decoded = audio.decode_features(packed)
+    for key in audio.FEATURE_TYPES:
+        np.testing.assert_array_equal(decoded[key], original[key])
+    assert packed[3] == 4  # stored as float32
+    assert audio.encode_features(features(), text=False)[3] == 2
+
+
+@pytest.mark.parametrize("blob", [b'', b'HF', b'not features at all', b'HF\x01\x04\x01' + bytes(10) + b'garbage'])
+def test_corrupt_blobs_raise_value_error(blob):
+    with pytest.raises(ValueError):
+        audio.decode_features(blob)
+
+
+def test_truncated_blob_raises_value_error():
+    packed = audio.encode_features(features(), text=False)
+    with pytest.raises(ValueError):
+        audio.decode_features(packed[:len(packed) // 2])
@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+
+from backend.functions import audio
+from backend.benchmarks.bench_humming_lsh import random_walk
+
+
+def legacy_features(filtered, window_size=40, hop_size=8):
+    """The per-window pipeline extract_features replaced."""
+    windows = audio.sliding_window(filtered, window_size=window_size, hop_size=hop_size)
+    normalized_windows = [audio.normalize_pitches(window) for window in windows]
+    histograms = [audio.convert_window_to_histograms(window) for window in normalized_windows]
+    return [audio.shrink_histograms(histogram) for histogram in histograms]
+
+
+@pytest.mark.parametrize("n_notes", [10, 40, 41, 500, 3_000])
+def test_extract_features_matches_per_window_histograms(n_notes):
+    filtered = random_walk(np.random.default_rng(n_notes), n_notes).tolist()
+    legacy = legacy_features(filtered)
+    batched = audio.extract_features(filtered)
+    for key, width in zip(audio.FEATURE_TYPES, audio.FEATURE_BINS):
+        expected = np.array([window[key] for window in legacy], dtype=np.float64).reshape(-1, width)
+        np.testing.assert_array_equal(batched[key], expected)
+
+
+def test_extract_features_zeroes_flat_windows():
+    features = audio.extract_features([60] * 40 + list(range(50, 90)))
+    assert not features['ATB'][0].any()
+    assert features['ATB'][-1].any()
+
+
+def test_process_returns_per_window_dicts():
+    filtered = random_walk(np.random.default_rng(1), 200).tolist()
+    windows = audio.features_to_windows(audio.extract_features(filtered))
+    assert len(windows) == len(legacy_features(filtered))
+    assert set(windows[0]) == set(audio.FEATURE_TYPES)
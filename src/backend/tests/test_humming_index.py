@@ -0,0 +1,154 @@
+import threading
+
+import numpy as np
+import pytest
+
+from backend.benchmarks.bench_humming_lsh import build_corpus, noisy_excerpt
+from backend.functions import audio
+from backend.functions.humming_index import HummingIndex
+from backend.functions.lsh import WindowLSH
+
+
+def track(position):
+    return {'id': position, 'name': str(position), 'image_url': '', 'music_url': '',
+            'image_idx': position, 'playlist': {'id': 0, 'name': ''}}
+
+
+def build(features, **options):
+    index = HummingIndex(**options)
+    for position, windows in enumerate(features):
+        index.add_track(track(position), windows)
+    return index
+
+
+@pytest.fixture(scope="module")
+def corpus():
+    rng, melodies, features = build_corpus(60, seed=3, track_notes=(80, 200))
+    queries = [audio.normalize_features(audio.extract_features(noisy_excerpt(rng, melodies[i], 40)))
+               for i in rng.integers(0, len(melodies), 8)]
+    return features, queries
+
+
+def ranked(results):
+    return [item['track_idx'] for item in results], np.array([1 - item['distance'] for item in results])
+
+
+def assert_same_results(found, expected):
+    found_ids, found_scores = ranked(found)
+    expected_ids, expected_scores = ranked(expected)
+    np.testing.assert_allclose(found_scores, expected_scores, rtol=1e-5, atol=1e-6)
+    # positions may only differ between tracks with the same score
+    assert set(found_ids) == set(expected_ids) or np.allclose(found_scores[-1], found_scores[-2:])
+
+
+@pytest.mark.parametrize("top_k", [1, 5, 100])
+def test_pruned_search_matches_exhaustive(corpus, top_k):
+    features, queries = corpus
+    exhaustive = build(features)
+    pruned = build(features, prune=True, bound_rank=8)
+    for query in queries:
+        assert_same_results(pruned.search(query, top_k), exhaustive.search(query, top_k))
+    assert pruned.stats['searches'] == exhaustive.stats['searches'] == len(queries)
+    assert exhaustive.stats['tracks_scored'] == len(queries) * len(features)
+    assert pruned.stats['tracks_scored'] + pruned.stats['tracks_pruned'] == len(queries) * len(features)
+
+
+def test_pruned_search_with_nothing_to_return(corpus):
+    features, queries = corpus
+    pruned = build(features, prune=True)
+    assert pruned.search(queries[0], 0) == []
+    assert build([], prune=True).search(queries[0], 5) == []
+
+
+def test_bound_basis_is_refitted_as_the_index_grows(corpus):
+    features, queries = corpus
+    index = HummingIndex(prune=True, bound_rank=8)
+    index.load([])
+    first = None
+    for position, windows in enumerate(features):
+        index.add_track(track(position), windows)
+        if position == 0:
+            first = index.bound_basis
+    assert index.bound_basis is not first
+    assert index._basis_tracks == 32
+    # the refitted bounds still hold for every track
+    exhaustive = build(features)
+    for query in queries:
+        assert_same_results(index.search(query, 5), exhaustive.search(query, 5))
+
+
+def test_lsh_recall(corpus):
+    features, queries = corpus
+    exhaustive = build(features)
+    hashed = build(features, lsh=WindowLSH(n_tables=16, n_bits=8))
+    hits = total = 0
+    for query in queries:
+        expected = {item['track_idx'] for item in exhaustive.search(query, 5)}
+        hits += len(expected & {item['track_idx'] for item in hashed.search(query, 5)})
+        total += len(expected)
+    assert hits / total >= 0.8
+
+
+def test_lsh_sees_tracks_added_after_a_cached_read(corpus):
+    features, _ = corpus
+    index = build(features[:10], lsh=WindowLSH())
+    assert 10 not in index.lsh.candidates(features[10])
+    index.add_track(track(10), features[10])
+    assert 10 in index.lsh.candidates(features[10])
+
+
+def test_lsh_concurrent_add_and_search(corpus):
+    features, _ = corpus
+    index = HummingIndex(lsh=WindowLSH())
+    errors = []
+
+    def search():
+        while len(index) < len(features):
+            try:
+                for item in index.search(features[0], 3):
+                    assert item['track_idx'] < len(features)
+            except Exception as error:  # pragma: no cover - reported below
+                errors.append(error)
+                return
+
+    searcher = threading.Thread(target=search)
+    searcher.start()
+    for position, windows in enumerate(features):
+        index.add_track(track(position), windows)
+    searcher.join()
+    assert not errors
+    for position, windows in enumerate(features):
+        assert position in index.lsh.candidates(windows)
+
+
+@pytest.mark.parametrize("options", [{}, {'prune': True, 'bound_rank': 8}])
+def test_sharded_search_matches_one_thread(corpus, options):
+    features, queries = corpus
+    single = build(features, **options)
+    sharded = build(features, workers=3, **options)
+    try:
+        for query in queries:
+            assert_same_results(sharded.search(query, 5), single.search(query, 5))
+        assert sorted(np.concatenate(sharded._shards(None)).tolist()) == list(range(len(features)))
+    finally:
+        sharded.close()
+    assert sharded._executor is None
+
+
+def test_resident_scores_match_calculate_similarity(corpus):
+    features, queries = corpus
+    index = build(features, window_budget=500)  # several blocks
+    for query in queries[:3]:
+        expected = [audio.calculate_similarity(query, windows) for windows in features]
+        np.testing.assert_allclose(index.scores(query), expected, rtol=1e-5, atol=1e-6)
+        best = index.search(query, 3)
+        np.testing.assert_allclose([1 - item['distance'] for item in best], sorted(expected, reverse=True)[:3],
+                                   rtol=1e-5, atol=1e-6)
+
+
+def test_resident_scores_of_a_subset(corpus):
+    features, queries = corpus
+    index = build(features, window_budget=500)
+    subset = np.array([2, 3, 7, 30, 59])
+    expected = [audio.calculate_similarity(queries[0], features[i]) for i in subset]
+    np.testing.assert_allclose(index.scores(queries[0], subset), expected, rtol=1e-5, atol=1e-6)
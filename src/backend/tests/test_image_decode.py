@@ -0,0 +1,62 @@
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from backend.functions import Album_Finder
+from backend.functions.metrics import track_request
+
+
+def encoded(size, fmt, seed=0):
+    rng = np.random.default_rng(seed)
+    pixels = rng.integers(0, 256, (size[1] // 8, size[0] // 8, 3), dtype=np.uint8)
+    image = Image.fromarray(pixels).resize(size, Image.Resampling.BILINEAR)
+    blob = io.BytesIO()
+    image.save(blob, format=fmt)
+    return blob.getvalue()
+
+
+def legacy_decode(content, shape=Album_Finder.IMAGE_SIZE):
+    """The PNG round trip decode_image replaced."""
+    png = Album_Finder.image_to_blob(io.BytesIO(content))
+    return Album_Finder.resize_image(Album_Finder.turn_grayscale(png), *shape)
+
+
+@pytest.mark.parametrize("size, fmt", [((64, 48), "PNG"), ((64, 48), "JPEG"), ((640, 480), "JPEG")])
+def test_decode_matches_the_png_round_trip_without_draft(size, fmt):
+    content = encoded(size, fmt)
+    np.testing.assert_array_equal(Album_Finder.decode_image(io.BytesIO(content), draft=False), legacy_decode(content))
+
+
+def test_draft_only_changes_large_jpegs():
+    small = encoded((64, 48), "JPEG")
+    np.testing.assert_array_equal(Album_Finder.decode_image(io.BytesIO(small), draft=True), legacy_decode(small))
+    large = encoded((640, 480), "JPEG")
+    drafted = Album_Finder.decode_image(io.BytesIO(large), draft=True)
+    assert not np.array_equal(drafted, legacy_decode(large))
+    np.testing.assert_allclose(drafted, legacy_decode(large), atol=8)
+
+
+def test_draft_follows_the_setting(monkeypatch):
+    large = encoded((640, 480), "JPEG")
+    monkeypatch.setattr(Album_Finder, 'DRAFT_DECODE', False)
+    np.testing.assert_array_equal(Album_Finder.decode_image(io.BytesIO(large)), legacy_decode(large))
+    monkeypatch.setattr(Album_Finder, 'DRAFT_DECODE', True)
+    assert not np.array_equal(Album_Finder.decode_image(io.BytesIO(large)), legacy_decode(large))
+
+
+def test_images_to_dataset_decodes_in_order():
+    contents = [encoded((64, 48), "PNG", seed) for seed in range(5)]
+    dataset = Album_Finder.images_to_dataset([io.BytesIO(content) for content in contents], workers=3)
+    for content, image in zip(contents, dataset):
+        np.testing.assert_array_equal(image, legacy_decode(content))
+
+
+def test_decode_pool_is_reused_and_keeps_request_spans():
+    contents = [encoded((64, 48), "PNG", seed) for seed in range(4)]
+    pool = Album_Finder.get_decode_pool(2)
+    with track_request(observe=False) as timings:
+        Album_Finder.images_to_dataset([io.BytesIO(content) for content in contents], workers=2)
+    assert Album_Finder.get_decode_pool(2) is pool
+    assert timings.stages['image_decode'][1] == len(contents)
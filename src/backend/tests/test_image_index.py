@@ -0,0 +1,154 @@
+import numpy as np
+import pytest
+
+from backend.db.local import LocalDatabase
+from backend.functions.image_index import ImageIndex, ImageModelCache
+
+COLUMNS = "id, myu, uk, projections, name, track(id, image_url, music_url, name, image_idx)"
+
+
+def make_record(rng, playlist_id, shape, n_tracks, k):
+    d = shape[0] * shape[1]
+    return {
+        'id': playlist_id,
+        'name': f"Playlist {playlist_id}",
+        'myu': rng.random(shape).tolist(),
+        'uk': np.linalg.qr(rng.standard_normal((d, k)))[0].tolist(),
+        'projections': rng.standard_normal((n_tracks, k)).tolist(),
+        'track': [{'id': f"{playlist_id}-{i}", 'name': f"Track {i}", 'image_url': f"img/{i}",
+                   'music_url': f"mid/{i}", 'image_idx': i} for i in range(n_tracks)],
+    }
+
+
+@pytest.fixture
+def records():
+    rng = np.random.default_rng(0)
+    shapes = [(8, 8), (8, 8), (6, 10), (8, 8), (6, 10)]
+    return [make_record(rng, str(p), shape, int(rng.integers(2, 7)), int(rng.integers(1, 5)))
+            for p, shape in enumerate(shapes)]
+
+
+def legacy_search(records, query_vectors, top_k):
+    """The per-playlist loop ImageIndex replaced."""
+    results = []
+    for record in records:
+        myu = np.array(record['myu'])
+        uk = np.array(record['uk'])
+        projections = np.array(record['projections'])
+        query = (query_vectors[myu.shape] - myu.reshape(-1)) @ uk
+        distances = np.linalg.norm(projections - query, axis=1)
+        for idx, distance in enumerate(distances):
+            track = record['track'][idx]
+            results.append({
+                'distance': float(distance),
+                'similarity_percentage': round(float((1 - distance / distances.max()) * 100), 2),
+                'playlist_id': record['id'],
+                'playlist_name': record['name'],
+                'track_idx': idx,
+                'image_url': track['image_url'],
+                'music_url': track['music_url'],
+                'track_name': track['name'],
+            })
+    return sorted(results, key=lambda result: result['distance'])[:top_k]
+
+
+def queries(index, seed=1):
+    rng = np.random.default_rng(seed)
+    return {shape: rng.random(shape[0] * shape[1]) for shape in index.shapes}
+
+
+@pytest.mark.parametrize("top_k", [1, 5, 100])
+def test_search_matches_the_per_playlist_loop(records, top_k):
+    index = ImageIndex.from_records(records)
+    assert sorted(index.shapes) == [(6, 10), (8, 8)]
+    for seed in range(3):
+        vectors = queries(index, seed)
+        found, expected = index.search(vectors, top_k), legacy_search(records, vectors, top_k)
+        assert [(r['playlist_id'], r['track_idx']) for r in found] == [(r['playlist_id'], r['track_idx']) for r in expected]
+        for result, legacy in zip(found, expected):
+            assert result['distance'] == pytest.approx(legacy['distance'])
+            assert result['similarity_percentage'] == pytest.approx(legacy['similarity_percentage'], abs=0.011)
+            assert {**result, 'distance': 0, 'similarity_percentage': 0} == {**legacy, 'distance': 0, 'similarity_percentage': 0}
+
+
+def test_mismatched_and_empty_playlists_are_skipped(records):
+    records[1]['projections'] = records[1]['projections'][:-1]
+    records[2]['projections'], records[2]['track'] = [], []
+    index = ImageIndex.from_records(records)
+    assert [playlist['id'] for playlist in index.playlists] == ['0', '3', '4']
+    assert len(index) == sum(len(records[p]['track']) for p in (0, 3, 4))
+
+
+def test_empty_index():
+    index = ImageIndex.from_records([])
+    assert len(index) == 0 and index.search({}, 5) == []
+
+
+def test_extending_matches_a_fresh_build(records):
+    index = ImageIndex.from_records(records[:2])
+    older = index
+    for record in records[2:]:
+        index = index.extended([record])
+    fresh = ImageIndex.from_records(records)
+    vectors = queries(fresh)
+    np.testing.assert_allclose(index.distances(vectors), fresh.distances(vectors))
+    # the older index still reads only its own rows
+    assert len(older) == sum(len(r['track']) for r in records[:2])
+    assert older.search(vectors, 100) == ImageIndex.from_records(records[:2]).search(vectors, 100)
+
+
+def test_extending_an_older_index_copies(records):
+    base = ImageIndex.from_records(records[:2])
+    first = base.extended([records[2]])
+    second = base.extended([records[3]])
+    vectors = queries(ImageIndex.from_records(records))
+    assert first.search(vectors, 100) == ImageIndex.from_records(records[:3]).search(vectors, 100)
+    assert second.search(vectors, 100) == ImageIndex.from_records(records[:2] + [records[3]]).search(vectors, 100)
+
+
+def test_without_drops_playlists(records):
+    index = ImageIndex.from_records(records).without(['1', '4'])
+    expected = ImageIndex.from_records([records[p] for p in (0, 2, 3)])
+    vectors = queries(expected)
+    assert index.search(vectors, 100) == expected.search(vectors, 100)
+    assert index.without(['missing']) is index
+
+
+@pytest.fixture
+def database(records):
+    database = LocalDatabase()
+    database.table("playlist").insert([{key: value for key, value in record.items() if key != 'track'}
+                                       for record in records[:3]]).execute()
+    database.table("track").insert([{**track, 'playlist_id': record['id']} for record in records
+                                    for track in record['track']]).execute()
+    return database
+
+
+def test_cache_loads_once_and_adds_playlists(database, records):
+    cache = ImageModelCache(COLUMNS, ttl=3600)
+    index = cache.get(database)
+    assert index.ids == {'0', '1', '2'}
+    assert cache.get(database) is index
+    assert cache.stats()['db_reads'] == 1
+
+    cache.add_playlist(records[3])
+    assert cache.get(database).ids == {'0', '1', '2', '3'}
+    assert index.ids == {'0', '1', '2'}
+    # replacing a playlist keeps one copy of it
+    cache.add_playlist(records[3])
+    assert len(cache.get(database)) == sum(len(records[p]['track']) for p in range(4))
+    assert cache.stats()['db_reads'] == 1 and cache.stats()['version'] == 3
+
+
+def test_cache_sync_fetches_new_and_drops_deleted_playlists(database, records):
+    cache = ImageModelCache(COLUMNS, ttl=3600)
+    cache.get(database)
+    database.table("playlist").delete().eq('id', '1').execute()
+    database.table("playlist").insert([{key: value for key, value in records[4].items() if key != 'track'}]).execute()
+    cache.sync(database)
+    index = cache.get(database)
+    assert index.ids == {'0', '2', '4'}
+    expected = ImageIndex.from_records([records[p] for p in (0, 2, 4)])
+    vectors = queries(expected)
+    assert index.search(vectors, 100) == expected.search(vectors, 100)
+    assert cache.stats()['syncs'] == 1 and cache.stats()['playlists'] == 3
@@ -0,0 +1,252 @@
+import asyncio
+import io
+import zipfile
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+import pytest
+from PIL import Image
+
+pytest.importorskip("fastapi")
+
+from fastapi import HTTPException  # noqa: E402
+from backend.db.local import LocalDatabase  # noqa: E402
+from backend.functions.feature_cache import FeatureCache  # noqa: E402
+from backend.functions.Album_Finder import images_to_dataset  # noqa: E402
+from backend.services import ingest  # noqa: E402
+from backend.services.storage import BucketUploader, LocalBucket  # noqa: E402
+
+
+class BrokenPool:
+    def __init__(self):
+        self.submitted = 0
+        self.shut_down = False
+
+    def submit(self, fn, *args, **kwargs):
+        self.submitted += 1
+        future = Future()
+        future.set_exception(BrokenProcessPool("a worker died"))
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        self.shut_down = True
+
+
+def fake_features(content, **feature_params):
+    return {'ATB': np.frombuffer(content, dtype=np.uint8).astype(np.float32)}, {'midi_parse': (0.01, None)}
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setattr(ingest, 'process_features_timed', fake_features)
+    monkeypatch.setattr(ingest, 'ProcessPoolExecutor', lambda max_workers, mp_context: ThreadPoolExecutor(1))
+    monkeypatch.setattr(ingest, '_feature_pool', None)
+    yield
+    ingest.shutdown_feature_pool()
+
+
+def test_broken_pool_is_replaced_and_retried_once(pool, monkeypatch):
+    broken = BrokenPool()
+    monkeypatch.setattr(ingest, '_feature_pool', broken)
+    features = asyncio.run(ingest.extract_track_features([b'ab', b'cd']))
+    assert [f['ATB'].tolist() for f in features] == [[97, 98], [99, 100]]
+    assert broken.submitted == 2 and broken.shut_down
+    assert ingest._feature_pool is not broken
+
+
+def test_cached_features_skip_the_pool(pool, monkeypatch):
+    cache = FeatureCache()
+    asyncio.run(ingest.extract_track_features([b'ab'], cache=cache))
+    broken = BrokenPool()
+    monkeypatch.setattr(ingest, '_feature_pool', broken)
+    features = asyncio.run(ingest.extract_track_features([b'ab'], cache=cache))
+    assert features[0]['ATB'].tolist() == [97, 98]
+    assert broken.submitted == 0
+    assert cache.stats()['hits'] == 1
+
+
+def run_limited(limit, chunks, headers=(), path="/upload"):
+    messages = [{'type': 'http.request', 'body': chunk, 'more_body': i < len(chunks) - 1} for i, chunk in enumerate(chunks)]
+    sent, read = [], []
+
+    async def app(scope, receive, send):
+        while True:
+            message = await receive()
+            read.append(message['body'])
+            if not message['more_body']:
+                break
+        await send({'type': 'http.response.start', 'status': 200, 'headers': []})
+        await send({'type': 'http.response.body', 'body': b''})
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {'type': 'http', 'path': path, 'headers': list(headers), 'method': 'POST'}
+    asyncio.run(ingest.UploadSizeLimit(app, max_bytes=limit)(scope, receive, send))
+    return sent[0]['status'], read
+
+
+def test_upload_limit_lets_small_bodies_through():
+    assert run_limited(10, [b'abc', b'defg'], [(b'content-length', b'7')]) == (200, [b'abc', b'defg'])
+
+
+def test_upload_limit_rejects_by_content_length_before_reading():
+    assert run_limited(10, [b'a' * 11], [(b'content-length', b'11')]) == (413, [])
+
+
+def test_upload_limit_stops_a_streamed_body():
+    with pytest.raises(HTTPException) as raised:
+        run_limited(10, [b'a' * 6, b'b' * 6, b'c' * 6])
+    assert raised.value.status_code == 413
+
+
+def test_upload_limit_only_applies_to_its_paths():
+    assert run_limited(10, [b'a' * 20], path="/query-by-image")[0] == 200
+
+
+class FlakyTracks:
+    """A LocalDatabase whose track upserts fail on the given calls, counted from 1."""
+
+    def __init__(self, database, failing=()):
+        self.database = database
+        self.failing = set(failing)
+        self.upserts = 0
+
+    def table(self, name):
+        query = self.database.table(name)
+        if name == 'track':
+            upsert = query.upsert
+
+            def flaky_upsert(rows):
+                self.upserts += 1
+                if self.upserts in self.failing:
+                    raise ConnectionError("connection reset")
+                return upsert(rows)
+            query.upsert = flaky_upsert
+        return query
+
+
+def playlist_rows(n_tracks):
+    playlist = {'id': "p1", 'name': "Playlist", 'myu': [0.0], 'uk': [[1.0]], 'projections': [[0.0]] * n_tracks}
+    tracks = [{'id': f"t{i:03d}", 'playlist_id': "p1", 'name': f"Track {i}", 'image_idx': i} for i in range(n_tracks)]
+    return playlist, tracks
+
+
+@pytest.fixture
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(ingest.time, 'sleep', lambda seconds: None)
+
+
+@pytest.mark.parametrize("n_tracks, batch_size, round_trips", [(0, 10, 1), (10, 10, 2), (25, 10, 4), (25, 100, 2)])
+def test_write_playlist_inserts_tracks_in_chunks(n_tracks, batch_size, round_trips):
+    database = FlakyTracks(LocalDatabase())
+    playlist, tracks = playlist_rows(n_tracks)
+    assert ingest.write_playlist(database, playlist, tracks, batch_size=batch_size) == round_trips
+    assert database.upserts == round_trips - 1
+    assert sorted(row['id'] for row in database.database.rows("track")) == [track['id'] for track in tracks]
+    assert [row['id'] for row in database.database.rows("playlist")] == ["p1"]
+
+
+def test_write_playlist_retries_a_failed_chunk(no_backoff):
+    database = FlakyTracks(LocalDatabase(), failing={2, 3})
+    playlist, tracks = playlist_rows(25)
+    ingest.write_playlist(database, playlist, tracks, batch_size=10, max_retries=2)
+    # the retried chunk is written once
+    assert len(database.database.rows("track")) == 25
+    assert database.upserts == 5
+
+
+def test_write_playlist_rolls_back_when_a_chunk_keeps_failing(no_backoff):
+    database = FlakyTracks(LocalDatabase(), failing={2, 3, 4})
+    playlist, tracks = playlist_rows(25)
+    with pytest.raises(ConnectionError):
+        ingest.write_playlist(database, playlist, tracks, batch_size=10, max_retries=2)
+    assert database.database.rows("track") == []
+    assert database.database.rows("playlist") == []
+
+
+class FakeUpload:
+    """The parts of a Starlette UploadFile the ingest helpers use."""
+
+    def __init__(self, filename, content, size=None):
+        self.filename = filename
+        self.file = io.BytesIO(content)
+        self.size = size
+
+    async def read(self):
+        return self.file.read()
+
+
+def cover(seed, size=(32, 24)):
+    pixels = np.random.default_rng(seed).integers(0, 256, (size[1], size[0]), dtype=np.uint8)
+    blob = io.BytesIO()
+    Image.fromarray(pixels).save(blob, format="PNG")
+    return blob.getvalue()
+
+
+def archives(n_tracks):
+    mapper = [{'pic_name': f"{i}.png", 'audio_file': f"{i}.mid", 'audio_name': f"Track {i}"} for i in range(n_tracks)]
+    images, audios = io.BytesIO(), io.BytesIO()
+    with zipfile.ZipFile(images, 'w') as images_zip, zipfile.ZipFile(audios, 'w') as audios_zip:
+        for i, item in enumerate(mapper):
+            images_zip.writestr(item['pic_name'], cover(i))
+            audios_zip.writestr(item['audio_file'], bytes([i, i + 1]))
+    return images.getvalue(), audios.getvalue(), mapper
+
+
+class CountingZip(zipfile.ZipFile):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.reads = {}
+
+    def read(self, name, pwd=None):
+        self.reads[name] = self.reads.get(name, 0) + 1
+        return super().read(name, pwd)
+
+
+def test_ingest_members_reads_every_member_once(pool, monkeypatch):
+    images, audios, mapper = archives(7)
+    images_zip, audios_zip = CountingZip(io.BytesIO(images)), CountingZip(io.BytesIO(audios))
+    with BucketUploader(LocalBucket(), max_concurrency=2) as uploader:
+        covers, stats, features, uploads = asyncio.run(
+            ingest.ingest_members(images_zip, audios_zip, mapper, "HMO/test", uploader, chunk_size=3))
+    assert stats is None
+    assert set(images_zip.reads.values()) == {1} and len(images_zip.reads) == 7
+    assert set(audios_zip.reads.values()) == {1} and len(audios_zip.reads) == 7
+    expected = images_to_dataset([io.BytesIO(cover(i)) for i in range(7)])
+    np.testing.assert_array_equal(covers, expected)
+    assert [f['ATB'].tolist() for f in features] == [[i, i + 1] for i in range(7)]
+    assert [upload['path'].split('/')[2] for upload in uploads] == ['images', 'audios'] * 7
+    assert uploader.bucket.objects[uploads[1]['path']] == bytes([0, 1])
+
+
+def test_streamed_cover_model_matches_the_kept_covers(pool, monkeypatch):
+    monkeypatch.setattr(ingest, 'stream_image_model', lambda *args: True)
+    images, audios, mapper = archives(9)
+    images_zip = zipfile.ZipFile(io.BytesIO(images))
+    with BucketUploader(LocalBucket()) as uploader:
+        covers, stats, _, _ = asyncio.run(
+            ingest.ingest_members(images_zip, zipfile.ZipFile(io.BytesIO(audios)), mapper, "HMO/test", uploader, chunk_size=4))
+        assert covers is None and stats.n == 9
+        myu, uk, projections = asyncio.run(ingest.fit_streamed_image_model(stats, images_zip, mapper, 2, chunk_size=4))
+    expected_myu, expected_uk, expected_projections = asyncio.run(
+        ingest.fit_image_model(images_to_dataset([io.BytesIO(cover(i)) for i in range(9)]), 2))
+    np.testing.assert_allclose(myu, expected_myu, rtol=1e-6)
+    np.testing.assert_allclose(np.abs(projections), np.abs(expected_projections), rtol=1e-4, atol=1e-3)
+
+
+def test_upload_size_limits():
+    with pytest.raises(HTTPException) as raised:
+        ingest.open_zip_upload(FakeUpload("images.zip", b"x" * 11), max_bytes=10)
+    assert raised.value.status_code == 413
+    images, _, _ = archives(2)
+    assert ingest.open_zip_upload(FakeUpload("images.zip", images)).namelist() == ["0.png", "1.png"]
+    assert asyncio.run(ingest.read_upload(FakeUpload("mapper.json", b"[]", size=2))) == b"[]"
+    with pytest.raises(HTTPException):
+        asyncio.run(ingest.read_upload(FakeUpload("mapper.json", b"[]" * 10, size=20), max_bytes=10))
+    with pytest.raises(HTTPException):
+        ingest.read_member(zipfile.ZipFile(io.BytesIO(images)), "0.png", max_bytes=10)
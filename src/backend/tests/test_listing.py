@@ -0,0 +1,99 @@
+import pytest
+
+from backend.db.local import LocalDatabase
+
+pytest.importorskip("fastapi")
+
+from fastapi import HTTPException  # noqa: E402
+from backend.services.listing import (  # noqa: E402
+    ListingCache, count_playlists, decode_cursor, encode_cursor, fetch_playlist_page
+)
+
+
+class FakeRequest:
+    def __init__(self, headers=None):
+        self.headers = {key.lower(): value for key, value in (headers or {}).items()}
+
+
+@pytest.fixture
+def database():
+    database = LocalDatabase()
+    # several playlists share a created_at, so the id has to break the ties
+    database.table("playlist").insert([
+        {'id': f"p{i:02d}", 'name': f"Playlist {i}", 'img_url': f"https://img/{i}",
+         'created_at': f"2024-01-{1 + i // 3:02d}T00:00:00"}
+        for i in reversed(range(25))
+    ]).execute()
+    return database
+
+
+def expected_order(database):
+    rows = sorted(database.rows("playlist"), key=lambda row: (row['created_at'], row['id']))
+    return [row['id'] for row in rows]
+
+
+def test_cursor_round_trip():
+    row = {'created_at': "2024-01-01T00:00:00", 'id': "p01"}
+    assert decode_cursor(encode_cursor(row)) == (row['created_at'], row['id'])
+    with pytest.raises(HTTPException):
+        decode_cursor("not a cursor")
+
+
+@pytest.mark.parametrize("limit", [1, 4, 7, 25, 30])
+def test_cursor_pages_cover_every_playlist_once(database, limit):
+    seen, cursor = [], None
+    while True:
+        rows, cursor = fetch_playlist_page(database, limit, cursor)
+        assert len(rows) <= limit
+        seen.extend(row['id'] for row in rows)
+        if cursor is None:
+            break
+    assert seen == expected_order(database)
+    assert set(rows[0]) == {'id', 'name', 'img_url'}
+
+
+@pytest.mark.parametrize("page", [1, 2, 3, 4])
+def test_offset_page_matches_cursor_page(database, page):
+    limit = 7
+    cursor = None
+    for _ in range(page - 1):
+        _, cursor = fetch_playlist_page(database, limit, cursor)
+    by_cursor = fetch_playlist_page(database, limit, cursor)
+    by_offset = fetch_playlist_page(database, limit, offset=(page - 1) * limit)
+    assert by_offset == by_cursor
+
+
+def test_count_playlists(database):
+    assert count_playlists(database) == 25
+
+
+def test_listing_cache_revalidates_and_invalidates(database):
+    cache = ListingCache()
+    builds = []
+
+    def build():
+        builds.append(1)
+        rows, next_cursor = fetch_playlist_page(database, 10)
+        return {'playlists': rows, 'nextCursor': next_cursor}
+
+    first = cache.respond(FakeRequest(), ("paginated", 1, 10, None), build)
+    assert first.status_code == 200
+    etag = first.headers['etag']
+
+    assert cache.respond(FakeRequest(), ("paginated", 1, 10, None), build).body == first.body
+    assert cache.respond(FakeRequest({'If-None-Match': etag}), ("paginated", 1, 10, None), build).status_code == 304
+    assert len(builds) == 1
+
+    cache.remember_cursor(10, 2, build()['nextCursor'])
+    cache.changed(added=1)
+    assert cache.page_cursor(10, 2) is None
+    refreshed = cache.respond(FakeRequest({'If-None-Match': etag}), ("paginated", 1, 10, None), build)
+    assert refreshed.status_code == 200 and refreshed.headers['etag'] != etag
+    assert cache.stats()['not_modified'] == 1
+
+
+def test_listing_cache_keeps_the_total_up_to_date(database):
+    cache = ListingCache()
+    assert cache.total(database) == 25
+    cache.changed(added=2)
+    assert cache.total(database) == 27
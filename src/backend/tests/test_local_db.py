@@ -0,0 +1,111 @@
+import pytest
+
+from backend.db.local import LocalDatabase
+
+
+@pytest.fixture
+def database():
+    database = LocalDatabase()
+    database.table("playlist").insert([
+        {'id': "p1", 'name': "Rock", 'created_at': "2024-01-02"},
+        {'id': "p2", 'name': "rock ballads", 'created_at': "2024-01-01"},
+        {'id': "p3", 'name': "Jazz", 'created_at': None},
+    ]).execute()
+    database.table("track").insert([
+        {'id': "t1", 'playlist_id': "p1", 'name': "A", 'image_idx': 1},
+        {'id': "t2", 'playlist_id': "p1", 'name': "B", 'image_idx': 0},
+        {'id': "t3", 'playlist_id': "p2", 'name': "C", 'image_idx': 0},
+    ]).execute()
+    return database
+
+
+def ids(response):
+    return [row['id'] for row in response.data]
+
+
+def test_insert_fills_id_and_created_at():
+    database = LocalDatabase()
+    row, = database.table("playlist").insert({'name': "New"}).execute().data
+    assert row['id'] and row['created_at']
+    assert database.get("playlist", row['id']) == row
+
+
+def test_duplicate_insert_writes_nothing(database):
+    with pytest.raises(ValueError):
+        database.table("track").insert([{'id': "t9", 'name': "new"}, {'id': "t1", 'name': "dup"}]).execute()
+    assert database.get("track", "t9") is None
+    assert database.get("track", "t1")['name'] == "A"
+
+
+def test_upsert_merges_into_existing_rows(database):
+    database.table("track").upsert([{'id': "t1", 'name': "A2"}, {'id': "t4", 'name': "D"}]).execute()
+    assert database.get("track", "t1") == {'id': "t1", 'playlist_id': "p1", 'name': "A2", 'image_idx': 1,
+                                           'created_at': database.get("track", "t1")['created_at']}
+    assert database.get("track", "t4")['name'] == "D"
+
+
+def test_update_and_delete_follow_filters(database):
+    updated = database.table("track").update({'name': "X"}).eq('playlist_id', "p1").execute().data
+    assert sorted(row['id'] for row in updated) == ["t1", "t2"]
+    assert database.get("track", "t3")['name'] == "C"
+    deleted = database.table("track").delete().in_('id', ["t1", "t3"]).execute().data
+    assert sorted(row['id'] for row in deleted) == ["t1", "t3"]
+    assert ids(database.table("track").select("id").execute()) == ["t2"]
+
+
+@pytest.mark.parametrize("build, expected", [
+    (lambda q: q.eq('name', "Rock"), ["p1"]),
+    (lambda q: q.neq('name', "Rock"), ["p2", "p3"]),
+    (lambda q: q.like('name', "%ock%"), ["p1", "p2"]),
+    (lambda q: q.like('name', "R_ck"), ["p1"]),
+    (lambda q: q.ilike('name', "ROCK%"), ["p1", "p2"]),
+    (lambda q: q.gt('created_at', "2024-01-01"), ["p1"]),
+    (lambda q: q.lte('created_at', "2024-01-02"), ["p1", "p2"]),
+    (lambda q: q.is_('created_at', None), ["p3"]),
+    (lambda q: q.in_('id', ["p3", "p1"]), ["p1", "p3"]),
+    (lambda q: q.or_('name.eq.Jazz,and(created_at.eq."2024-01-01",id.gt.p1)'), ["p2", "p3"]),
+    (lambda q: q.or_('id.in.(p1,"p3")'), ["p1", "p3"]),
+])
+def test_filters(database, build, expected):
+    assert ids(build(database.table("playlist").select("id")).execute()) == expected
+
+
+def test_filter_values_are_coerced_to_the_column_type(database):
+    assert ids(database.table("track").select("id").eq('image_idx', "1").execute()) == ["t1"]
+    assert ids(database.table("track").select("id").in_('image_idx', ["0"]).execute()) == ["t2", "t3"]
+
+
+def test_order_puts_nulls_last_and_sorts_by_several_columns(database):
+    assert ids(database.table("playlist").select("id").order('created_at').execute()) == ["p2", "p1", "p3"]
+    assert ids(database.table("track").select("id").order('image_idx').order('name', desc=True).execute()) == ["t3", "t2", "t1"]
+
+
+def test_range_limit_and_exact_count(database):
+    response = database.table("playlist").select("id", count='exact').order('id').range(1, 5).execute()
+    assert ids(response) == ["p2", "p3"] and response.count == 3
+    response = database.table("playlist").select("id").order('id').limit(2).execute()
+    assert ids(response) == ["p1", "p2"] and response.count is None
+
+
+def test_embedded_selects(database):
+    playlists = database.table("playlist").select("id, track(id, name)").order('id').execute().data
+    assert playlists[0] == {'id': "p1", 'track': [{'id': "t1", 'name': "A"}, {'id': "t2", 'name': "B"}]}
+    assert playlists[2]['track'] == []
+    track, = database.table("track").select("name, playlist(id, name)").eq('id', "t3").execute().data
+    assert track == {'name': "C", 'playlist': {'id': "p2", 'name': "rock ballads"}}
+
+
+def test_unsupported_select_is_rejected(database):
+    with pytest.raises(ValueError):
+        database.table("playlist").select("id, count(*)::int").execute()
+
+
+def test_file_database_persists(tmp_path):
+    path = str(tmp_path / "local.db")
+    database = LocalDatabase(path)
+    database.table("playlist").insert({'id': "p1", 'name': "Rock"}).execute()
+    database.table("playlist").update({'name': "Pop"}).eq('id', "p1").execute()
+    database.table("playlist").insert({'id': "p2", 'name': "Jazz"}).execute()
+    database.table("playlist").delete().eq('id', "p2").execute()
+    reopened = LocalDatabase(path)
+    assert [(row['id'], row['name']) for row in reopened.rows("playlist")] == [("p1", "Pop")]
@@ -0,0 +1,104 @@
+import asyncio
+import re
+
+import pytest
+
+from backend.functions import metrics as metrics_module
+from backend.functions.metrics import MetricsRegistry, RequestTimings, count, record, span, timed, track_request
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    registry = MetricsRegistry()
+    monkeypatch.setattr(metrics_module, 'metrics', registry)
+    return registry
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = MetricsRegistry()
+    for value in (0.0004, 0.001, 0.003, 100.0):
+        registry.observe('stage_seconds', value, stage="svd")
+    lines = registry.render().splitlines()
+    assert lines[:2] == ["# HELP hmo_stage_seconds Time spent in each processing stage.",
+                         "# TYPE hmo_stage_seconds histogram"]
+    assert 'hmo_stage_seconds_bucket{stage="svd",le="0.0005"} 1' in lines
+    # a value on a bound falls in that bucket
+    assert 'hmo_stage_seconds_bucket{stage="svd",le="0.001"} 2' in lines
+    assert 'hmo_stage_seconds_bucket{stage="svd",le="0.005"} 3' in lines
+    assert 'hmo_stage_seconds_bucket{stage="svd",le="60.0"} 3' in lines
+    assert 'hmo_stage_seconds_bucket{stage="svd",le="+Inf"} 4' in lines
+    assert 'hmo_stage_seconds_count{stage="svd"} 4' in lines
+    sum_line = next(line for line in lines if line.startswith('hmo_stage_seconds_sum'))
+    assert float(sum_line.split()[-1]) == pytest.approx(100.0044)
+
+
+def test_counters_and_label_escaping():
+    registry = MetricsRegistry()
+    registry.inc('tracks_scored_total', 5, index='humming')
+    registry.inc('tracks_scored_total', 2, index='humming')
+    registry.inc('database_rows_total', 1.5, table='a "b"\\c\n')
+    text = registry.render()
+    assert 'hmo_tracks_scored_total{index="humming"} 7\n' in text
+    assert 'hmo_database_rows_total{table="a \\"b\\"\\\\c\\n"} 1.5\n' in text
+    assert text.count('# TYPE hmo_tracks_scored_total counter') == 1
+    # one header per metric, every sample line parses
+    for line in text.splitlines():
+        assert line.startswith('#') or re.fullmatch(r'hmo_\w+(\{.*\})? \S+', line)
+
+
+def test_reset():
+    registry = MetricsRegistry()
+    registry.inc('tracks_scored_total')
+    registry.reset()
+    assert registry.render() == '\n'
+
+
+def test_spans_outside_a_request_only_go_to_the_histograms(registry):
+    with span("svd"):
+        pass
+    count('tracks_scored_total', 3, index='image')
+    text = registry.render()
+    assert 'hmo_stage_seconds_count{stage="svd"} 1' in text
+    assert 'hmo_tracks_scored_total{index="image"} 3' in text
+
+
+def test_request_timings_collect_spans(registry):
+    @timed("decode")
+    def decode():
+        return 1
+
+    with track_request() as timings:
+        decode()
+        decode()
+        record("midi_parse", 0.25)
+    assert list(timings.stages) == ["decode", "midi_parse"]
+    assert timings.stages["decode"][1] == 2
+    assert timings.stages["midi_parse"] == (0.25, 1)
+    assert 'hmo_stage_seconds_count{stage="decode"} 2' in registry.render()
+
+
+def test_unobserved_requests_stay_out_of_the_histograms(registry):
+    with track_request(observe=False) as timings:
+        record("svd", 0.1)
+    assert timings.stages == {"svd": (0.1, 1)}
+    assert 'svd' not in registry.render()
+
+
+def test_threads_started_with_to_thread_report_to_the_request(registry):
+    async def handle():
+        with track_request() as timings:
+            await asyncio.gather(*(asyncio.to_thread(record, "upload", 0.5) for _ in range(3)))
+        return timings
+
+    assert asyncio.run(handle()).stages == {"upload": (1.5, 3)}
+    # the request's timings do not leak into what runs after it
+    assert metrics_module._request_timings.get() is None
+
+
+def test_server_timing_header():
+    timings = RequestTimings()
+    timings.add("midi_parse", 0.0125)
+    timings.add("svd", 0.001)
+    timings.add("svd", 0.002)
+    assert timings.server_timing(0.5) == 'midi_parse;dur=12.500, svd;dur=3.000;desc="2 calls", total;dur=500.000'
+    assert RequestTimings().server_timing() == ''
@@ -0,0 +1,21 @@
+import io
+
+import pytest
+
+from backend.functions import audio
+
+pytest.importorskip("mido")
+
+from backend.benchmarks.bench_midi_decode import mido_pitch_array_with_tempo  # noqa: E402
+from backend.benchmarks.corpus import make_midi  # noqa: E402
+
+
+@pytest.mark.parametrize("n_notes, n_channels", [(0, 1), (50, 1), (2_000, 1), (3_000, 4)])
+def test_decoder_matches_mido(n_notes, n_channels):
+    blob = make_midi(n_notes, n_channels, seed=n_notes + n_channels)
+    assert audio.midi_to_pitch_array_with_tempo(blob) == mido_pitch_array_with_tempo(blob)
+
+
+def test_decoder_accepts_file_objects():
+    blob = make_midi(200, 2, seed=3)
+    assert audio.midi_to_pitch_array_with_tempo(io.BytesIO(blob)) == audio.midi_to_pitch_array_with_tempo(blob)
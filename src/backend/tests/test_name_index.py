@@ -0,0 +1,95 @@
+import pytest
+
+from backend.db.local import LocalDatabase
+from backend.functions.name_index import NameIndex, normalize_name, trigrams
+
+PLAYLISTS = [
+    {'id': 1, 'name': "Café Del Mar", 'img_url': "a"},
+    {'id': 2, 'name': "Lo-fi Beats", 'img_url': "b"},
+    {'id': 3, 'name': "東京ガールズ", 'img_url': "c"},
+    {'id': 4, 'name': "Кино", 'img_url': "d"},
+    {'id': 5, 'name': "방탄소년단 모음", 'img_url': "e"},
+    {'id': 6, 'name': "La la la", 'img_url': "f"},
+    {'id': 7, 'name': "Lalala", 'img_url': "g"},
+    {'id': 8, 'name': "Anime", 'img_url': "h"},
+]
+TRACKS = [
+    {'name': "Blue Bird", 'playlist_id': 8},
+    {'name': "Группа крови", 'playlist_id': 4},
+    {'name': "Café Racer", 'playlist_id': 2},
+]
+
+
+@pytest.fixture
+def index():
+    index = NameIndex()
+    index.load(PLAYLISTS, TRACKS)
+    return index
+
+
+def ids(results):
+    return [playlist['id'] for playlist in results]
+
+
+def test_normalize_name():
+    assert normalize_name("  Café\tDEL   Mar ") == "cafe del mar"
+    assert normalize_name("Кино") == "кино"
+    assert normalize_name("東京") == "東京"
+    assert normalize_name("방탄") == "방탄"
+    assert normalize_name("ｆｕｌｌ ｗｉｄｔｈ") == "full width"
+
+
+def test_trigrams_mark_word_starts():
+    assert {"  a", " ab", "abc", "bc "} <= trigrams("abc")
+
+
+def test_exact_prefix_and_substring(index):
+    assert ids(index.search("cafe del mar"))[0] == 1
+    assert ids(index.search("lo-f")) == [2]
+    assert ids(index.search("del")) == [1]
+    # a track name finds its playlist too
+    assert set(ids(index.search("cafe"))) == {1, 2}
+    assert ids(index.search("blue bird")) == [8]
+
+
+def test_repeated_trigrams(index):
+    assert ids(index.search("lalala"))[0] == 7
+    assert ids(index.search("la la"))[0] == 6
+    assert set(ids(index.search("la"))) == {6, 7}
+
+
+def test_typos(index):
+    assert ids(index.search("cafe del mra"))[0] == 1
+    assert ids(index.search("lofi beat"))[0] == 2
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("東京", 3), ("ガールズ", 3), ("東京ガールズ", 3), ("кино", 4), ("КИНО", 4), ("крови", 4), ("방탄소년단", 5), ("모음", 5),
+])
+def test_non_latin_names(index, query, expected):
+    assert ids(index.search(query)) == [expected]
+
+
+def test_no_match_and_empty_query(index):
+    assert index.search("zzzzzz") == []
+    assert index.search("   ") == []
+
+
+def test_limit(index):
+    assert len(index.search("a", limit=2)) == 2
+
+
+def test_add_playlist_is_searchable(index):
+    index.add_playlist({'id': 9, 'name': "Новая музыка", 'img_url': "i"}, ["Песня"])
+    assert ids(index.search("новая")) == [9]
+    assert ids(index.search("песня")) == [9]
+    assert len(index) == len(PLAYLISTS) + 1
+
+
+def test_refresh_from_database():
+    database = LocalDatabase()
+    database.table("playlist").insert([{'id': str(p['id']), 'name': p['name'], 'img_url': p['img_url']} for p in PLAYLISTS]).execute()
+    database.table("track").insert([{**track, 'playlist_id': str(track['playlist_id'])} for track in TRACKS]).execute()
+    index = NameIndex()
+    assert index.refresh(database, page_size=2) == len(PLAYLISTS)
+    assert ids(index.search("крови")) == ['4']
@@ -0,0 +1,99 @@
+import numpy as np
+import pytest
+
+from backend.functions import Album_Finder
+from backend.functions.Album_Finder import (
+    SVD_SOLVERS, StreamingPCA, center_dataset, choose_svd_solver, singular_value_decomposition
+)
+
+
+def low_rank_data(n_samples, n_features, seed=0, noise=1e-3):
+    """Centered data with well separated singular values, so every solver finds the same basis."""
+    rng = np.random.default_rng(seed)
+    rank = min(8, n_samples, n_features)
+    left = np.linalg.qr(rng.standard_normal((n_samples, rank)))[0]
+    right = np.linalg.qr(rng.standard_normal((n_features, rank)))[0]
+    data = left * (100.0 / 2.0 ** np.arange(rank)) @ right.T + noise * rng.standard_normal((n_samples, n_features))
+    return data - data.mean(axis=0)
+
+
+@pytest.mark.parametrize("solver", sorted(SVD_SOLVERS))
+@pytest.mark.parametrize("shape", [(30, 400), (400, 30), (200, 200)])
+def test_solvers_match_the_full_svd(solver, shape):
+    data = low_rank_data(*shape)
+    expected_z, expected_uk, expected_s = singular_value_decomposition(data, 4, solver="full")
+    z, uk, s = singular_value_decomposition(data, 4, solver=solver)
+    assert uk.shape == expected_uk.shape
+    np.testing.assert_allclose(s, expected_s, rtol=1e-6)
+    # components are unique up to sign
+    np.testing.assert_allclose(np.abs(uk.T @ expected_uk), np.eye(4), atol=1e-6)
+    np.testing.assert_allclose(np.abs(z), np.abs(expected_z), rtol=1e-5, atol=1e-6)
+
+
+def test_gram_solver_handles_rank_deficient_data():
+    data = low_rank_data(5, 400)
+    uk, s = SVD_SOLVERS["gram"](data, 8)
+    assert np.isfinite(uk).all() and np.isfinite(s).all()
+    # only as many directions as samples minus the mean
+    assert (s > s[0] * 1e-6).sum() == 4
+
+
+@pytest.mark.parametrize("shape, k, expected", [
+    ((20, 400), 2, "full"),
+    ((400, 40), 2, "full"),
+    ((200, 6400), 2, "gram"),
+    ((5000, 4096), 16, "randomized"),
+    ((5000, 4096), 1000, "gram"),
+    ((500, 1000), 10, "gram"),
+    ((700, 1000), 10, "randomized"),
+])
+def test_choose_svd_solver(shape, k, expected):
+    assert choose_svd_solver(*shape, k) == expected
+
+
+def test_auto_solver_fits_like_the_full_svd():
+    data = low_rank_data(100, 1600)
+    z, uk, s = singular_value_decomposition(data, Album_Finder.NUM_COMPONENTS)
+    expected_z, _, expected_s = singular_value_decomposition(data, Album_Finder.NUM_COMPONENTS, solver="full")
+    np.testing.assert_allclose(s, expected_s, rtol=1e-6)
+    np.testing.assert_allclose(np.abs(z), np.abs(expected_z), rtol=1e-5, atol=1e-6)
+
+
+def covers(n, shape=(6, 5), seed=0, offset=0.0):
+    rng = np.random.default_rng(seed)
+    basis = rng.standard_normal((3, shape[0] * shape[1]))
+    images = offset + 128 + rng.standard_normal((n, 3)) * [40, 20, 10] @ basis + rng.standard_normal((n, basis.shape[1]))
+    return images.reshape((n,) + shape)
+
+
+@pytest.mark.parametrize("chunk_sizes", [[50], [1] * 50, [7, 0, 13, 30]])
+def test_streaming_pca_matches_the_batch_fit(chunk_sizes):
+    dataset = covers(sum(chunk_sizes))
+    stats = StreamingPCA(dataset.shape[1:])
+    start = 0
+    for size in chunk_sizes:
+        stats.update(dataset[start:start + size])
+        start += size
+    myu, centered = center_dataset(dataset)
+    expected_z, expected_uk, expected_s = singular_value_decomposition(centered, 3, solver="full")
+    streamed_myu, uk, s = stats.components(3)
+    assert stats.n == len(dataset)
+    np.testing.assert_allclose(streamed_myu, myu, rtol=1e-10)
+    np.testing.assert_allclose(stats.scatter, centered.T @ centered, rtol=1e-9, atol=1e-6)
+    np.testing.assert_allclose(s, expected_s, rtol=1e-9)
+    np.testing.assert_allclose(np.abs(stats.project(dataset, uk)), np.abs(expected_z), rtol=1e-6, atol=1e-8)
+
+
+def test_streaming_pca_is_stable_far_from_zero():
+    dataset = covers(200, offset=1e7)
+    stats = StreamingPCA(dataset.shape[1:])
+    for chunk in np.array_split(dataset, 9):
+        stats.update(chunk)
+    _, centered = center_dataset(dataset - 1e7)
+    np.testing.assert_allclose(stats.components(3)[2], singular_value_decomposition(centered, 3, solver="full")[2], rtol=1e-6)
+
+
+def test_streaming_pca_caps_the_components():
+    stats = StreamingPCA((2, 2)).update(covers(2, shape=(2, 2)))
+    _, uk, s = stats.components(10)
+    assert uk.shape == (4, 2) and len(s) == 2
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from backend.functions import audio
+from backend.benchmarks.bench_humming_lsh import noisy_excerpt, random_walk
+
+
+def legacy_calculate_similarity(array1, array2, atb_weight=0.6, rtb_weight=0.2, ftb_weight=0.2):
+    """The per-window loop calculate_similarity replaced."""
+    highest_similarity = 0.0
+    for j in range(int(len(array2) - len(array1) / 2)):
+        total_similarity, count = 0.0, 0
+        for i in range(len(array1)):
+            if j + i == len(array2):
+                break
+            count += 1
+            total_similarity += (
+                atb_weight * audio.cosine_similarity(array1[i]['ATB'], array2[j + i]['ATB']) +
+                rtb_weight * audio.cosine_similarity(array1[i]['RTB'], array2[j + i]['RTB']) +
+                ftb_weight * audio.cosine_similarity(array1[i]['FTB'], array2[j + i]['FTB'])
+            )
+        if count:
+            highest_similarity = max(highest_similarity, total_similarity / count)
+    return highest_similarity
+
+
+def windows(melody):
+    return audio.features_to_windows(audio.extract_features(melody))
+
+
+@pytest.mark.parametrize("query_notes, track_notes", [(120, 1_500), (200, 200), (400, 150), (30, 500)])
+def test_calculate_similarity_matches_per_window_loop(query_notes, track_notes):
+    rng = np.random.default_rng(query_notes + track_notes)
+    track_melody = random_walk(rng, track_notes)
+    query = windows(noisy_excerpt(rng, track_melody, query_notes))
+    track = windows(track_melody)
+    expected = legacy_calculate_similarity(query, track)
+    assert audio.calculate_similarity(query, track) == pytest.approx(expected, abs=1e-5)
+    # the resident index passes the track as a normalize_features matrix
+    normalized = audio.normalize_features(audio.load_features(track))
+    assert audio.calculate_similarity(query, normalized) == pytest.approx(expected, abs=1e-5)
+
+
+def test_calculate_similarity_with_custom_weights():
+    rng = np.random.default_rng(5)
+    query, track = windows(random_walk(rng, 150)), windows(random_walk(rng, 600))
+    expected = legacy_calculate_similarity(query, track, 0.2, 0.5, 0.3)
+    assert audio.calculate_similarity(query, track, 0.2, 0.5, 0.3) == pytest.approx(expected, abs=1e-5)
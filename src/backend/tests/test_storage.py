@@ -0,0 +1,84 @@
+import asyncio
+
+import pytest
+
+from backend.functions.metrics import track_request
+from backend.services import storage
+from backend.services.storage import BucketUploader, LocalBucket, summarize_uploads
+
+
+class FlakyBucket(LocalBucket):
+    """A LocalBucket whose uploads of a path raise error for its first failures[path] attempts."""
+
+    def __init__(self, failures, error=ConnectionError):
+        super().__init__()
+        self.failures = dict(failures)
+        self.error = error
+        self.attempts = {}
+
+    def _write(self, path, data):
+        self.attempts[path] = self.attempts.get(path, 0) + 1
+        if self.attempts[path] <= self.failures.get(path, 0):
+            raise self.error(f"upload of {path} failed")
+        super()._write(path, data)
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    delays = []
+    monkeypatch.setattr(storage.time, 'sleep', delays.append)
+    return delays
+
+
+def test_upload_returns_the_public_url():
+    with BucketUploader(LocalBucket(base_url="http://files/")) as uploader:
+        result = uploader.upload("a/b.png", b"png", "image/png")
+    assert result['url'] == "http://files/a/b.png"
+    assert result['bytes'] == 3 and result['attempts'] == 1
+    assert uploader.bucket.objects == {"a/b.png": b"png"}
+
+
+def test_transient_errors_are_retried_with_backoff(sleeps):
+    bucket = FlakyBucket({"a": 2})
+    with BucketUploader(bucket, max_retries=3, backoff=0.5) as uploader:
+        result = uploader.upload("a", b"data", "audio/midi")
+    assert result['attempts'] == 3
+    assert sleeps == [0.5, 1.0]
+    assert bucket.objects == {"a": b"data"}
+
+
+def test_upload_gives_up_after_max_retries(sleeps):
+    bucket = FlakyBucket({"a": 5}, error=TimeoutError)
+    with BucketUploader(bucket, max_retries=2) as uploader:
+        with pytest.raises(TimeoutError):
+            uploader.upload("a", b"data", "audio/midi")
+    assert bucket.attempts == {"a": 3}
+
+
+def test_other_errors_are_not_retried(sleeps):
+    bucket = FlakyBucket({"a": 1}, error=PermissionError)
+    with BucketUploader(bucket) as uploader:
+        with pytest.raises(PermissionError):
+            uploader.upload("a", b"data", "audio/midi")
+    assert bucket.attempts == {"a": 1} and sleeps == []
+
+
+def test_upload_many_keeps_the_order_and_the_request_spans(sleeps):
+    bucket = FlakyBucket({"p2": 1})
+    items = [(f"p{i}", bytes([i]) * (i + 1), "image/png") for i in range(6)]
+
+    async def upload():
+        with track_request(observe=False) as timings:
+            results = await uploader.upload_many(items)
+        return results, timings
+
+    with BucketUploader(bucket, max_concurrency=3) as uploader:
+        results, timings = asyncio.run(upload())
+    assert [result['path'] for result in results] == [path for path, _, _ in items]
+    assert timings.stages['bucket_upload'][1] == 7
+    summary = summarize_uploads(results)
+    assert summary['objects'] == 6 and summary['bytes'] == 21 and summary['retries'] == 1
+
+
+def test_summarize_nothing():
+    assert summarize_uploads([])['slowest_seconds'] == 0.0
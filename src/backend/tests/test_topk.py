@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+from backend.functions.topk import top_k_indices, top_k_items
+
+
+@pytest.mark.parametrize("largest", [True, False])
+@pytest.mark.parametrize("k", [0, 1, 5, 50, 200, 1_000])
+def test_top_k_indices_matches_stable_argsort(k, largest):
+    rng = np.random.default_rng(k)
+    # few distinct values, so many ties straddle the kth score
+    scores = rng.integers(0, 20, 200).astype(np.float64)
+    expected = np.argsort(-scores if largest else scores, kind='stable')[:k]
+    np.testing.assert_array_equal(top_k_indices(scores, k, largest), expected)
+
+
+def test_top_k_indices_of_nothing():
+    assert len(top_k_indices(np.zeros(0), 5)) == 0
+
+
+@pytest.mark.parametrize("largest", [True, False])
+def test_top_k_items_matches_sorted(largest):
+    items = [{'id': i, 'score': i % 7} for i in range(50)]
+    key = lambda item: item['score']  # noqa: E731
+    assert top_k_items(items, 10, key, largest) == sorted(items, key=key, reverse=largest)[:10]
+    assert top_k_items(items, None, key, largest) == sorted(items, key=key, reverse=largest)
+
+
+def test_audio_query_reads_midi_paths_and_keeps_the_top_k(tmp_path):
+    pytest.importorskip("mido")
+    from backend.benchmarks.corpus import make_midi
+    from backend.functions import audio_functionality
+
+    for seed in range(6):
+        (tmp_path / f"{seed}.mid").write_bytes(make_midi(300, seed=seed))
+    (tmp_path / "notes.txt").write_text("not a MIDI file")
+    database = audio_functionality.build_audio_database(str(tmp_path))
+    assert sorted(entry['name'] for entry in database) == [f"{seed}.mid" for seed in range(6)]
+
+    query = str(tmp_path / "3.mid")
+    everything = audio_functionality.audio_query(database, query)
+    assert everything[0]['name'] == "3.mid"
+    assert [r['similarity'] for r in everything] == sorted((r['similarity'] for r in everything), reverse=True)
+    assert audio_functionality.audio_query(database, query, top_k=2) == everything[:2]